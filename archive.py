@@ -0,0 +1,225 @@
+"""Single-file byte-range storage: segments served as ranges of mapped media files."""
+
+import logging
+import mmap
+import os
+from typing import Dict, List, Optional, Tuple
+
+from anyio import to_thread
+
+from manifest import ManifestVersion
+from responses import RawHeaders, segment_headers
+from segment_cache import FileVersion, file_version
+
+
+logger = logging.getLogger(__name__)
+
+
+class MappedMediaFile:
+    """An append-only media file kept open and memory-mapped.
+    
+    The mapping covers the file as it was at the last ``refresh()``; bytes
+    the packager appends later are mapped by the next refresh, which costs
+    one ``fstat()`` and, if the file grew, a new mapping. Mappings already
+    handed to responses stay valid until those responses are done. The file
+    must only ever be appended to: reading a mapped page of a file that was
+    truncated under it kills the process with SIGBUS.
+    """
+    
+    def __init__(self, path: str):
+        """Open and map a media file (blocking).
+        
+        Args:
+            path: Absolute path of the media file
+        
+        Raises:
+            OSError: If the file cannot be opened or mapped
+        """
+        self.path = path
+        self.size = 0
+        self.view = memoryview(b"")
+        self.headers: RawHeaders = []
+        self.version: FileVersion = (0, 0, 0)
+        self.remaps = 0
+        self._mtime_ns: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._fd = os.open(path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+        try:
+            self.refresh()
+        except (OSError, ValueError):
+            os.close(self._fd)
+            raise
+    
+    def refresh(self) -> int:
+        """Map bytes appended since the last refresh.
+        
+        Returns:
+            Size of the file now mapped
+        """
+        st = os.fstat(self._fd)
+        if st.st_size == self.size and st.st_mtime_ns == self._mtime_ns:
+            return self.size
+        if st.st_size > self.size:
+            if self._map is not None:
+                self.remaps += 1
+            self._map = mmap.mmap(self._fd, st.st_size, access=mmap.ACCESS_READ)
+            self.view = memoryview(self._map)
+        elif st.st_size < self.size:
+            logger.warning("Media file %s shrank from %d to %d bytes", self.path, self.size, st.st_size)
+            self.view = self.view[:st.st_size]
+        self.size = st.st_size
+        self._mtime_ns = st.st_mtime_ns
+        self.version = file_version(st)
+        self.headers = segment_headers(self.size, st.st_mtime_ns)
+        return self.size
+    
+    def advise(self, ranges: List[Tuple[int, int]]) -> None:
+        """Ask the kernel to read mapped ranges ahead of the first request for them.
+        
+        Args:
+            ranges: Half-open (start, end) ranges of the file
+        """
+        if self._map is None or not hasattr(mmap, "MADV_WILLNEED"):
+            return
+        for start, end in ranges:
+            end = min(end, self.size)
+            # madvise() wants a page-aligned start
+            start -= start % mmap.PAGESIZE
+            if start < end:
+                self._map.madvise(mmap.MADV_WILLNEED, start, end - start)
+    
+    def close(self) -> None:
+        """Close the file; the mapping is unmapped once no response uses it."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._map = None
+        self.view = memoryview(b"")
+
+
+class MediaArchive:
+    """The byte-range media files of one stream, kept open and mapped.
+    
+    A playlist using EXT-X-BYTERANGE lists its segments as ranges of one
+    large append-only media file (or a few). Each new playlist version
+    updates the stream's index of those ranges; files the index lists are
+    opened and mapped on their first request and answered as slices of
+    the mapping from then on, without opening, reading or statting the
+    file per request. A file is remapped only when the playlist lists a
+    range beyond what is mapped, and closed once the playlist stops
+    listing it. Newly listed ranges of mapped files are advised to the
+    kernel so the first request finds them in memory.
+    
+    Segment URLs stay the media file's own path, so a token for
+    ``/live/media.ts`` covers every range of it.
+    """
+    
+    def __init__(self, root: str):
+        """Initialize an empty archive.
+        
+        Args:
+            root: Directory the playlist's media file URIs are relative to
+        """
+        self.root = root
+        # Ranges the current playlist lists, by base name of the media file
+        self.ranges: Dict[str, List[Tuple[int, int]]] = {}
+        self.files: Dict[str, MappedMediaFile] = {}
+        self.hits = 0
+        self.opened = 0
+        self.errors = 0
+        self._retired_remaps = 0
+    
+    def lists(self, name: str) -> bool:
+        """Check whether the current playlist lists ranges of a file (base name)."""
+        return name in self.ranges
+    
+    def update(self, manifest: ManifestVersion) -> None:
+        """Take the byte ranges of a new playlist version.
+        
+        Args:
+            manifest: The new version of the stream's playlist
+        """
+        previous, self.ranges = self.ranges, manifest.byteranges
+        for name in list(self.files):
+            if name not in self.ranges:
+                self._close(name)
+        for name, mapped in self.files.items():
+            listed = self.ranges[name]
+            if _end(listed) > mapped.size:
+                mapped.refresh()
+            known = previous.get(name, [])
+            mapped.advise([byte_range for byte_range in listed if byte_range not in known])
+    
+    async def get(self, name: str) -> Optional[MappedMediaFile]:
+        """Return a listed media file, mapped at least up to its last listed range.
+        
+        Args:
+            name: Base name of the media file
+        
+        Returns:
+            MappedMediaFile, or None if the playlist does not list the file
+            or it cannot be opened
+        """
+        listed = self.ranges.get(name)
+        if listed is None:
+            return None
+        mapped = self.files.get(name)
+        if mapped is None:
+            path = os.path.join(self.root, name)
+            try:
+                opened = await to_thread.run_sync(MappedMediaFile, path)
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                logger.debug("Cannot map %s: %s", path, e)
+                return None
+            mapped = self.files.get(name)
+            if mapped is not None or name not in self.ranges:
+                # Another request mapped it meanwhile, or the playlist rolled on
+                opened.close()
+                if mapped is None:
+                    return None
+            else:
+                self.opened += 1
+                mapped = self.files[name] = opened
+            listed = self.ranges[name]
+        if _end(listed) > mapped.size:
+            mapped.refresh()
+        self.hits += 1
+        return mapped
+    
+    def invalidate(self, path: str) -> None:
+        """Close a media file that was removed or replaced; it is remapped on its next request."""
+        name = os.path.basename(path)
+        if name in self.files and os.path.join(self.root, name) == path:
+            self._close(name)
+    
+    def close(self) -> None:
+        """Close every mapped file."""
+        for name in list(self.files):
+            self._close(name)
+    
+    def stats(self) -> dict:
+        """Return archive counters.
+        
+        Returns:
+            dict with files (media files listed), mapped (files open),
+            mapped_bytes, hits, opened, remaps and errors
+        """
+        return {
+            "files": len(self.ranges),
+            "mapped": len(self.files),
+            "mapped_bytes": sum(mapped.size for mapped in self.files.values()),
+            "hits": self.hits,
+            "opened": self.opened,
+            "remaps": self._retired_remaps + sum(mapped.remaps for mapped in self.files.values()),
+            "errors": self.errors,
+        }
+    
+    def _close(self, name: str) -> None:
+        mapped = self.files.pop(name)
+        self._retired_remaps += mapped.remaps
+        mapped.close()
+
+
+def _end(ranges: List[Tuple[int, int]]) -> int:
+    return max(end for _, end in ranges)
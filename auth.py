@@ -1,10 +1,20 @@
 """Token validation module for HLS streaming authentication."""
 
 import base64
+import binascii
 import hashlib
 import hmac
-import time
-from typing import Optional
+import json
+import logging
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from clock import CoarseClock
+
+
+logger = logging.getLogger(__name__)
 
 
 class ValidationResult:
@@ -16,71 +26,539 @@ class ValidationResult:
         self.status_code = status_code
 
 
+VALID = ValidationResult(True)
+
+# Prefix-scoped tokens sign "prefix:" + scope + exp. Exact-path messages always
+# start with "/", so a signature for one kind can never verify as the other.
+PREFIX_MARKER = "prefix:"
+
+# A SHA-256 digest is 43 unpadded base64url characters; the last one carries
+# only four data bits, so its two low bits must be zero for a canonical encoding.
+SIGNATURE_LENGTH = 43
+_CANONICAL_LAST_CHARS = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"[::4]
+)
+_URLSAFE_TO_STANDARD = bytes.maketrans(b"-_", b"+/")
+
+# RFC 2104 ipad/opad applied bytewise to the padded key
+_IPAD = bytes(x ^ 0x36 for x in range(256))
+_OPAD = bytes(x ^ 0x5C for x in range(256))
+
+
+def keyed_sha256(key: bytes) -> Tuple["hashlib._Hash", "hashlib._Hash"]:
+    """Build the inner and outer HMAC-SHA256 states for a key (RFC 2104).
+    
+    The key padding and both pad blocks are absorbed once; a signature then
+    only costs two ``copy()`` calls and the message and digest updates.
+    
+    Args:
+        key: HMAC signing key
+        
+    Returns:
+        Tuple of (inner, outer) SHA-256 objects to be copied per message
+    """
+    block_size = hashlib.sha256().block_size
+    if len(key) > block_size:
+        key = hashlib.sha256(key).digest()
+    key = key.ljust(block_size, b"\0")
+    inner = hashlib.sha256(key.translate(_IPAD))
+    outer = hashlib.sha256(key.translate(_OPAD))
+    return inner, outer
+
+
+def decode_signature(sig: str) -> Optional[bytes]:
+    """Decode an unpadded base64url signature to the raw digest.
+    
+    Args:
+        sig: Base64URL encoded signature (unpadded)
+        
+    Returns:
+        The 32-byte digest, or None if sig is not a canonical encoding
+    """
+    if len(sig) != SIGNATURE_LENGTH or sig[-1] not in _CANONICAL_LAST_CHARS:
+        return None
+    try:
+        encoded = (sig + "=").encode('ascii').translate(_URLSAFE_TO_STANDARD)
+        return binascii.a2b_base64(encoded, strict_mode=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class VerifiedTokenCache:
+    """Bounded cache of tokens that already passed signature verification.
+    
+    Entries are keyed by the raw (path, exp, sig, kid) tuple so a repeat check
+    is a single dict lookup. Each entry lives until its own ``exp``: a hashed timing
+    wheel with one slot per second drops entries as their second passes, and
+    the oldest entry is evicted when ``max_entries`` is reached.
+    """
+    
+    def __init__(self, max_entries: int = 4096, wheel_slots: int = 64):
+        """Initialize an empty cache.
+        
+        Args:
+            max_entries: Maximum number of cached tokens
+            wheel_slots: Number of one-second slots in the timing wheel
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Tuple, int] = {}
+        self._wheel: List[Set[Tuple]] = [set() for _ in range(wheel_slots)]
+        self._cursor: Optional[int] = None
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def contains(self, key: Tuple, now: int) -> bool:
+        """Check whether a token is cached, counting a hit or a miss.
+        
+        Args:
+            key: Cache key, normally (path, exp, sig, kid)
+            now: Current Unix time in whole seconds
+            
+        Returns:
+            True if the token was verified before and has not expired
+        """
+        self._advance(now)
+        if key in self._entries:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+    
+    def add(self, key: Tuple, exp: int, now: int) -> None:
+        """Remember a verified token until its expiration.
+        
+        Args:
+            key: Cache key, normally (path, exp, sig, kid)
+            exp: Expiration timestamp of the token
+            now: Current Unix time in whole seconds
+        """
+        if self.max_entries <= 0 or exp < now:
+            return
+        self._advance(now)
+        if key in self._entries:
+            return
+        if len(self._entries) >= self.max_entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+        self._entries[key] = exp
+        self._wheel[exp % len(self._wheel)].add(key)
+    
+    def clear(self) -> None:
+        """Drop every cached token."""
+        self._entries.clear()
+        for slot in self._wheel:
+            slot.clear()
+    
+    def stats(self) -> dict:
+        """Return cache counters.
+        
+        Returns:
+            dict with hits, misses, size and max_entries
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+    
+    def _discard(self, key: Tuple) -> None:
+        exp = self._entries.pop(key)
+        self._wheel[exp % len(self._wheel)].discard(key)
+    
+    def _advance(self, now: int) -> None:
+        """Expire entries in every slot the wheel has passed since the last call."""
+        if self._cursor is None:
+            self._cursor = now
+            return
+        if now <= self._cursor:
+            return
+        slots = len(self._wheel)
+        # A slot holds every exp congruent to it, so entries due in a later
+        # revolution stay put until the wheel comes round again.
+        for second in range(max(self._cursor, now - slots), now):
+            slot = self._wheel[second % slots]
+            if not slot:
+                continue
+            expired = [key for key in slot if self._entries[key] < now]
+            for key in expired:
+                self._discard(key)
+        self._cursor = now
+
+
 class TokenValidator:
     """Validates HMAC-SHA256 signed tokens for HLS stream access."""
     
-    def __init__(self, signing_secret: str):
+    def __init__(
+        self,
+        signing_secret: str,
+        cache_size: int = 4096,
+        allow_prefix_tokens: bool = False,
+        keys: Optional[Dict[str, str]] = None,
+        clock: Optional[CoarseClock] = None,
+    ):
         """Initialize validator with signing secret.
         
         Args:
-            signing_secret: HMAC signing key
+            signing_secret: HMAC signing key for tokens without a key id
+            cache_size: Maximum number of verified tokens to remember (0 disables)
+            allow_prefix_tokens: Accept tokens signed over a path prefix (``scope``)
+            keys: Additional signing keys by key id (``kid``) for rotation
+            clock: Shared coarse clock (a non-ticking one reading time.time() by default)
         """
         self.signing_secret = signing_secret.encode('utf-8')
+        self.allow_prefix_tokens = allow_prefix_tokens
+        self.clock = clock or CoarseClock()
+        # Keyed HMAC state with the padded key already absorbed; copied per request
+        self._inner, self._outer = keyed_sha256(self.signing_secret)
+        self._key_secrets: Dict[str, bytes] = {}
+        self._key_states: Dict[str, Tuple["hashlib._Hash", "hashlib._Hash"]] = {}
+        # Bumped whenever the key table changes, so holders of derived state can drop it
+        self.key_generation = 0
+        self.cache = VerifiedTokenCache(cache_size)
+        if keys:
+            self.set_keys(keys)
     
-    def validate_request(self, path: str, exp: int, sig: str) -> ValidationResult:
+    def set_keys(self, keys: Dict[str, str]) -> None:
+        """Replace the key-id table used for rotation.
+        
+        The new table is built completely before it is swapped in, so
+        concurrent requests see either the old or the new set of keys. The
+        verified-token cache is cleared so removed keys stop working at once.
+        
+        Args:
+            keys: Signing keys by key id
+        """
+        secrets = {kid: secret.encode('utf-8') for kid, secret in keys.items()}
+        if secrets == self._key_secrets:
+            return
+        states = {kid: keyed_sha256(secret) for kid, secret in secrets.items()}
+        self._key_secrets, self._key_states = secrets, states
+        self.key_generation += 1
+        self.cache.clear()
+    
+    def validate_request(
+        self,
+        path: str,
+        exp: int,
+        sig: str,
+        scope: Optional[str] = None,
+        kid: Optional[str] = None,
+    ) -> ValidationResult:
         """Validate a request with token parameters.
         
         Args:
             path: Request path (e.g., "/live/stream.m3u8")
             exp: Expiration timestamp (Unix time)
             sig: Base64URL encoded signature (unpadded)
+            scope: Path prefix the token was signed for (e.g., "/live/"), or
+                None for a token signed over the exact path
+            kid: Id of the signing key, or None for the default secret
             
         Returns:
             ValidationResult with validation status and error details
         """
         # Check expiration first
-        if self._is_expired(exp):
+        now = self.clock.now()
+        if now > exp:
             return ValidationResult(False, "expired", 410)
         
-        # Compute expected signature
-        expected_sig = self._compute_signature(path, exp)
+        # Unknown key ids are rejected without any HMAC work
+        if kid is not None and kid not in self._key_states:
+            return ValidationResult(False, "forbidden", 403)
         
-        # Compare signatures
-        if sig != expected_sig:
+        if scope is not None:
+            if not self._scope_covers(scope, path):
+                return ValidationResult(False, "forbidden", 403)
+            # One entry per viewer token covers every path under the prefix
+            message_path = PREFIX_MARKER + scope
+        else:
+            message_path = path
+        
+        # Tokens seen before skip the HMAC entirely
+        key = (message_path, exp, sig, kid)
+        if self.cache.contains(key, now):
+            return VALID
+        
+        if not self._verify(message_path, exp, sig, kid):
             return ValidationResult(False, "forbidden", 403)
         
-        return ValidationResult(True)
+        self.cache.add(key, exp, now)
+        return VALID
+    
+    def validate_many(
+        self,
+        tokens: Optional[Iterable[Tuple]] = None,
+        *,
+        paths: Optional[Sequence[str]] = None,
+        exps: Optional[Sequence[int]] = None,
+        sigs: Optional[Sequence[str]] = None,
+        kids: Optional[Sequence[Optional[str]]] = None,
+        processes: int = 0,
+        chunk_size: int = 8192,
+    ) -> array:
+        """Validate a batch of tokens, e.g. when replaying access logs.
+        
+        The clock is read once for the whole batch and expired entries are
+        rejected before any HMAC work. Valid tokens are added to the
+        verified-token cache, so this also pre-warms it.
+        
+        Args:
+            tokens: Iterable of (path, exp, sig) or (path, exp, sig, kid) tuples
+            paths: Request paths, parallel to exps and sigs (instead of tokens)
+            exps: Expiration timestamps
+            sigs: Base64URL encoded signatures (unpadded)
+            kids: Optional key ids parallel to paths (None entries use the default secret)
+            processes: Worker processes for signature checks (0 verifies in-process)
+            chunk_size: Signatures per worker task; batches smaller than two
+                chunks are always verified in-process
+            
+        Returns:
+            array('H') of status codes in input order: 200 valid, 403 forbidden, 410 expired
+        """
+        if tokens is not None:
+            batch = list(tokens)
+            paths = [token[0] for token in batch]
+            exps = [token[1] for token in batch]
+            sigs = [token[2] for token in batch]
+            kids = [token[3] if len(token) > 3 else None for token in batch]
+        elif paths is None or exps is None or sigs is None:
+            raise ValueError("validate_many needs tokens or paths, exps and sigs")
+        if kids is None:
+            kids = [None] * len(paths)
+        if not len(paths) == len(exps) == len(sigs) == len(kids):
+            raise ValueError("paths, exps, sigs and kids must have the same length")
+        
+        now = self.clock.now()
+        statuses = array('H', [410]) * len(exps)
+        live = [i for i, exp in enumerate(exps) if exp >= now]
+        
+        pending = []
+        for i in live:
+            if kids[i] is not None and kids[i] not in self._key_states:
+                statuses[i] = 403
+            elif self.cache.contains((paths[i], exps[i], sigs[i], kids[i]), now):
+                statuses[i] = 200
+            else:
+                pending.append(i)
+        
+        if processes > 0 and len(pending) >= 2 * chunk_size:
+            chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = [
+                    pool.submit(
+                        _verify_chunk,
+                        self.signing_secret,
+                        self._key_secrets,
+                        [paths[i] for i in chunk],
+                        [exps[i] for i in chunk],
+                        [sigs[i] for i in chunk],
+                        [kids[i] for i in chunk],
+                    )
+                    for chunk in chunks
+                ]
+                verdicts = [ok for future in futures for ok in future.result()]
+        else:
+            verdicts = [self._verify(paths[i], exps[i], sigs[i], kids[i]) for i in pending]
+        
+        for i, ok in zip(pending, verdicts):
+            if ok:
+                statuses[i] = 200
+                self.cache.add((paths[i], exps[i], sigs[i], kids[i]), exps[i], now)
+            else:
+                statuses[i] = 403
+        return statuses
     
-    def _compute_signature(self, path: str, exp: int) -> str:
+    def _scope_covers(self, scope: str, path: str) -> bool:
+        """Check that prefix tokens are enabled and scope is a directory prefix of path."""
+        return (
+            self.allow_prefix_tokens
+            and scope.startswith("/")
+            and scope.endswith("/")
+            and path.lower().startswith(scope.lower())
+        )
+    
+    def digest(self, message: str, exp: int, kid: Optional[str] = None) -> Optional[bytes]:
+        """Sign a message and expiration with one of the validator's keys.
+        
+        Args:
+            message: Message to sign (normalized to lowercase)
+            exp: Expiration timestamp
+            kid: Id of the signing key, or None for the default secret
+            
+        Returns:
+            32-byte digest, or None if the key id is unknown (or was revoked)
+        """
+        if kid is not None and kid not in self._key_states:
+            return None
+        return self._compute_digest(message, exp, kid)
+    
+    def _verify(self, path: str, exp: int, sig: str, kid: Optional[str] = None) -> bool:
+        """Check a signature against the expected digest in constant time."""
+        provided = decode_signature(sig)
+        return provided is not None and hmac.compare_digest(provided, self._compute_digest(path, exp, kid))
+    
+    def _compute_signature(self, path: str, exp: int, kid: Optional[str] = None) -> str:
         """Compute HMAC-SHA256 signature for path and expiration.
         
         Args:
             path: Request path in lowercase
             exp: Expiration timestamp
+            kid: Id of the signing key, or None for the default secret
             
         Returns:
             Base64URL encoded signature (unpadded)
         """
-        # Normalize path to lowercase
-        normalized_path = path.lower()
-        
-        # Create message: path + exp
-        message = f"{normalized_path}{exp}".encode('utf-8')
-        
-        # Compute HMAC-SHA256
-        signature = hmac.new(self.signing_secret, message, hashlib.sha256).digest()
+        signature = self._compute_digest(path, exp, kid)
         
         # Encode as base64url without padding
         encoded = base64.urlsafe_b64encode(signature).decode('ascii')
         return encoded.rstrip('=')
     
-    def _is_expired(self, exp: int) -> bool:
-        """Check if token has expired.
+    def _compute_prefix_signature(self, scope: str, exp: int, kid: Optional[str] = None) -> str:
+        """Compute the signature of a prefix-scoped token.
         
         Args:
-            exp: Expiration timestamp (Unix time)
+            scope: Path prefix ending in "/" (e.g., "/live/")
+            exp: Expiration timestamp
+            kid: Id of the signing key, or None for the default secret
+            
+        Returns:
+            Base64URL encoded signature (unpadded)
+        """
+        return self._compute_signature(PREFIX_MARKER + scope, exp, kid)
+    
+    def _compute_digest(self, path: str, exp: int, kid: Optional[str] = None) -> bytes:
+        """Compute the raw HMAC-SHA256 digest for path and expiration.
+        
+        Args:
+            path: Request path (normalized to lowercase here)
+            exp: Expiration timestamp
+            kid: Id of the signing key, or None for the default secret
             
         Returns:
-            True if token has expired
+            32-byte digest
         """
-        return time.time() > exp
\ No newline at end of file
+        # Create message: lowercase path + exp
+        message = f"{path.lower()}{exp}".encode('utf-8')
+        
+        if kid is None:
+            inner_state, outer_state = self._inner, self._outer
+        else:
+            inner_state, outer_state = self._key_states[kid]
+        inner = inner_state.copy()
+        inner.update(message)
+        outer = outer_state.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
+
+def _verify_chunk(
+    signing_secret: bytes,
+    keys: Dict[str, bytes],
+    paths: List[str],
+    exps: List[int],
+    sigs: List[str],
+    kids: List[Optional[str]],
+) -> bytes:
+    """Verify one slice of a validate_many batch in a worker process.
+    
+    Returns:
+        One byte per token, 1 for a valid signature and 0 otherwise
+    """
+    validator = TokenValidator(
+        signing_secret.decode('utf-8'),
+        cache_size=0,
+        keys={kid: secret.decode('utf-8') for kid, secret in keys.items()},
+    )
+    return bytes(
+        validator._verify(path, exp, sig, kid)
+        for path, exp, sig, kid in zip(paths, exps, sigs, kids)
+    )
+
+
+def load_signing_keys(path: str) -> Dict[str, str]:
+    """Load a key-id table from a JSON file of the form {"kid": "secret", ...}.
+    
+    Args:
+        path: Path to the key file
+        
+    Returns:
+        Signing secrets by key id
+        
+    Raises:
+        ValueError: If the file is not a JSON object of non-empty strings
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        keys = json.load(f)
+    if not isinstance(keys, dict) or not all(
+        isinstance(kid, str) and kid and isinstance(secret, str) and secret
+        for kid, secret in keys.items()
+    ):
+        raise ValueError(f"Signing key file must map key ids to secrets: {path}")
+    return keys
+
+
+# SigningKeyFile version while the key file cannot be stat()ed
+_MISSING_FILE = (-1, -1)
+
+
+class SigningKeyFile:
+    """Hot-reloads a validator's key-id table when its key file changes.
+    
+    The file is stat()ed at most once per ``check_interval`` seconds of the
+    validator's clock and only re-read when its (mtime_ns, size) changes. A file that fails to parse is
+    logged and the previous keys stay active.
+    """
+    
+    def __init__(self, path: str, check_interval: int = 1):
+        """Initialize the watcher.
+        
+        Args:
+            path: Path to the JSON key file
+            check_interval: Minimum whole seconds between stat() calls
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._version: Optional[Tuple[int, int]] = None
+        self._next_check = 0
+    
+    def refresh(self, validator: TokenValidator) -> bool:
+        """Reload the key table into validator if the file changed.
+        
+        Args:
+            validator: Validator whose keys are replaced
+            
+        Returns:
+            True if new keys were loaded
+        """
+        now = validator.clock.now()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        
+        try:
+            st = os.stat(self.path)
+        except OSError as e:
+            # Reported once until the file is back, like a file that fails to parse
+            if self._version != _MISSING_FILE:
+                self._version = _MISSING_FILE
+                logger.warning("Cannot stat signing key file %s: %s", self.path, e)
+            return False
+        version = (st.st_mtime_ns, st.st_size)
+        if version == self._version:
+            return False
+        # Recorded even on failure so a broken file is reported once, not every interval
+        self._version = version
+        
+        try:
+            keys = load_signing_keys(self.path)
+        except (OSError, ValueError) as e:
+            logger.warning("Keeping previous signing keys, cannot load %s: %s", self.path, e)
+            return False
+        validator.set_keys(keys)
+        logger.info("Loaded %d signing keys from %s", len(keys), self.path)
+        return True
@@ -0,0 +1,111 @@
+"""Microbenchmark for the storage backends.
+
+Runs the same workload against every backend: a player loop that fetches
+the playlist and then each segment it lists, over one stream directory of
+SEGMENTS segments of SEGMENT_BYTES each. The upstream backend fetches from
+a local static HTTP server serving the same directory.
+
+Run from the repository root:
+    python benchmarks/bench_storage.py
+"""
+
+import asyncio
+import functools
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import FilesystemBackend, MappedBackend, MemoryBackend, UpstreamBackend  # noqa: E402
+
+SEGMENTS = 8
+SEGMENT_BYTES = 1024 * 1024
+ROUNDS = 500
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def publish(root: str) -> dict:
+    """Write the stream's playlist and segments; return them by name."""
+    files = {f"seg{i}.ts": os.urandom(SEGMENT_BYTES) for i in range(SEGMENTS)}
+    lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:2"]
+    for name in files:
+        lines += ["#EXTINF:2.0,", name]
+    files["index.m3u8"] = ("\n".join(lines) + "\n").encode()
+    for name, data in files.items():
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(data)
+    return files
+
+
+async def player_loop(backend) -> float:
+    """Fetch the playlist and every segment ROUNDS times; return the seconds taken."""
+    names = [f"seg{i}.ts" for i in range(SEGMENTS)]
+    # One untimed round opens, maps or fetches everything
+    for name in ["index.m3u8"] + names:
+        await backend.get(name)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await backend.get("index.m3u8")
+        for name in names:
+            stored = await backend.get(name)
+            # Touch the bytes as a response would
+            stored.data[-1]
+    return time.perf_counter() - start
+
+
+def report(name: str, seconds: float, baseline: float = None) -> None:
+    rate = ROUNDS * (SEGMENTS + 1) / seconds
+    line = f"{name:<14}{rate:>14,.0f} gets/s"
+    if baseline:
+        line += f"  ({baseline / seconds:.2f}x)"
+    print(line)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        files = publish(root)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=root))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        memory = MemoryBackend()
+        for name, data in files.items():
+            memory.put(name, data)
+
+        def backends():
+            yield FilesystemBackend(root)
+            yield MappedBackend(root)
+            yield memory
+            yield UpstreamBackend(f"http://127.0.0.1:{server.server_port}/")
+
+        async def run():
+            results = []
+            for backend in backends():
+                try:
+                    results.append((backend.kind, await player_loop(backend)))
+                finally:
+                    await backend.close()
+            return results
+
+        print(f"{platform.machine()} / Python {platform.python_version()} / {ROUNDS:,} rounds"
+              f" of 1 playlist + {SEGMENTS} x {SEGMENT_BYTES // 1024} KiB segments")
+        try:
+            results = asyncio.run(run())
+        finally:
+            server.shutdown()
+            server.server_close()
+        (kind, baseline), *others = results
+        report(kind, baseline)
+        for kind, seconds in others:
+            report(kind, seconds, baseline)
+
+
+if __name__ == "__main__":
+    main()
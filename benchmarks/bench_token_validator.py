@@ -0,0 +1,73 @@
+"""Microbenchmark for TokenValidator signature checks.
+
+Compares the original per-request ``hmac.new`` + base64 string comparison with
+the precomputed keyed state and raw digest comparison, cache hits, and batch
+validation with and without a process pool.
+
+Run from the repository root (on the Pi for ARM64 numbers):
+    python benchmarks/bench_token_validator.py
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import platform
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import TokenValidator  # noqa: E402
+
+SECRET = "bench-secret-key"
+PATH = "/live/segment001.ts"
+ROUNDS = 200_000
+
+
+def legacy_validate(secret: bytes, path: str, exp: int, sig: str) -> bool:
+    """The validator as it was before the keyed state was precomputed."""
+    if time.time() > exp:
+        return False
+    message = f"{path.lower()}{exp}".encode('utf-8')
+    digest = hmac.new(secret, message, hashlib.sha256).digest()
+    return sig == base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+
+
+def report(name: str, seconds: float, baseline: float = None) -> None:
+    rate = ROUNDS / seconds
+    line = f"{name:<28}{rate:>14,.0f} validations/s"
+    if baseline:
+        line += f"  ({baseline / seconds:.2f}x)"
+    print(line)
+
+
+def main():
+    exp = int(time.time()) + 3600
+    uncached = TokenValidator(SECRET, cache_size=0)
+    cached = TokenValidator(SECRET)
+    sig = uncached._compute_signature(PATH, exp)
+    secret = SECRET.encode('utf-8')
+
+    print(f"{platform.machine()} / Python {platform.python_version()} / {ROUNDS:,} rounds")
+    legacy = min(timeit.repeat(lambda: legacy_validate(secret, PATH, exp, sig), number=ROUNDS, repeat=3))
+    report("hmac.new + str compare", legacy)
+    keyed = min(timeit.repeat(lambda: uncached.validate_request(PATH, exp, sig), number=ROUNDS, repeat=3))
+    report("keyed copy + compare_digest", keyed, legacy)
+    hit = min(timeit.repeat(lambda: cached.validate_request(PATH, exp, sig), number=ROUNDS, repeat=3))
+    report("verified-token cache hit", hit, legacy)
+
+    paths = [f"/live/segment{i:06d}.ts" for i in range(ROUNDS)]
+    sigs = [uncached._compute_signature(path, exp) for path in paths]
+    exps = [exp] * ROUNDS
+    start = time.perf_counter()
+    uncached.validate_many(paths=paths, exps=exps, sigs=sigs)
+    report("validate_many", time.perf_counter() - start, legacy)
+    start = time.perf_counter()
+    uncached.validate_many(paths=paths, exps=exps, sigs=sigs, processes=os.cpu_count())
+    report(f"validate_many x{os.cpu_count()} procs", time.perf_counter() - start, legacy)
+
+
+if __name__ == "__main__":
+    main()
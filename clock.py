@@ -0,0 +1,79 @@
+"""Coarse shared clock for expiry checks and cache eviction."""
+
+import asyncio
+import time
+from typing import Callable, Optional
+
+
+class CoarseClock:
+    """Wall clock in whole seconds, refreshed by a task on the event loop.
+    
+    While ``run()`` is active, ``now()`` returns a cached integer updated every
+    ``interval`` seconds, so hot paths do not call ``time.time()`` per request.
+    When the clock is not ticking (scripts, tests, before startup) ``now()``
+    reads the time source directly.
+    """
+    
+    def __init__(self, interval: float = 0.1, source: Callable[[], float] = time.time):
+        """Initialize the clock.
+        
+        Args:
+            interval: Seconds between refreshes while ticking
+            source: Function returning the current Unix time
+        """
+        self.interval = interval
+        self._source = source
+        self._now = int(source())
+        self._task: Optional[asyncio.Task] = None
+    
+    def now(self) -> int:
+        """Return the current Unix time in whole seconds."""
+        if self._task is None:
+            return int(self._source())
+        return self._now
+    
+    def start(self) -> None:
+        """Start refreshing the cached time on the running event loop."""
+        if self._task is None:
+            self._now = int(self._source())
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop refreshing; ``now()`` falls back to reading the source."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self._now = int(self._source())
+
+
+class FrozenClock(CoarseClock):
+    """Clock that only moves when told to, for tests."""
+    
+    def __init__(self, now: int):
+        """Initialize the clock at a fixed time.
+        
+        Args:
+            now: Unix time in whole seconds
+        """
+        self._frozen = now
+        super().__init__(source=lambda: self._frozen)
+    
+    def now(self) -> int:
+        """Return the frozen time."""
+        return self._frozen
+    
+    def advance(self, seconds: int) -> None:
+        """Move the clock forward.
+        
+        Args:
+            seconds: Whole seconds to add
+        """
+        self._frozen += seconds
@@ -1,26 +1,271 @@
 """FastAPI dependencies for token validation."""
 
 import os
-from auth import TokenValidator
+from typing import Optional
+from auth import SigningKeyFile, TokenValidator
+from clock import CoarseClock
+from ingest import DiskSpill
+from manifest import ManifestCache
+from prefork import STATS_DIR_ENV, WorkerStats
+from segment_cache import SegmentCache
+from segment_log import SegmentLog
+from shared_store import SharedSegmentStore
+from sessions import SessionTable
+from storage import StorageBackend, create_backend
+from streams import Stream, StreamIndex
 
 
+# Shared coarse clock, ticking on the event loop while the app runs
+_clock: CoarseClock = None
+
 # Global validator instance
 _validator: TokenValidator = None
 
+# Key-id table watcher, set when EDGE_SIGNING_KEYS_FILE is configured
+_key_file: Optional[SigningKeyFile] = None
+
+# Global session table, created on first use when EDGE_SESSION_COOKIES=1
+_sessions: Optional[SessionTable] = None
+
+# Segment bytes shared by all workers, created when SHARED_SEGMENT_BYTES is set
+_segment_store: Optional[SharedSegmentStore] = None
+
+# Append-only log files holding segment bytes, created when SEGMENT_LOG_DIR is set
+_segment_log: Optional[SegmentLog] = None
+
+# Global in-memory segment cache
+_segment_cache: SegmentCache = None
+
+# Global in-memory manifest store
+_manifest_cache: ManifestCache = None
+
+# Background writer of pushed files, created when INGEST_SPILL=1
+_disk_spill: Optional[DiskSpill] = None
+
+# Global index of the streams under HLS_ROOT
+_streams: StreamIndex = None
+
+# Counters shared with the other workers, set when started by the pre-fork launcher
+_worker_stats: Optional[WorkerStats] = None
+
+
+def get_clock() -> CoarseClock:
+    """Get the shared coarse clock.
+    
+    Returns:
+        CoarseClock instance (ticking only while the app's lifespan is active)
+    """
+    global _clock
+    if _clock is None:
+        interval = float(os.getenv('CLOCK_INTERVAL', '0.1'))
+        _clock = CoarseClock(interval=interval)
+    return _clock
+
 
 def get_token_validator() -> TokenValidator:
     """Get the global token validator instance.
     
     Returns:
         TokenValidator instance
-        
+    
     Raises:
         RuntimeError: If validator is not initialized
     """
-    global _validator
+    global _validator, _key_file
     if _validator is None:
         signing_secret = os.getenv('EDGE_SIGNING_SECRET')
         if not signing_secret:
             raise RuntimeError("EDGE_SIGNING_SECRET environment variable is required")
-        _validator = TokenValidator(signing_secret)
-    return _validator
\ No newline at end of file
+        cache_size = int(os.getenv('TOKEN_CACHE_SIZE', '4096'))
+        allow_prefix_tokens = os.getenv('EDGE_PREFIX_TOKENS', '0') == '1'
+        _validator = TokenValidator(
+            signing_secret,
+            cache_size=cache_size,
+            allow_prefix_tokens=allow_prefix_tokens,
+            clock=get_clock(),
+        )
+        keys_file = os.getenv('EDGE_SIGNING_KEYS_FILE')
+        _key_file = SigningKeyFile(keys_file) if keys_file else None
+    if _key_file is not None:
+        _key_file.refresh(_validator)
+    return _validator
+
+
+
+def get_session_table() -> Optional[SessionTable]:
+    """Get the global session table if session cookies are enabled.
+    
+    Returns:
+        SessionTable instance, or None when EDGE_SESSION_COOKIES is not "1"
+    
+    Raises:
+        RuntimeError: If EDGE_SIGNING_SECRET is not set
+    """
+    global _sessions
+    if _sessions is None:
+        if os.getenv('EDGE_SESSION_COOKIES', '0') == '1':
+            max_entries = int(os.getenv('SESSION_TABLE_SIZE', '4096'))
+            _sessions = SessionTable(get_token_validator(), max_entries=max_entries, clock=get_clock())
+    elif _key_file is not None:
+        # Sessions are signed with the validator's keys, so a revoked key
+        # must end them even while viewers send no token at all
+        _key_file.refresh(_sessions.validator)
+    return _sessions
+
+
+def get_segment_store() -> Optional[SharedSegmentStore]:
+    """Get the segment store shared by the workers, if enabled.
+    
+    Must first be called before the pre-fork launcher forks (the launcher's
+    warmup does), so that every worker inherits the same mapping.
+    
+    Returns:
+        SharedSegmentStore of SHARED_SEGMENT_BYTES, or None when it is 0 or
+        SEGMENT_LOG_DIR is set
+    """
+    global _segment_store
+    if _segment_store is None and not os.getenv('SEGMENT_LOG_DIR'):
+        size = int(os.getenv('SHARED_SEGMENT_BYTES', '0'))
+        if size > 0:
+            _segment_store = SharedSegmentStore(size)
+    return _segment_store
+
+
+def get_segment_log() -> Optional[SegmentLog]:
+    """Get the segment log, if enabled.
+    
+    Returns:
+        SegmentLog in SEGMENT_LOG_DIR with SEGMENT_LOG_FILES files of
+        SEGMENT_LOG_FILE_BYTES each, or None when SEGMENT_LOG_DIR is not set
+    """
+    global _segment_log
+    directory = os.getenv('SEGMENT_LOG_DIR')
+    if _segment_log is None and directory:
+        file_bytes = int(os.getenv('SEGMENT_LOG_FILE_BYTES', str(64 * 1024 * 1024)))
+        files = int(os.getenv('SEGMENT_LOG_FILES', '4'))
+        _segment_log = SegmentLog(directory, file_bytes=file_bytes, files=files)
+    return _segment_log
+
+
+def get_segment_backing():
+    """Get the store segment caches keep their bytes in, if any.
+    
+    Returns:
+        The segment log if enabled, else the shared segment store if
+        enabled, else None (segment bytes live in each cache)
+    """
+    return get_segment_log() or get_segment_store()
+
+
+def create_stream_backend(name: str, root: str, manifest_name: str) -> Optional[StorageBackend]:
+    """Create a stream's storage backend as HLS_STORAGE selects.
+    
+    Args:
+        name: Stream name ("" for the stream at HLS_ROOT)
+        root: Stream directory
+        manifest_name: File name of the stream's playlist
+    
+    Returns:
+        The backend, or None for "filesystem" (the default): that value
+        means no backend, and the stream keeps the original path of
+        reading HLS_ROOT through the segment and manifest caches. A
+        "memory" backend is a ring of INGEST_RING_BYTES
+    
+    Raises:
+        ValueError: If HLS_STORAGE is unknown, or "upstream" without HLS_ORIGIN
+    """
+    kind = os.getenv('HLS_STORAGE', 'filesystem')
+    if kind == 'filesystem':
+        return None
+    origin = os.getenv('HLS_ORIGIN', '')
+    if origin and name:
+        origin = f"{origin.rstrip('/')}/{name}"
+    max_bytes = int(os.getenv('INGEST_RING_BYTES', str(64 * 1024 * 1024)))
+    return create_backend(kind, root, origin=origin, manifest_name=manifest_name, max_bytes=max_bytes)
+
+
+def get_segment_cache() -> SegmentCache:
+    """Get the global segment cache.
+    
+    Returns:
+        SegmentCache sized by SEGMENT_CACHE_BYTES (0 disables caching)
+    """
+    global _segment_cache
+    if _segment_cache is None:
+        max_bytes = int(os.getenv('SEGMENT_CACHE_BYTES', str(64 * 1024 * 1024)))
+        _segment_cache = SegmentCache(max_bytes=max_bytes, clock=get_clock(), store=get_segment_backing())
+    return _segment_cache
+
+
+def get_manifest_cache() -> ManifestCache:
+    """Get the global manifest store.
+    
+    Returns:
+        ManifestCache instance
+    """
+    global _manifest_cache
+    if _manifest_cache is None:
+        _manifest_cache = ManifestCache()
+    return _manifest_cache
+
+
+def get_stream_index() -> StreamIndex:
+    """Get the global stream index.
+    
+    The stream at HLS_ROOT itself uses the global segment and manifest
+    caches; each subdirectory stream gets its own, sized by
+    STREAM_CACHE_BYTES. Page-cache prefetch of playlist segments is on
+    unless SEGMENT_PREFETCH is "0". Every stream gets the storage backend
+    HLS_STORAGE selects.
+    
+    Returns:
+        StreamIndex for HLS_ROOT
+    """
+    global _streams
+    if _streams is None:
+        root = os.getenv('HLS_ROOT', '/var/hulagirl/live')
+        prefetch = os.getenv('SEGMENT_PREFETCH', '1') != '0'
+        default = Stream(
+            "",
+            root,
+            "stream.m3u8",
+            get_segment_cache(),
+            get_manifest_cache(),
+            prefetch=prefetch,
+            backend=create_stream_backend("", root, "stream.m3u8"),
+        )
+        cache_bytes = int(os.getenv('STREAM_CACHE_BYTES', str(16 * 1024 * 1024)))
+        _streams = StreamIndex(
+            default,
+            cache_bytes=cache_bytes,
+            clock=get_clock(),
+            prefetch=prefetch,
+            store=get_segment_backing(),
+            backends=create_stream_backend,
+        )
+    return _streams
+
+
+def get_disk_spill() -> Optional[DiskSpill]:
+    """Get the writer that copies pushed files to their stream directories, if enabled.
+    
+    Returns:
+        DiskSpill, or None unless INGEST_SPILL is "1"
+    """
+    global _disk_spill
+    if _disk_spill is None and os.getenv('INGEST_SPILL', '0') == '1':
+        _disk_spill = DiskSpill()
+    return _disk_spill
+
+
+def get_worker_stats() -> Optional[WorkerStats]:
+    """Get this worker's stats sharing if running under the pre-fork launcher.
+    
+    Returns:
+        WorkerStats instance, or None when running as a single process
+    """
+    global _worker_stats
+    directory = os.getenv(STATS_DIR_ENV)
+    if _worker_stats is None and directory:
+        _worker_stats = WorkerStats(directory)
+    return _worker_stats
@@ -0,0 +1,207 @@
+"""Raw-ASGI fast path for the hot /live routes."""
+
+from typing import Callable, Dict, Optional
+from urllib.parse import unquote_plus
+
+from pydantic import TypeAdapter, ValidationError
+
+from deps import get_session_table, get_token_validator
+from sessions import SESSION_COOKIE
+
+
+def _json_error(body: bytes) -> tuple:
+    """Pre-serialize a JSON error as (body, headers) in JSONResponse's format."""
+    headers = [
+        (b"content-length", str(len(body)).encode("latin-1")),
+        (b"content-type", b"application/json"),
+    ]
+    return body, headers
+
+
+# Bodies byte-for-byte identical to the FastAPI routes' error responses
+ERROR_RESPONSES = {
+    "missing_parameters": (400, _json_error(b'{"error":"missing_parameters"}')),
+    "invalid_expiration": (400, _json_error(b'{"error":"invalid_expiration"}')),
+    "invalid_blocking_request": (400, _json_error(b'{"error":"invalid_blocking_request"}')),
+    "forbidden": (403, _json_error(b'{"error":"forbidden"}')),
+    "expired": (410, _json_error(b'{"error":"expired"}')),
+    "not_found": (404, _json_error(b'{"detail":"File not found"}')),
+}
+
+_INT_ADAPTER = TypeAdapter(int)
+
+_TOKEN_PARAMS = (b"exp", b"sig", b"scope", b"kid", b"_HLS_msn", b"_HLS_part")
+
+
+def parse_token_params(query_string: bytes) -> Dict[bytes, str]:
+    """Extract the token and LL-HLS parameters from a raw query string.
+    
+    Only exp, sig, scope, kid, _HLS_msn and _HLS_part are decoded; the last
+    occurrence wins, as with Starlette's QueryParams.
+    
+    Args:
+        query_string: Raw query bytes from the ASGI scope
+    
+    Returns:
+        Decoded values by parameter name
+    """
+    params = {}
+    for pair in query_string.split(b"&"):
+        name, _, value = pair.partition(b"=")
+        if name in _TOKEN_PARAMS:
+            text = value.decode("latin-1")
+            if "%" in text or "+" in text:
+                text = unquote_plus(value.decode("utf-8", "replace"))
+            params[name] = text
+    return params
+
+
+def parse_int(value: str) -> Optional[int]:
+    """Parse an integer parameter exactly as the FastAPI routes' ``int`` fields do.
+    
+    Plain digits are converted directly; anything else (signs, underscores,
+    a ``.0`` suffix, whitespace) is left to pydantic's own validator so both
+    paths accept and reject the same strings.
+    
+    Args:
+        value: Decoded query parameter
+    
+    Returns:
+        The integer, or None if the route would reject it
+    """
+    if value.isascii() and value.isdigit():
+        return int(value)
+    try:
+        return _INT_ADAPTER.validate_python(value)
+    except ValidationError:
+        return None
+
+
+def find_header(headers, name: bytes) -> Optional[str]:
+    """Return the first value of a (lowercase) header from raw ASGI headers."""
+    for header, value in headers:
+        if header == name:
+            return value.decode("latin-1")
+    return None
+
+
+def find_cookie(headers, name: bytes) -> Optional[str]:
+    """Return the value of one cookie from raw ASGI headers, if present."""
+    prefix = name + b"="
+    for header, value in headers:
+        if header != b"cookie":
+            continue
+        for part in value.split(b";"):
+            part = part.strip()
+            if part.startswith(prefix):
+                return part[len(prefix):].decode("latin-1")
+    return None
+
+
+class LiveFastPath:
+    """ASGI middleware that answers GET requests for manifests and segments.
+    
+    Handles /live/stream.m3u8 and /live/{segment}.ts as well as
+    /live/{stream}/index.m3u8 and /live/{stream}/{segment}.ts.
+    
+    Token parameters are read straight from the raw query bytes and checked
+    with ``TokenValidator`` without FastAPI's dependency, validation and
+    exception machinery, and every error is sent as a pre-serialized body.
+    Authorized requests are answered by the same response builders the
+    FastAPI routes use. Any other request is passed to the wrapped app.
+    """
+    
+    def __init__(self, app, manifest: Callable, segment: Callable):
+        """Initialize the fast path.
+        
+        Args:
+            app: ASGI application handling everything else
+            manifest: Async builder for authorized manifest responses,
+                ``(exp, session, if_none_match, msn, part, stream, kid)``
+            segment: Async builder for authorized segment responses,
+                ``(segment, stream, range, if_range)``
+        """
+        self.app = app
+        self.manifest = manifest
+        self.segment = segment
+    
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        if scope.get("method") != "GET" or not path.startswith("/live/"):
+            await self.app(scope, receive, send)
+            return
+        
+        stream, _, name = path[len("/live/"):].rpartition("/")
+        # At most one directory level, as with the routes' path parameters
+        if "/" in stream or path.startswith("/live//"):
+            await self.app(scope, receive, send)
+            return
+        if name == ("index.m3u8" if stream else "stream.m3u8"):
+            segment = None
+        elif name.endswith(".ts") and len(name) > 3:
+            segment = name[:-3]
+        else:
+            await self.app(scope, receive, send)
+            return
+        
+        error = None
+        params = parse_token_params(scope.get("query_string", b""))
+        session = None
+        if segment is not None and get_session_table() is not None:
+            session = find_cookie(scope.get("headers", ()), SESSION_COOKIE.encode("latin-1"))
+        
+        exp = params.get(b"exp")
+        if exp is not None:
+            exp = parse_int(exp)
+            if exp is None:
+                error = "invalid_expiration"
+        msn = part = None
+        if error is None and segment is None:
+            msn, part, error = self._blocking_params(params)
+        if error is None:
+            error = self._authorize(path, exp, params, session)
+        
+        if error is None:
+            if segment is None:
+                headers = scope.get("headers", ())
+                cookie = find_cookie(headers, SESSION_COOKIE.encode("latin-1"))
+                response = await self.manifest(
+                    exp, cookie, find_header(headers, b"if-none-match"), msn, part, stream, params.get(b"kid")
+                )
+            else:
+                headers = scope.get("headers", ())
+                response = await self.segment(
+                    segment, stream, find_header(headers, b"range"), find_header(headers, b"if-range")
+                )
+            if response is not None:
+                await response(scope, receive, send)
+                return
+            error = "not_found"
+        
+        status, (body, headers) = ERROR_RESPONSES[error]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+    
+    def _blocking_params(self, params: Dict[bytes, str]) -> tuple:
+        """Parse _HLS_msn and _HLS_part, returning (msn, part, error key or None)."""
+        values = []
+        for name in (b"_HLS_msn", b"_HLS_part"):
+            value = params.get(name)
+            if value is not None:
+                value = parse_int(value)
+                if value is None:
+                    return None, None, "invalid_blocking_request"
+            values.append(value)
+        return values[0], values[1], None
+    
+    def _authorize(self, path: str, exp: Optional[int], params: Dict[bytes, str], session: Optional[str]) -> Optional[str]:
+        """Mirror ``main.validate_token_for_path``, returning an error key or None."""
+        if session is not None and get_session_table().validate(session, path):
+            return None
+        
+        sig = params.get(b"sig")
+        if exp is None or sig is None:
+            return "missing_parameters"
+        
+        result = get_token_validator().validate_request(path, exp, sig, params.get(b"scope"), params.get(b"kid"))
+        return None if result.is_valid else result.error_type
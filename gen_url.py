@@ -4,14 +4,23 @@ import os, time, hmac, hashlib, base64, urllib.parse
 SECRET = os.environ["EDGE_SIGNING_SECRET"]
 PATH = "/live/stream.m3u8"  # change to a specific .ts to test segments
 TTL = 30                    # seconds
+KID = os.environ.get("KID")      # key id from EDGE_SIGNING_KEYS_FILE; SECRET must then be that key's secret
+SCOPE = os.environ.get("SCOPE")  # e.g. "/live/" to mint one prefix-scoped token for PATH and its segments
 
 def b64url_nopad(b: bytes) -> str:
     return base64.urlsafe_b64encode(b).decode().rstrip("=")
 
 exp = int(time.time()) + TTL
-msg = (PATH.lower() + str(exp)).encode()
+if SCOPE:
+    msg = ("prefix:" + SCOPE.lower() + str(exp)).encode()
+else:
+    msg = (PATH.lower() + str(exp)).encode()
 sig = hmac.new(SECRET.encode(), msg, hashlib.sha256).digest()
 sig_b64 = b64url_nopad(sig)
 
 qs = f"exp={exp}&sig={urllib.parse.quote(sig_b64)}"
+if SCOPE:
+    qs += f"&scope={urllib.parse.quote(SCOPE, safe='')}"
+if KID:
+    qs += f"&kid={urllib.parse.quote(KID, safe='')}"
 print(f"{PATH}?{qs}")
@@ -0,0 +1,146 @@
+"""HTTP ingest: the packager pushes playlists and segments straight into memory."""
+
+import asyncio
+import hmac
+import logging
+import os
+from typing import Optional, Tuple
+
+from anyio import to_thread
+
+
+logger = logging.getLogger(__name__)
+
+# Suffixes of the files the packager may push; anything else could not be served
+INGEST_SUFFIXES = (".m3u8", ".ts")
+
+
+def ingest_authorized(authorization: Optional[str], secret: str) -> bool:
+    """Check the packager's ``Authorization: Bearer <secret>`` header.
+    
+    Args:
+        authorization: Authorization header of the request, if any
+        secret: INGEST_SECRET
+    
+    Returns:
+        True if the header carries the secret
+    """
+    if authorization is None:
+        return False
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+    return hmac.compare_digest(token.strip().encode("utf-8"), secret.encode("utf-8"))
+
+
+def is_ingest_name(name: str) -> bool:
+    """Check that a pushed file is a playlist or segment with a plain file name."""
+    return name.endswith(INGEST_SUFFIXES) and not name.startswith(".") and "/" not in name and "\\" not in name
+
+
+class DiskSpill:
+    """Writes pushed files to disk in the background, in the order they were pushed.
+    
+    A single task works through the queue, so an older playlist never lands
+    on top of a newer one. Each file is written to a temporary name and
+    renamed into place, so a reader of the directory never sees half a file.
+    The requests that pushed the files do not wait for any of it.
+    """
+    
+    def __init__(self, max_pending: int = 256):
+        """Initialize the spill.
+        
+        Args:
+            max_pending: Files queued for writing before new ones are dropped
+        """
+        self.max_pending = max_pending
+        self.written = 0
+        self.removed = 0
+        self.dropped = 0
+        self.errors = 0
+        # (path, bytes to write, or None to remove the file)
+        self._queue: "asyncio.Queue[Tuple[str, Optional[bytes]]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+    
+    def write(self, path: str, data: bytes) -> None:
+        """Queue a file to be written.
+        
+        Args:
+            path: Absolute path to write the file to
+            data: File contents
+        """
+        self._enqueue(path, data)
+    
+    def remove(self, path: str) -> None:
+        """Queue a file to be removed."""
+        self._enqueue(path, None)
+    
+    def start(self) -> None:
+        """Start writing queued files; needs a running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Write what is still queued, then stop."""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        await self._queue.join()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    
+    def stats(self) -> dict:
+        """Return spill counters.
+        
+        Returns:
+            dict with written, removed, pending, dropped (queue full) and errors
+        """
+        return {
+            "written": self.written,
+            "removed": self.removed,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+    
+    def _enqueue(self, path: str, data: Optional[bytes]) -> None:
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            logger.warning("Spill queue full, not writing %s to disk", path)
+            return
+        self._queue.put_nowait((path, data))
+    
+    async def _run(self) -> None:
+        while True:
+            path, data = await self._queue.get()
+            try:
+                if data is None:
+                    await to_thread.run_sync(_remove_file, path)
+                    self.removed += 1
+                else:
+                    await to_thread.run_sync(_write_file, path, data)
+                    self.written += 1
+            except OSError as e:
+                self.errors += 1
+                logger.warning("Cannot spill %s to disk: %s", path, e)
+            finally:
+                self._queue.task_done()
+
+
+def _write_file(path: str, data: bytes) -> None:
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    temporary = os.path.join(directory, f".{name}.spill")
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -2,12 +2,40 @@
 
 import os
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import FileResponse
-from deps import get_token_validator
-from token import TokenValidator
-from typing import Annotated
+from fastapi import Cookie, FastAPI, Header, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from deps import (
+    get_clock,
+    get_disk_spill,
+    get_segment_log,
+    get_segment_store,
+    get_session_table,
+    get_stream_index,
+    get_token_validator,
+    get_worker_stats,
+)
+from fastpath import LiveFastPath
+from ingest import ingest_authorized, is_ingest_name
+from manifest import DEFAULT_TARGET_DURATION, etag_matches
+from responses import (
+    SEGMENT_CACHE_CONTROL,
+    MappedResponse,
+    PartialResponse,
+    PreparedResponse,
+    SendfileResponse,
+    if_range_matches,
+    parse_range,
+    range_not_satisfiable,
+)
+from segment_cache import OversizedSegment
+from sessions import SESSION_COOKIE, parse_session_cookie, session_scope
+from storage import BACKENDS, MemoryBackend
+from streams import Stream
+from typing import Annotated, Optional
 
 
 def get_hls_root():
@@ -31,20 +59,130 @@ def validate_environment():
     if not hls_path.is_dir():
         print(f"ERROR: HLS_ROOT is not a directory: {hls_root}", file=sys.stderr)
         sys.exit(1)
+    
+    storage = os.getenv('HLS_STORAGE', 'filesystem')
+    if storage != 'filesystem' and storage not in BACKENDS:
+        print(f"ERROR: HLS_STORAGE must be one of filesystem, {', '.join(BACKENDS)}: {storage}", file=sys.stderr)
+        sys.exit(1)
+    if storage == 'upstream' and not os.getenv('HLS_ORIGIN'):
+        print("ERROR: HLS_ORIGIN environment variable is required with HLS_STORAGE=upstream", file=sys.stderr)
+        sys.exit(1)
+    
+    if os.getenv('INGEST_SECRET'):
+        if storage != 'memory':
+            print("ERROR: INGEST_SECRET requires HLS_STORAGE=memory", file=sys.stderr)
+            sys.exit(1)
+        if int(os.getenv('WEB_WORKERS', '1')) != 1:
+            # Each worker has its own memory; a push would reach only one of them
+            print("ERROR: INGEST_SECRET requires WEB_WORKERS=1", file=sys.stderr)
+            sys.exit(1)
 
 
 # Only validate environment if not in test mode
 if not os.getenv('PYTEST_CURRENT_TEST'):
     validate_environment()
 
+async def start_watchers() -> bool:
+    """Watch HLS_ROOT and every stream directory unless HLS_WATCH is "off".
+    
+    Returns:
+        True if watchers were started
+    """
+    mode = os.getenv('HLS_WATCH', 'auto')
+    if mode == 'off':
+        return False
+    await get_stream_index().start_watchers(mode)
+    return True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background tasks for the lifetime of the application."""
+    clock = get_clock()
+    clock.start()
+    # Build the stream index before the first request
+    get_stream_index().scan()
+    watching = await start_watchers()
+    spill = get_disk_spill()
+    if spill is not None:
+        spill.start()
+    worker_stats = get_worker_stats()
+    if worker_stats is not None:
+        worker_stats.start(collect_metrics)
+    try:
+        yield
+    finally:
+        if worker_stats is not None:
+            await worker_stats.stop()
+        if spill is not None:
+            await spill.stop()
+        if watching:
+            await get_stream_index().stop_watchers()
+        await clock.stop()
+
+
+def warm_caches() -> None:
+    """Load shared state once before the pre-fork launcher starts the workers."""
+    get_token_validator()
+    get_session_table()
+    get_stream_index().warm()
+
+
+def collect_metrics() -> dict:
+    """Return this process's cache counters.
+    
+    Returns:
+        dict: Token cache statistics, the cache statistics of the stream at
+        HLS_ROOT, those of every other stream by name, and the counters of
+        the shared segment store, the segment log and the ingest disk spill
+        if they are enabled
+    """
+    streams = get_stream_index()
+    metrics = {
+        "token_cache": get_token_validator().cache.stats(),
+        **streams.default.stats(),
+        "streams": streams.stats(),
+    }
+    store = get_segment_store()
+    if store is not None:
+        metrics["shared_segments"] = store.stats()
+    log = get_segment_log()
+    if log is not None:
+        metrics["segment_log"] = log.stats()
+    spill = get_disk_spill()
+    if spill is not None:
+        metrics["ingest_spill"] = spill.stats()
+    return metrics
+
+
 # Create FastAPI application
 app = FastAPI(
     title="hulagirl-web",
     description="HLS streaming server with token authentication",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
+@app.exception_handler(HTTPException)
+async def http_exception_handler(request: Request, exc: HTTPException):
+    """Return token errors as a bare JSON object and everything else as {"detail": ...}."""
+    body = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+    return JSONResponse(body, status_code=exc.status_code, headers=exc.headers)
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """Map unparseable exp and LL-HLS query parameters to 400 errors."""
+    for error in exc.errors():
+        loc = tuple(error.get("loc", ()))
+        if loc == ("query", "exp"):
+            return JSONResponse({"error": "invalid_expiration"}, status_code=400)
+        if loc in (("query", "_HLS_msn"), ("query", "_HLS_part")):
+            return JSONResponse({"error": "invalid_blocking_request"}, status_code=400)
+    return await request_validation_exception_handler(request, exc)
+
+
 @app.get("/healthz")
 async def health_check():
     """Health check endpoint for monitoring and container health checks.
@@ -55,44 +193,74 @@ async def health_check():
     return {"ok": True}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Cache counters for sizing the caches to the host's memory.
+    
+    Under the pre-fork launcher the counters of all workers are added up.
+    
+    Returns:
+        dict: Token cache statistics, the cache statistics of the stream at
+        HLS_ROOT, and those of every other stream by name
+    """
+    worker_stats = get_worker_stats()
+    if worker_stats is not None:
+        return worker_stats.collect(collect_metrics())
+    return collect_metrics()
+
+
 @app.get("/live/stream.m3u8")
 async def serve_m3u8(
     exp: Annotated[int, Query(description="Token expiration timestamp")] = None,
-    sig: Annotated[str, Query(description="Token signature")] = None
+    sig: Annotated[str, Query(description="Token signature")] = None,
+    scope: Annotated[str, Query(description="Path prefix of a prefix-scoped token")] = None,
+    kid: Annotated[str, Query(description="Signing key id")] = None,
+    session: Annotated[str, Cookie(alias=SESSION_COOKIE, description="Viewer session cookie")] = None,
+    if_none_match: Annotated[str, Header(description="ETag of the client's copy")] = None,
+    msn: Annotated[int, Query(alias="_HLS_msn", description="LL-HLS media sequence number to wait for")] = None,
+    part: Annotated[int, Query(alias="_HLS_part", description="LL-HLS part index to wait for")] = None
 ):
     """Serve HLS manifest file with token validation.
     
+    The token signs only the path, so the LL-HLS blocking reload parameters
+    can be added to a signed URL without invalidating it.
+    
     Args:
         exp: Expiration timestamp from query parameters
         sig: Signature from query parameters
+        scope: Signed path prefix for prefix-scoped tokens
+        kid: Signing key id for rotated keys
+        session: Session cookie from an earlier manifest response
+        if_none_match: If-None-Match header for revalidation
+        msn: Hold the response until this media sequence number is listed
+        part: Hold the response until this part of segment msn is listed
         
     Returns:
-        FileResponse: The m3u8 file with appropriate headers
+        Response: The m3u8 file with appropriate headers, or 304
         
     Raises:
         HTTPException: If token validation fails or file not found
     """
-    # Validate token
-    validate_token_for_path("/live/stream.m3u8", exp, sig)
+    # Validate token before parking the request
+    validate_token_for_path("/live/stream.m3u8", exp, sig, scope, kid)
     
     # Serve file
-    file_path = Path(get_hls_root()) / "stream.m3u8"
-    
-    if not file_path.exists():
+    response = await manifest_response(exp, session, if_none_match, msn, part, kid=kid)
+    if response is None:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(
-        path=file_path,
-        media_type="application/vnd.apple.mpegurl",
-        headers={"Cache-Control": "no-store"}
-    )
+    return response
 
 
 @app.get("/live/{segment}.ts")
 async def serve_ts_segment(
     segment: str,
     exp: Annotated[int, Query(description="Token expiration timestamp")] = None,
-    sig: Annotated[str, Query(description="Token signature")] = None
+    sig: Annotated[str, Query(description="Token signature")] = None,
+    scope: Annotated[str, Query(description="Path prefix of a prefix-scoped token")] = None,
+    kid: Annotated[str, Query(description="Signing key id")] = None,
+    session: Annotated[str, Cookie(alias=SESSION_COOKIE, description="Viewer session cookie")] = None,
+    range_header: Annotated[str, Header(alias="range", description="Byte ranges to send")] = None,
+    if_range: Annotated[str, Header(description="Last-Modified the ranges apply to")] = None
 ):
     """Serve HLS transport stream segment with token validation.
     
@@ -100,6 +268,11 @@ async def serve_ts_segment(
         segment: Segment filename (without .ts extension)
         exp: Expiration timestamp from query parameters
         sig: Signature from query parameters
+        scope: Signed path prefix for prefix-scoped tokens
+        kid: Signing key id for rotated keys
+        session: Session cookie; when valid it replaces the query token
+        range_header: Range header for partial content
+        if_range: If-Range header
         
     Returns:
         FileResponse: The .ts file with appropriate headers
@@ -110,33 +283,438 @@ async def serve_ts_segment(
     # Construct request path for validation
     request_path = f"/live/{segment}.ts"
     
-    # Validate token
-    validate_token_for_path(request_path, exp, sig)
+    # Validate session cookie or token
+    validate_token_for_path(request_path, exp, sig, scope, kid, session)
     
     # Serve file
-    file_path = Path(get_hls_root()) / f"{segment}.ts"
+    response = await segment_response(segment, range_header=range_header, if_range=if_range)
+    if response is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return response
+
+
+@app.get("/live/{stream}/index.m3u8")
+async def serve_stream_m3u8(
+    stream: str,
+    exp: Annotated[int, Query(description="Token expiration timestamp")] = None,
+    sig: Annotated[str, Query(description="Token signature")] = None,
+    scope: Annotated[str, Query(description="Path prefix of a prefix-scoped token")] = None,
+    kid: Annotated[str, Query(description="Signing key id")] = None,
+    session: Annotated[str, Cookie(alias=SESSION_COOKIE, description="Viewer session cookie")] = None,
+    if_none_match: Annotated[str, Header(description="ETag of the client's copy")] = None,
+    msn: Annotated[int, Query(alias="_HLS_msn", description="LL-HLS media sequence number to wait for")] = None,
+    part: Annotated[int, Query(alias="_HLS_part", description="LL-HLS part index to wait for")] = None
+):
+    """Serve the manifest of a stream in a subdirectory of HLS_ROOT.
     
-    if not file_path.exists():
+    Args:
+        stream: Stream name (subdirectory of HLS_ROOT)
+        exp: Expiration timestamp from query parameters
+        sig: Signature from query parameters
+        scope: Signed path prefix for prefix-scoped tokens
+        kid: Signing key id for rotated keys
+        session: Session cookie from an earlier manifest response
+        if_none_match: If-None-Match header for revalidation
+        msn: Hold the response until this media sequence number is listed
+        part: Hold the response until this part of segment msn is listed
+        
+    Returns:
+        Response: The m3u8 file with appropriate headers, or 304
+        
+    Raises:
+        HTTPException: If token validation fails or stream or file not found
+    """
+    validate_token_for_path(f"/live/{stream}/index.m3u8", exp, sig, scope, kid)
+    
+    response = await manifest_response(exp, session, if_none_match, msn, part, stream, kid)
+    if response is None:
         raise HTTPException(status_code=404, detail="File not found")
+    return response
+
+
+@app.get("/live/{stream}/{segment}.ts")
+async def serve_stream_segment(
+    stream: str,
+    segment: str,
+    exp: Annotated[int, Query(description="Token expiration timestamp")] = None,
+    sig: Annotated[str, Query(description="Token signature")] = None,
+    scope: Annotated[str, Query(description="Path prefix of a prefix-scoped token")] = None,
+    kid: Annotated[str, Query(description="Signing key id")] = None,
+    session: Annotated[str, Cookie(alias=SESSION_COOKIE, description="Viewer session cookie")] = None,
+    range_header: Annotated[str, Header(alias="range", description="Byte ranges to send")] = None,
+    if_range: Annotated[str, Header(description="Last-Modified the ranges apply to")] = None
+):
+    """Serve a segment of a stream in a subdirectory of HLS_ROOT.
     
-    return FileResponse(
-        path=file_path,
-        media_type="video/mp2t",
-        headers={"Cache-Control": "public, max-age=10, immutable"}
-    )
+    Args:
+        stream: Stream name (subdirectory of HLS_ROOT)
+        segment: Segment filename (without .ts extension)
+        exp: Expiration timestamp from query parameters
+        sig: Signature from query parameters
+        scope: Signed path prefix for prefix-scoped tokens
+        kid: Signing key id for rotated keys
+        session: Session cookie; when valid it replaces the query token
+        range_header: Range header for partial content
+        if_range: If-Range header
+        
+    Returns:
+        Response: The segment with appropriate headers
+        
+    Raises:
+        HTTPException: If token validation fails or stream or file not found
+    """
+    validate_token_for_path(f"/live/{stream}/{segment}.ts", exp, sig, scope, kid, session)
+    
+    response = await segment_response(segment, stream, range_header, if_range)
+    if response is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return response
 
 
-def validate_token_for_path(request_path: str, exp: int = None, sig: str = None):
+@app.api_route("/ingest/{name}", methods=["PUT", "POST", "DELETE"])
+async def ingest_file(
+    name: str,
+    request: Request,
+    authorization: Annotated[str, Header(description="Bearer INGEST_SECRET")] = None
+):
+    """Store a playlist or segment the packager pushes for the stream at HLS_ROOT.
+    
+    Matches ffmpeg's HLS output with ``-method PUT``; see ``ingest_response``.
+    
+    Args:
+        name: File name, e.g. stream.m3u8 or segment001.ts
+        request: The request, whose body is the file
+        authorization: Authorization header carrying INGEST_SECRET
+        
+    Returns:
+        Response: 201 for a new file, 204 for a replaced or removed one
+        
+    Raises:
+        HTTPException: If ingest is disabled, the secret is wrong, or the
+            file name or size is not accepted
+    """
+    return await ingest_response(request, name, authorization)
+
+
+@app.api_route("/ingest/{stream}/{name}", methods=["PUT", "POST", "DELETE"])
+async def ingest_stream_file(
+    stream: str,
+    name: str,
+    request: Request,
+    authorization: Annotated[str, Header(description="Bearer INGEST_SECRET")] = None
+):
+    """Store a playlist or segment the packager pushes for a named stream.
+    
+    The stream is created on its first push; it needs no directory.
+    
+    Args:
+        stream: Stream name
+        name: File name, e.g. index.m3u8 or segment001.ts
+        request: The request, whose body is the file
+        authorization: Authorization header carrying INGEST_SECRET
+        
+    Returns:
+        Response: 201 for a new file, 204 for a replaced or removed one
+        
+    Raises:
+        HTTPException: If ingest is disabled, the secret is wrong, the
+            stream name is invalid, or the file name or size is not accepted
+    """
+    return await ingest_response(request, name, authorization, stream)
+
+
+async def ingest_response(request: Request, name: str, authorization: str = None, stream: str = "") -> Response:
+    """Store or remove a file pushed by the packager in its stream's memory ring.
+    
+    PUT and POST store the request body, which may be sent with chunked
+    transfer encoding, and DELETE removes the file. A new playlist version
+    is parsed before the response is sent, so blocked playlist reloads are
+    answered at once. With INGEST_SPILL=1 the file is also written to (or
+    removed from) the stream directory in the background.
+    
+    Args:
+        request: The ingest request
+        name: File name within the stream
+        authorization: Authorization header of the request, if any
+        stream: Stream name, or "" for the stream at HLS_ROOT
+        
+    Returns:
+        Response: 201 for a new file, 204 for a replaced or removed one
+        
+    Raises:
+        HTTPException: 404 if INGEST_SECRET is unset (or the streams are not
+            in memory) or a removed file does not exist, 403 for a wrong
+            secret, 400 for a name that is not a playlist or segment, 413
+            for a file larger than the ring
+    """
+    secret = os.getenv('INGEST_SECRET')
+    if not secret:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not ingest_authorized(authorization, secret):
+        raise HTTPException(status_code=403, detail={"error": "forbidden"})
+    if not is_ingest_name(name):
+        raise HTTPException(status_code=400, detail={"error": "invalid_name"})
+    streams = get_stream_index()
+    target = await streams.add(stream) if stream else streams.default
+    if target is None:
+        raise HTTPException(status_code=400, detail={"error": "invalid_stream"})
+    backend = target.backend
+    if not isinstance(backend, MemoryBackend):
+        raise HTTPException(status_code=404, detail="Not Found")
+    spill = get_disk_spill()
+    path = os.path.join(target.root, name)
+    
+    if request.method == "DELETE":
+        if not backend.delete(name):
+            raise HTTPException(status_code=404, detail="File not found")
+        if spill is not None:
+            spill.remove(path)
+        return Response(status_code=204)
+    
+    limit = backend.max_bytes
+    length = request.headers.get("content-length")
+    if limit is not None and length is not None and length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=413, detail={"error": "too_large"})
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise HTTPException(status_code=413, detail={"error": "too_large"})
+        chunks.append(chunk)
+    data = b"".join(chunks)
+    
+    created = name not in backend.files
+    backend.put(name, data)
+    if name == target.manifest_name:
+        await target.manifests.fetch(target.manifest_path)
+    if spill is not None:
+        spill.write(path, data)
+    return Response(status_code=201 if created else 204)
+
+
+async def manifest_response(
+    exp: int,
+    session: str = None,
+    if_none_match: str = None,
+    msn: int = None,
+    part: int = None,
+    stream: str = "",
+    kid: str = None
+) -> Optional[Response]:
+    """Build the response for an authorized manifest request.
+    
+    Shared by the FastAPI route and the raw-ASGI fast path. The manifest
+    comes from the versioned manifest cache and a matching If-None-Match is
+    answered with 304 without sending the body.
+    
+    With LL-HLS blocking reload parameters the response is held until the
+    playlist lists segment ``msn`` (or its part ``part``). A request for a
+    segment more than two ahead of the playlist, or for a part without a
+    segment, gets 400; one still unsatisfied after three target durations
+    gets 503.
+    
+    Args:
+        exp: Expiration timestamp of the validated token
+        session: Session cookie sent with the request, if any
+        if_none_match: If-None-Match header sent with the request, if any
+        msn: _HLS_msn query parameter, if any
+        part: _HLS_part query parameter, if any
+        stream: Stream name, or "" for the stream at HLS_ROOT
+        kid: Key id of the validated token, if any
+        
+    Returns:
+        Response with the manifest, 304 or a blocking reload error, or None
+        if the stream or manifest does not exist
+    """
+    target = await resolve_stream(stream)
+    if target is None:
+        return None
+    file_path = target.manifest_path
+    
+    cache = target.manifests
+    manifest = await cache.fetch(file_path)
+    if manifest is None:
+        return None
+    
+    if msn is not None or part is not None:
+        if msn is None or msn < 0 or (part is not None and part < 0) or msn > manifest.msn + 2:
+            return JSONResponse({"error": "invalid_blocking_request"}, status_code=400)
+        timeout = 3 * (manifest.target_duration or DEFAULT_TARGET_DURATION)
+        manifest = await cache.wait_for(file_path, msn, part, timeout)
+        if manifest is None:
+            return None
+        if not manifest.contains(msn, part):
+            return JSONResponse({"error": "playlist_timeout"}, status_code=503)
+    
+    headers = {"Cache-Control": "no-store", "ETag": manifest.etag}
+    if etag_matches(if_none_match, manifest.etag):
+        cache.not_modified += 1
+        response = Response(status_code=304, headers=headers)
+    else:
+        response = Response(
+            content=manifest.data,
+            media_type="application/vnd.apple.mpegurl",
+            headers=headers
+        )
+    issue_session_cookie(response, target.manifest_url, exp, session, kid)
+    return response
+
+
+async def segment_response(
+    segment: str,
+    stream: str = "",
+    range_header: str = None,
+    if_range: str = None
+) -> Optional[Response]:
+    """Build the response for an authorized segment request.
+    
+    Shared by the FastAPI route and the raw-ASGI fast path. Segment bytes
+    come from the in-memory segment cache and are read from disk on a miss.
+    Segments too large to cache are sent from disk with sendfile() where
+    the server supports it, and read in chunks otherwise.
+    While a watcher runs, names missing from its index are answered without
+    a syscall, and headers come pre-rendered from the cache entry so a hit
+    never stats the file.
+    
+    A Range header is answered with 206: one range as is, several as
+    multipart/byteranges, cached segments as slices of the cached bytes and
+    uncached ones as reads at the ranges' offsets. A Range no byte of the
+    segment satisfies gets 416, and a stale If-Range gets the whole segment.
+    Segments still being written are always sent whole.
+    
+    A media file whose byte ranges the playlist lists as segments
+    (EXT-X-BYTERANGE) is served from the stream's archive, as slices of its
+    memory mapping; a range past the mapped end remaps the file first in
+    case the packager appended it since the playlist was read.
+    
+    A stream with a storage backend (HLS_STORAGE other than "filesystem")
+    serves every segment as the backend returns it, bypassing the caches.
+    
+    An LL-HLS part or preload hint that the current manifest announces and
+    the packager is still writing is streamed with chunked transfer from its
+    in-memory append buffer as bytes arrive. A preload hint the packager has
+    not started yet is waited for up to three target durations. Any other
+    file that is still open for writing is reported as missing.
+    
+    Args:
+        segment: Segment filename (without .ts extension)
+        stream: Stream name, or "" for the stream at HLS_ROOT
+        range_header: Range header of the request, if any
+        if_range: If-Range header of the request, if any
+        
+    Returns:
+        Response with the segment bytes, or None if it does not exist
+    """
+    target = await resolve_stream(stream)
+    if target is None:
+        return None
+    name = f"{segment}.ts"
+    file_path = target.segment_path(segment)
+    
+    if target.backend is not None:
+        stored = await target.backend.get(name)
+        if stored is None:
+            return None
+        ranges = None
+        if range_header is not None and if_range_matches(if_range, stored.headers):
+            ranges = parse_range(range_header, len(stored.data))
+            if ranges == []:
+                return range_not_satisfiable(len(stored.data))
+        return MappedResponse(stored.data, stored.headers, ranges)
+    
+    if target.archive.lists(name):
+        mapped = await target.archive.get(name)
+        if mapped is not None:
+            ranges = None
+            if range_header is not None and if_range_matches(if_range, mapped.headers):
+                ranges = parse_range(range_header, mapped.size)
+                if ranges == []:
+                    mapped.refresh()
+                    ranges = parse_range(range_header, mapped.size)
+                if ranges == []:
+                    return range_not_satisfiable(mapped.size)
+            return MappedResponse(mapped.view, mapped.headers, ranges)
+    
+    cache = target.segments
+    entry = await cache.fetch(file_path)
+    if entry is None:
+        manifest = target.manifests.peek(target.manifest_path)
+        if manifest is None or not manifest.announces(name):
+            return None
+        timeout = 0
+        if name in manifest.preload_hints:
+            timeout = 3 * (manifest.target_duration or DEFAULT_TARGET_DURATION)
+        buffer = await cache.open_stream(file_path, timeout)
+        if buffer is not None:
+            return StreamingResponse(
+                buffer.stream(),
+                media_type="video/mp2t",
+                headers={"Cache-Control": SEGMENT_CACHE_CONTROL}
+            )
+        # Finished before or while waiting for the packager to start it
+        entry = await cache.fetch(file_path)
+        if entry is None:
+            return None
+    
+    oversized = isinstance(entry, OversizedSegment)
+    size = entry.size if oversized else len(entry.data)
+    ranges = None
+    if range_header is not None and if_range_matches(if_range, entry.headers):
+        ranges = parse_range(range_header, size)
+        if ranges == []:
+            return range_not_satisfiable(size)
+    
+    if oversized:
+        return SendfileResponse(entry.path, entry.size, entry.headers, on_send=cache.record_send, ranges=ranges)
+    if ranges:
+        return PartialResponse(entry.data, ranges, entry.headers)
+    return PreparedResponse(entry.data, entry.headers)
+
+
+async def resolve_stream(stream: str) -> Optional[Stream]:
+    """Look up a stream by name in the stream index.
+    
+    Args:
+        stream: Stream name, or "" for the stream at HLS_ROOT
+        
+    Returns:
+        Stream, or None if there is no such stream
+    """
+    streams = get_stream_index()
+    if not stream:
+        return streams.default
+    return await streams.resolve(stream)
+
+
+def validate_token_for_path(
+    request_path: str,
+    exp: int = None,
+    sig: str = None,
+    scope: str = None,
+    kid: str = None,
+    session: str = None
+):
     """Helper function to validate token parameters.
     
     Args:
         request_path: The request path for signature validation
         exp: Expiration timestamp from query parameters
         sig: Signature from query parameters
+        scope: Signed path prefix for prefix-scoped tokens, if any
+        kid: Signing key id, if the token was not signed with the default secret
+        session: Session cookie value; a valid one authorizes the request
+            without a token
         
     Raises:
         HTTPException: If token validation fails
     """
+    # A session from the manifest response is a table lookup, no HMAC
+    if session is not None:
+        sessions = get_session_table()
+        if sessions is not None and sessions.validate(session, request_path):
+            return
+    
     # Check for missing parameters
     if exp is None or sig is None:
         raise HTTPException(
@@ -146,7 +724,7 @@ def validate_token_for_path(request_path: str, exp: int = None, sig: str = None)
     
     # Get validator and validate token
     validator = get_token_validator()
-    result = validator.validate_request(request_path, exp, sig)
+    result = validator.validate_request(request_path, exp, sig, scope, kid)
     
     if not result.is_valid:
         raise HTTPException(
@@ -155,6 +733,60 @@ def validate_token_for_path(request_path: str, exp: int = None, sig: str = None)
         )
 
 
+
+def issue_session_cookie(response, request_path: str, exp: int, current: str = None, kid: str = None):
+    """Attach a session cookie for the manifest's stream when sessions are enabled.
+    
+    The session expires with the token that authorized the manifest and is
+    signed with the same key. A new cookie is only issued when the viewer
+    has no valid one lasting as long. The cookie is Secure unless
+    SESSION_COOKIE_SECURE is "0" (plain-HTTP development) and SameSite=Lax.
+    
+    Args:
+        response: Response to set the cookie on
+        request_path: Validated manifest path
+        exp: Expiration timestamp of the validated token
+        current: Session cookie sent with the request, if any
+        kid: Key id of the validated token, if any
+    """
+    sessions = get_session_table()
+    if sessions is None:
+        return
+    
+    if current is not None:
+        parsed = parse_session_cookie(current)
+        if parsed is not None and parsed[1] >= exp and sessions.validate(current, request_path):
+            return
+    
+    scope = session_scope(request_path)
+    cookie = sessions.issue(scope, exp, kid)
+    if cookie is None:
+        return
+    response.set_cookie(
+        SESSION_COOKIE,
+        cookie,
+        max_age=max(0, exp - get_clock().now()),
+        path=scope,
+        secure=os.getenv('SESSION_COOKIE_SECURE', '1') == '1',
+        httponly=True,
+        samesite="lax"
+    )
+
+
+
+# Optional raw-ASGI handler for the hot /live routes
+if os.getenv('LIVE_FAST_PATH', '0') == '1':
+    app.add_middleware(LiveFastPath, manifest=manifest_response, segment=segment_response)
+
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import prefork
+    prefork.run(
+        app,
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', '8000')),
+        workers=int(os.getenv('WEB_WORKERS', '1')),
+        warmup=warm_caches,
+        zero_copy=os.getenv('SEGMENT_SENDFILE', '0') == '1',
+        loop=os.getenv('WEB_LOOP', 'auto')
+    )
@@ -0,0 +1,413 @@
+"""Versioned in-memory HLS manifest cache."""
+
+import asyncio
+import hashlib
+import os
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from anyio import to_thread
+
+from segment_cache import FileVersion, file_version
+
+
+# Used for the blocking reload timeout when a playlist has no EXT-X-TARGETDURATION
+DEFAULT_TARGET_DURATION = 6
+
+
+def playlist_position(data: bytes) -> Tuple[int, int, Optional[int]]:
+    """Find how far a media playlist has progressed.
+    
+    Args:
+        data: Playlist contents
+    
+    Returns:
+        Tuple of (media sequence number of the last complete segment, number
+        of EXT-X-PART parts listed for the segment after it, target duration
+        or None). The sequence number is one less than EXT-X-MEDIA-SEQUENCE
+        when the playlist lists no segments yet.
+    """
+    media_sequence = 0
+    segments = 0
+    parts = 0
+    target_duration = None
+    for line in data.splitlines():
+        if not line:
+            continue
+        if not line.startswith(b"#"):
+            # A segment URI completes the segment and every part listed before it
+            segments += 1
+            parts = 0
+        elif line.startswith(b"#EXT-X-PART:"):
+            parts += 1
+        elif line.startswith(b"#EXT-X-MEDIA-SEQUENCE:"):
+            try:
+                media_sequence = int(line[22:])
+            except ValueError:
+                pass
+        elif line.startswith(b"#EXT-X-TARGETDURATION:"):
+            try:
+                target_duration = int(line[22:])
+            except ValueError:
+                pass
+    return media_sequence + segments - 1, parts, target_duration
+
+
+def partial_uris(data: bytes) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """Return the file names of announced LL-HLS parts and preload hints.
+    
+    Args:
+        data: Playlist contents
+    
+    Returns:
+        Tuple of (base names of EXT-X-PART URIs, base names of
+        EXT-X-PRELOAD-HINT URIs), without query strings
+    """
+    parts = set()
+    hints = set()
+    for line in data.splitlines():
+        if line.startswith(b"#EXT-X-PART:"):
+            names = parts
+        elif line.startswith(b"#EXT-X-PRELOAD-HINT:"):
+            names = hints
+        else:
+            continue
+        _, found, rest = line.partition(b'URI="')
+        if found:
+            uri = rest.split(b'"', 1)[0].split(b"?", 1)[0]
+            names.add(os.path.basename(uri.decode("utf-8", "replace")))
+    return frozenset(parts), frozenset(hints)
+
+
+def segment_uris(data: bytes) -> FrozenSet[str]:
+    """Return the file names of the segments a media playlist lists.
+    
+    Args:
+        data: Playlist contents
+    
+    Returns:
+        Base names of the segment URIs, without query strings
+    """
+    names = set()
+    for line in data.splitlines():
+        line = line.strip()
+        if line and not line.startswith(b"#"):
+            uri = line.split(b"?", 1)[0]
+            names.add(os.path.basename(uri.decode("utf-8", "replace")))
+    return frozenset(names)
+
+
+def byterange_uris(data: bytes) -> Dict[str, List[Tuple[int, int]]]:
+    """Return the byte ranges a media playlist lists in each media file.
+    
+    Segments tagged with EXT-X-BYTERANGE are ranges of a larger file
+    rather than files of their own. A range without an offset starts where
+    the previous range of the same file ended.
+    
+    Args:
+        data: Playlist contents
+    
+    Returns:
+        Half-open (start, end) ranges in playlist order by base name of
+        the media file, without query strings
+    """
+    ranges: Dict[str, List[Tuple[int, int]]] = {}
+    pending = None
+    for line in data.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(b"#EXT-X-BYTERANGE:"):
+            length, at, offset = line[17:].partition(b"@")
+            try:
+                pending = (int(length), int(offset) if at else None)
+            except ValueError:
+                pending = None
+        elif not line.startswith(b"#"):
+            if pending is not None:
+                uri = line.split(b"?", 1)[0]
+                listed = ranges.setdefault(os.path.basename(uri.decode("utf-8", "replace")), [])
+                length, offset = pending
+                if offset is None:
+                    offset = listed[-1][1] if listed else 0
+                listed.append((offset, offset + length))
+            pending = None
+    return ranges
+
+
+class ManifestVersion:
+    """One version of a manifest with its precomputed strong ETag and position."""
+    
+    __slots__ = (
+        "data",
+        "version",
+        "etag",
+        "msn",
+        "parts",
+        "target_duration",
+        "part_uris",
+        "preload_hints",
+        "byteranges",
+    )
+    
+    def __init__(self, data: bytes, version: FileVersion):
+        self.data = data
+        self.version = version
+        # Content hash, so every worker derives the same ETag for the same playlist
+        self.etag = '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+        self.msn, self.parts, self.target_duration = playlist_position(data)
+        # Only LL-HLS playlists pay for the second scan
+        if b"#EXT-X-PART" in data or b"#EXT-X-PRELOAD-HINT" in data:
+            self.part_uris, self.preload_hints = partial_uris(data)
+        else:
+            self.part_uris = self.preload_hints = frozenset()
+        self.byteranges = byterange_uris(data) if b"#EXT-X-BYTERANGE" in data else {}
+    
+    def announces(self, name: str) -> bool:
+        """Check whether a file name is an LL-HLS part or preload hint of this version."""
+        return name in self.preload_hints or name in self.part_uris
+    
+    def contains(self, msn: int, part: Optional[int] = None) -> bool:
+        """Check whether this version satisfies an LL-HLS blocking reload.
+        
+        Args:
+            msn: Requested media sequence number (_HLS_msn)
+            part: Requested part index within that segment (_HLS_part), if any
+        
+        Returns:
+            True if the segment, or the part of it, is listed
+        """
+        if msn <= self.msn:
+            return True
+        return part is not None and msn == self.msn + 1 and part < self.parts
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against a strong ETag (RFC 9110 13.1.2).
+    
+    Args:
+        if_none_match: Header value, e.g. '"abc"', 'W/"abc", "def"' or '*'
+        etag: Current ETag including quotes
+    
+    Returns:
+        True if the client's copy is current and 304 may be sent
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ManifestCache:
+    """Holds the current version of each manifest in memory.
+    
+    While a watcher keeps it current (``index`` is set), manifests are served
+    from memory without any syscall and the watcher swaps in each new version
+    with a single dict assignment, so a reader sees either the old or the new
+    playlist in full. Without a watcher a fetch costs one ``stat()``: the file
+    is only re-read when its (inode, mtime_ns, size) changed. A manifest
+    with a storage backend in ``backends`` is fetched from the backend
+    instead, and only parsed again when the backend returns a new version.
+    Once the backend's changes are followed (see ``follow``), it is served
+    from memory like a watched file and ``reload`` swaps in new versions.
+    
+    Requests blocking on a future playlist version wait in ``wait_for`` and
+    are woken by ``update``; without a watcher they re-check the file every
+    ``poll_interval`` seconds.
+    """
+    
+    def __init__(self, poll_interval: float = 0.1):
+        """Initialize an empty manifest cache.
+        
+        Args:
+            poll_interval: Seconds between file checks for blocked requests
+                while no watcher is running
+        """
+        self.index: Optional[Dict[str, FileVersion]] = None
+        self.poll_interval = poll_interval
+        # Called on the event loop with (path, version) for every new version
+        self.on_update: Optional[Callable[[str, ManifestVersion], None]] = None
+        # Storage backends manifests are fetched from instead of their files, by path
+        self.backends: Dict[str, Any] = {}
+        # Paths whose backend changes are followed, so the entry in memory is current
+        self.followed: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.blocked = 0
+        self.blocking_timeouts = 0
+        self._entries: Dict[str, ManifestVersion] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+    
+    async def fetch(self, path: str) -> Optional[ManifestVersion]:
+        """Return a manifest's current version.
+        
+        Args:
+            path: Absolute path of the manifest file
+        
+        Returns:
+            ManifestVersion, or None if the manifest does not exist
+        """
+        entry = self._entries.get(path)
+        backend = self.backends.get(path)
+        if backend is not None:
+            if entry is not None and path in self.followed:
+                self.hits += 1
+                return entry
+            return await self._from_backend(path, backend)
+        if self.index is not None:
+            if entry is not None:
+                self.hits += 1
+            return entry
+        
+        try:
+            version = file_version(os.stat(path))
+        except OSError:
+            self.invalidate(path)
+            return None
+        if entry is not None and entry.version == version:
+            self.hits += 1
+            return entry
+        
+        self.misses += 1
+        try:
+            data, version = await to_thread.run_sync(_read_file, path)
+        except OSError:
+            self.invalidate(path)
+            return None
+        return self.update(path, data, version)
+    
+    async def reload(self, path: str) -> Optional[ManifestVersion]:
+        """Fetch a manifest from its backend after the backend reported a change.
+        
+        Args:
+            path: Absolute path of the manifest file
+        
+        Returns:
+            ManifestVersion, or None if the manifest does not exist
+        """
+        return await self._from_backend(path, self.backends[path])
+    
+    def follow(self, path: str) -> None:
+        """Serve a manifest from memory until ``unfollow``; its backend's changes go to ``reload``."""
+        self.followed.add(path)
+        # What was fetched before changes were followed may already be stale
+        self._entries.pop(path, None)
+    
+    def unfollow(self, path: str) -> None:
+        """Go back to asking the backend on every fetch."""
+        self.followed.discard(path)
+    
+    def peek(self, path: str) -> Optional[ManifestVersion]:
+        """Return the manifest version in memory, without checking the file."""
+        return self._entries.get(path)
+    
+    async def wait_for(self, path: str, msn: int, part: Optional[int], timeout: float) -> Optional[ManifestVersion]:
+        """Return the first version of a manifest containing a segment or part.
+        
+        Args:
+            path: Absolute path of the manifest file
+            msn: Media sequence number to wait for
+            part: Part index within that segment to wait for, if any
+            timeout: Seconds to wait at most
+        
+        Returns:
+            The newest ManifestVersion, which does not satisfy the request if
+            the timeout expired, or None if the manifest does not exist
+        """
+        manifest = await self.fetch(path)
+        if manifest is None or manifest.contains(msn, part):
+            return manifest
+        
+        self.blocked += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while manifest is not None and not manifest.contains(msn, part):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self.blocking_timeouts += 1
+                break
+            if self.index is None and path not in self.followed:
+                remaining = min(remaining, self.poll_interval)
+            
+            waiter = loop.create_future()
+            self._waiters.setdefault(path, []).append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._discard_waiter(path, waiter)
+            manifest = await self.fetch(path)
+        return manifest
+    
+    def update(self, path: str, data: bytes, version: FileVersion) -> ManifestVersion:
+        """Swap in a new version of a manifest.
+        
+        Args:
+            path: Absolute path of the manifest file
+            data: Full manifest contents
+            version: (inode, mtime_ns, size) of the file the bytes came from
+        
+        Returns:
+            The new ManifestVersion
+        """
+        entry = ManifestVersion(data, version)
+        self._entries[path] = entry
+        self._wake(path)
+        if self.on_update is not None:
+            self.on_update(path, entry)
+        return entry
+    
+    def invalidate(self, path: str) -> None:
+        """Forget a manifest that was removed."""
+        if self._entries.pop(path, None) is not None:
+            self._wake(path)
+    
+    def stats(self) -> dict:
+        """Return cache counters.
+        
+        Returns:
+            dict with hits, misses, not_modified (304s sent), blocked (LL-HLS
+            requests that had to wait), blocking_timeouts, waiting and entries
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "blocked": self.blocked,
+            "blocking_timeouts": self.blocking_timeouts,
+            "waiting": sum(len(waiters) for waiters in self._waiters.values()),
+            "entries": len(self._entries),
+        }
+    
+    async def _from_backend(self, path: str, backend: Any) -> Optional[ManifestVersion]:
+        entry = self._entries.get(path)
+        stored = await backend.get(os.path.basename(path))
+        if stored is None:
+            self.invalidate(path)
+            return None
+        if entry is not None and entry.version == stored.version:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return self.update(path, bytes(stored.data), stored.version)
+    
+    def _discard_waiter(self, path: str, waiter: asyncio.Future) -> None:
+        waiters = self._waiters.get(path)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiters[path]
+    
+    def _wake(self, path: str) -> None:
+        for waiter in self._waiters.pop(path, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def _read_file(path: str):
+    with open(path, 'rb') as f:
+        return f.read(), file_version(os.fstat(f.fileno()))
@@ -0,0 +1,116 @@
+"""Page-cache prefetch of the segments a playlist lists."""
+
+import asyncio
+import logging
+import os
+from typing import FrozenSet, Iterable
+
+from manifest import ManifestVersion, segment_uris
+
+
+logger = logging.getLogger(__name__)
+
+# Chunk size of the background read used where posix_fadvise is unavailable
+READAHEAD_CHUNK = 1024 * 1024
+
+
+class SegmentPrefetcher:
+    """Keeps the page cache holding the live window of one stream.
+    
+    Each new playlist version is compared with the previous one. Newly listed
+    segments get ``posix_fadvise(WILLNEED)`` so the kernel starts reading them
+    before the first viewer asks, and segments that rolled off the playlist get
+    ``DONTNEED`` so their pages are reclaimed first. The advice is issued on
+    the default executor, never on the event loop. Where ``posix_fadvise`` is
+    not available new segments are read once in the background instead, and
+    rolled-off segments are left to the kernel.
+    """
+    
+    def __init__(self, root: str):
+        """Initialize the prefetcher.
+        
+        Args:
+            root: Directory the playlist's segment URIs are relative to
+        """
+        self.root = root
+        self.listed: FrozenSet[str] = frozenset()
+        self.prefetched = 0
+        self.dropped = 0
+        self.errors = 0
+        self._advise = getattr(os, "posix_fadvise", None)
+    
+    def update(self, manifest: ManifestVersion) -> None:
+        """Prefetch the segments a new playlist version adds and drop the ones it removes.
+        
+        Args:
+            manifest: The new playlist version
+        """
+        # Byte-range media files are advised range by range by the stream's archive
+        listed = segment_uris(manifest.data).difference(manifest.byteranges)
+        added = listed - self.listed
+        removed = self.listed - listed
+        self.listed = listed
+        if not added and not removed:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.apply(added, removed)
+            return
+        loop.run_in_executor(None, self.apply, added, removed)
+    
+    def apply(self, added: Iterable[str], removed: Iterable[str]) -> None:
+        """Issue page-cache advice for segment files (blocking).
+        
+        Args:
+            added: Base names of segments to load into the page cache
+            removed: Base names of segments whose pages may be dropped
+        """
+        for name in added:
+            if self._hint(name, True):
+                self.prefetched += 1
+        if self._advise is None:
+            return
+        for name in removed:
+            if self._hint(name, False):
+                self.dropped += 1
+    
+    def stats(self) -> dict:
+        """Return prefetch counters.
+        
+        Returns:
+            dict with listed (segments in the current playlist), prefetched,
+            dropped and errors
+        """
+        return {
+            "listed": len(self.listed),
+            "prefetched": self.prefetched,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+    
+    def _hint(self, name: str, willneed: bool) -> bool:
+        path = os.path.join(self.root, name)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            # Listed before it was written, or already deleted by the packager
+            return False
+        except OSError as e:
+            self.errors += 1
+            logger.debug("Cannot open %s for prefetch: %s", path, e)
+            return False
+        try:
+            if self._advise is not None:
+                advice = os.POSIX_FADV_WILLNEED if willneed else os.POSIX_FADV_DONTNEED
+                self._advise(fd, 0, 0, advice)
+            else:
+                while os.read(fd, READAHEAD_CHUNK):
+                    pass
+            return True
+        except OSError as e:
+            self.errors += 1
+            logger.debug("Cannot prefetch %s: %s", path, e)
+            return False
+        finally:
+            os.close(fd)
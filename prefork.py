@@ -0,0 +1,330 @@
+"""Pre-fork launcher running several uvicorn workers on one port."""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import tempfile
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Set by the launcher in every worker: directory the workers publish their counters to
+STATS_DIR_ENV = "PREFORK_STATS_DIR"
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Bind a listening socket that other workers may bind to as well.
+    
+    With SO_REUSEPORT every worker gets its own socket and accept queue and
+    the kernel spreads connections across them.
+    
+    Args:
+        host: Address to listen on
+        port: Port to listen on
+    
+    Returns:
+        Bound, listening socket
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.bind((host, port))
+        sock.listen(2048)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def merge_stats(snapshots: Iterable[dict]) -> dict:
+    """Add up the /metrics counters of several workers.
+    
+    Numbers are summed key by key, nested dicts are merged the same way and
+    ``hit_ratio`` is recomputed from the summed hits and misses.
+    
+    Args:
+        snapshots: /metrics dicts of the workers
+    
+    Returns:
+        dict of the same shape with the totals
+    """
+    merged: dict = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if isinstance(value, dict):
+                merged[key] = merge_stats([merged.get(key, {}), value])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, value)
+    if "hit_ratio" in merged:
+        lookups = merged.get("hits", 0) + merged.get("misses", 0)
+        merged["hit_ratio"] = merged.get("hits", 0) / lookups if lookups else 0.0
+    return merged
+
+
+class WorkerStats:
+    """Shares each worker's /metrics counters with the other workers.
+    
+    Every worker writes its counters to ``<directory>/<pid>.json`` once per
+    ``interval`` seconds. Any worker answers /metrics by adding its own live
+    counters to the last published counters of the others, so the endpoint
+    reports the whole server no matter which worker accepted the connection.
+    """
+    
+    def __init__(self, directory: str, interval: float = 1.0):
+        """Initialize worker stats sharing.
+        
+        Args:
+            directory: Directory shared by the workers of one launcher
+            interval: Seconds between publications
+        """
+        self.directory = directory
+        self.interval = interval
+        self.pid = os.getpid()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self, snapshot: Callable[[], dict]) -> None:
+        """Start publishing this worker's counters on the running event loop.
+        
+        Args:
+            snapshot: Returns this worker's current /metrics dict
+        """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(snapshot))
+    
+    async def stop(self) -> None:
+        """Stop publishing and remove this worker's counters."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        remove_worker_stats(self.directory, self.pid)
+    
+    def publish(self, stats: dict) -> None:
+        """Write this worker's counters, replacing the previous ones atomically."""
+        path = os.path.join(self.directory, f"{self.pid}.json")
+        temp = f"{path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(stats, f)
+        os.replace(temp, path)
+    
+    def collect(self, own: dict) -> dict:
+        """Return the counters of all workers added up.
+        
+        Args:
+            own: This worker's current /metrics dict
+        
+        Returns:
+            Merged counters, with ``workers`` set to the number of workers counted
+        """
+        snapshots = [own]
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith(".json") or name == f"{self.pid}.json":
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Worker exiting, or replaced while we read it
+                continue
+        merged = merge_stats(snapshots)
+        merged["workers"] = len(snapshots)
+        return merged
+    
+    async def _run(self, snapshot: Callable[[], dict]) -> None:
+        while True:
+            try:
+                self.publish(snapshot())
+            except OSError as e:
+                logger.warning("Cannot publish worker stats to %s: %s", self.directory, e)
+            await asyncio.sleep(self.interval)
+
+
+def remove_worker_stats(directory: str, pid: int) -> None:
+    """Remove the published counters of a worker that exited."""
+    try:
+        os.unlink(os.path.join(directory, f"{pid}.json"))
+    except OSError:
+        pass
+
+
+class Supervisor:
+    """Forks worker processes and replaces the ones that die.
+    
+    The parent never serves requests: it only forks, reaps and restarts
+    workers, and forwards SIGTERM/SIGINT to them on shutdown. A worker that
+    dies within ``min_uptime`` seconds of starting is restarted after a
+    ``min_uptime`` pause, so a worker that crashes on startup does not spin.
+    """
+    
+    def __init__(
+        self,
+        target: Callable[[], int],
+        workers: int,
+        min_uptime: float = 1.0,
+        on_exit: Optional[Callable[[int], None]] = None,
+    ):
+        """Initialize the supervisor.
+        
+        Args:
+            target: Runs a worker in the child process and returns its exit code
+            workers: Number of worker processes to keep running
+            min_uptime: Seconds a worker must live to be restarted without a pause
+            on_exit: Called in the parent with the pid of every worker that exited
+        """
+        self.target = target
+        self.workers = workers
+        self.min_uptime = min_uptime
+        self.on_exit = on_exit
+        self.restarts = 0
+        self.stopping = False
+        # Start time of each running worker, by pid
+        self.children: Dict[int, float] = {}
+    
+    def run(self, install_signals: bool = True) -> None:
+        """Start the workers and supervise them until ``stop()``.
+        
+        Args:
+            install_signals: Stop on SIGTERM and SIGINT (main thread only)
+        """
+        if install_signals:
+            signal.signal(signal.SIGTERM, self._on_signal)
+            signal.signal(signal.SIGINT, self._on_signal)
+        for _ in range(self.workers):
+            self._spawn()
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            if self.on_exit is not None:
+                self.on_exit(pid)
+            if self.stopping:
+                continue
+            logger.warning("Worker %d exited with status %d, restarting", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < self.min_uptime:
+                time.sleep(self.min_uptime)
+            if not self.stopping:
+                self.restarts += 1
+                self._spawn()
+    
+    def stop(self) -> None:
+        """Ask every worker to exit; ``run()`` returns once they have."""
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    def _on_signal(self, signum, frame) -> None:
+        self.stop()
+    
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                code = self.target()
+            except BaseException:
+                logger.exception("Worker crashed")
+            finally:
+                os._exit(code or 0)
+        self.children[pid] = time.monotonic()
+
+
+def run(
+    app,
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int = 1,
+    warmup: Optional[Callable[[], None]] = None,
+    zero_copy: bool = False,
+    loop: str = "auto",
+) -> None:
+    """Serve an ASGI app with one or more pre-forked uvicorn workers.
+    
+    ``warmup`` runs once in the parent before forking, so whatever it loads
+    (signing keys, cached segments) is shared copy-on-write by all workers
+    instead of being built by each one. With more than one worker each
+    worker binds its own SO_REUSEPORT socket (or shares the parent's where
+    SO_REUSEPORT is unavailable), crashed workers are restarted and
+    /metrics adds up the counters of all workers.
+    
+    With ``zero_copy`` the workers use an HTTP protocol offering the ASGI
+    zero-copy send extension, so files are sent with ``sendfile()``. The
+    extension is only offered on asyncio's own event loop (``loop`` set to
+    "asyncio"); on uvloop the protocol behaves like uvicorn's own.
+    
+    Args:
+        app: ASGI application
+        host: Address to listen on
+        port: Port to listen on
+        workers: Number of worker processes
+        warmup: Loads shared state before the workers start
+        zero_copy: Offer the zero-copy send extension
+        loop: uvicorn event loop ("auto", "asyncio" or "uvloop")
+    """
+    import uvicorn
+    
+    options = {"loop": loop}
+    if zero_copy:
+        try:
+            from zerocopy import ZeroCopyHttpToolsProtocol
+        except ImportError as e:
+            logger.warning("Zero-copy sends unavailable: %s", e)
+        else:
+            options["http"] = ZeroCopyHttpToolsProtocol
+    if warmup is not None:
+        warmup()
+    if workers <= 1:
+        uvicorn.run(app, host=host, port=port, **options)
+        return
+    
+    shared: List[socket.socket] = []
+    if hasattr(socket, "SO_REUSEPORT"):
+        # Fail here rather than in every worker if the port is taken
+        bind_socket(host, port).close()
+    else:
+        shared.append(bind_socket(host, port))
+    
+    stats_dir = tempfile.mkdtemp(prefix="hulagirl-workers-")
+    os.environ[STATS_DIR_ENV] = stats_dir
+    
+    def serve() -> int:
+        sockets = shared or [bind_socket(host, port)]
+        server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, **options))
+        server.run(sockets=sockets)
+        return 0 if server.started else 1
+    
+    supervisor = Supervisor(serve, workers, on_exit=lambda pid: remove_worker_stats(stats_dir, pid))
+    logger.info("Starting %d workers on %s:%d", workers, host, port)
+    try:
+        supervisor.run()
+    finally:
+        for sock in shared:
+            sock.close()
+        for name in os.listdir(stats_dir):
+            os.unlink(os.path.join(stats_dir, name))
+        os.rmdir(stats_dir)
@@ -0,0 +1,335 @@
+"""Segment responses with headers rendered once per file version."""
+
+import secrets
+from email.utils import formatdate
+from typing import Callable, List, Optional, Tuple, Union
+
+from anyio import to_thread
+from fastapi.responses import Response
+
+
+SEGMENT_MEDIA_TYPE = "video/mp2t"
+SEGMENT_CACHE_CONTROL = "public, max-age=10, immutable"
+
+# ASGI extension for handing a file to the server to send with sendfile()
+ZEROCOPY_SEND = "http.response.zerocopysend"
+
+# Read size of the chunked fallback
+CHUNK_SIZE = 256 * 1024
+
+# Requests with more ranges than this get the whole segment (RFC 9110 allows ignoring Range)
+MAX_RANGES = 16
+
+# Separator of multipart/byteranges parts; never inside a part header, and segments are binary
+_BOUNDARY = secrets.token_hex(12)
+
+RawHeaders = List[Tuple[bytes, bytes]]
+
+# Half-open (start, end) byte range
+ByteRange = Tuple[int, int]
+
+# Body of a partial response: literal bytes (multipart framing) or a range of the segment
+BodyPiece = Union[bytes, ByteRange]
+
+
+def segment_headers(size: int, mtime_ns: int) -> RawHeaders:
+    """Render the response headers of a full segment.
+    
+    Args:
+        size: Segment size in bytes
+        mtime_ns: Modification time of the segment file
+    
+    Returns:
+        Raw ASGI header list
+    """
+    return [
+        (b"content-length", str(size).encode("latin-1")),
+        (b"content-type", SEGMENT_MEDIA_TYPE.encode("latin-1")),
+        (b"cache-control", SEGMENT_CACHE_CONTROL.encode("latin-1")),
+        (b"last-modified", formatdate(mtime_ns / 1e9, usegmt=True).encode("latin-1")),
+        (b"accept-ranges", b"bytes"),
+    ]
+
+
+def parse_range(value: str, size: int) -> Optional[List[ByteRange]]:
+    """Parse a Range header against the size of a segment (RFC 9110 14.1.2).
+    
+    Args:
+        value: Range header, e.g. "bytes=0-499", "bytes=500-" or "bytes=-500,0-0"
+        size: Segment size in bytes
+    
+    Returns:
+        Satisfiable ranges as half-open (start, end) pairs in request
+        order; an empty list if none is satisfiable (416); or None if the
+        header must be ignored and the whole segment sent (another unit,
+        invalid syntax or more than MAX_RANGES ranges)
+    """
+    unit, equals, specs = value.partition("=")
+    if not equals or unit.strip().lower() != "bytes":
+        return None
+    specs = [spec.strip() for spec in specs.split(",") if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or (first and not _is_digits(first)) or (last and not _is_digits(last)):
+            return None
+        if not first:
+            if not last:
+                return None
+            # Suffix range: the final N bytes
+            start, end = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = min(int(last) + 1, size) if last else size
+        if start < end:
+            ranges.append((start, end))
+    return ranges
+
+
+def if_range_matches(if_range: Optional[str], headers: RawHeaders) -> bool:
+    """Check whether a Range header applies under If-Range (RFC 9110 13.1.5).
+    
+    Segments carry no ETag, so only their exact Last-Modified date matches.
+    
+    Args:
+        if_range: If-Range header, or None
+        headers: Pre-rendered segment headers
+    
+    Returns:
+        True if ranges may be served, False if the whole segment must be sent
+    """
+    if if_range is None:
+        return True
+    value = if_range.strip().encode("latin-1", "replace")
+    return (b"last-modified", value) in headers
+
+
+def range_not_satisfiable(size: int) -> Response:
+    """Build the 416 response for a Range header no byte of the segment matches."""
+    return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+
+def partial_layout(ranges: List[ByteRange], size: int, headers: RawHeaders) -> Tuple[RawHeaders, List[BodyPiece]]:
+    """Lay out a 206 response for one or more ranges of a segment.
+    
+    Args:
+        ranges: Satisfiable ranges from ``parse_range``
+        size: Segment size in bytes
+        headers: Pre-rendered headers of the full segment
+    
+    Returns:
+        (headers of the 206 response, body pieces in order)
+    """
+    content_type = SEGMENT_MEDIA_TYPE.encode("latin-1")
+    kept = [(name, value) for name, value in headers if name not in (b"content-length", b"content-type")]
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return [
+            (b"content-length", str(end - start).encode("latin-1")),
+            (b"content-type", content_type),
+            (b"content-range", f"bytes {start}-{end - 1}/{size}".encode("latin-1")),
+        ] + kept, [ranges[0]]
+    pieces: List[BodyPiece] = []
+    length = 0
+    for start, end in ranges:
+        part_header = (
+            f"\r\n--{_BOUNDARY}\r\n"
+            f"content-type: {SEGMENT_MEDIA_TYPE}\r\n"
+            f"content-range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        pieces += [part_header, (start, end)]
+        length += len(part_header) + end - start
+    closing = f"\r\n--{_BOUNDARY}--\r\n".encode("latin-1")
+    pieces.append(closing)
+    length += len(closing)
+    return [
+        (b"content-length", str(length).encode("latin-1")),
+        (b"content-type", f"multipart/byteranges; boundary={_BOUNDARY}".encode("latin-1")),
+    ] + kept, pieces
+
+
+class PreparedResponse(Response):
+    """Response that sends a body with headers rendered ahead of time.
+    
+    Skips ``Response.init_headers`` so a cache hit costs no header encoding.
+    """
+    
+    def __init__(self, body: bytes, raw_headers: RawHeaders, status_code: int = 200):
+        """Initialize the response.
+        
+        Args:
+            body: Response body
+            raw_headers: Pre-rendered headers; copied so callers may add to them
+            status_code: HTTP status code
+        """
+        self.status_code = status_code
+        self.body = body
+        self.background = None
+        self.raw_headers = list(raw_headers)
+
+
+class PartialResponse(Response):
+    """206 response with ranges of an in-memory segment.
+    
+    The ranges are sent as ``memoryview`` slices of the cached bytes, so no
+    range is copied before it reaches the server.
+    """
+    
+    def __init__(self, data: bytes, ranges: List[ByteRange], raw_headers: RawHeaders):
+        """Initialize the response.
+        
+        Args:
+            data: Full segment bytes
+            ranges: Satisfiable ranges from ``parse_range``
+            raw_headers: Pre-rendered headers of the full segment
+        """
+        self.status_code = 206
+        self.background = None
+        self.data = memoryview(data)
+        self.raw_headers, self.pieces = partial_layout(ranges, len(data), raw_headers)
+    
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        last = len(self.pieces) - 1
+        for i, piece in enumerate(self.pieces):
+            body = piece if isinstance(piece, bytes) else self.data[piece[0]:piece[1]]
+            await send({"type": "http.response.body", "body": body, "more_body": i < last})
+
+
+class MappedResponse(PartialResponse):
+    """Response with a memory-mapped media file or stored bytes, whole or in ranges.
+    
+    Bytes are sent as ``memoryview`` slices of the mapping of at most
+    CHUNK_SIZE each, so a large file is neither copied nor queued in the
+    transport's buffer in full: the server waits for the socket to drain
+    between slices.
+    """
+    
+    def __init__(self, data: memoryview, raw_headers: RawHeaders, ranges: Optional[List[ByteRange]] = None):
+        """Initialize the response.
+        
+        Args:
+            data: Mapped file bytes, or bytes from a storage backend
+            raw_headers: Pre-rendered headers of the full file
+            ranges: Satisfiable ranges from ``parse_range``, or None for the whole file
+        """
+        if ranges:
+            super().__init__(data, ranges, raw_headers)
+            return
+        self.status_code = 200
+        self.background = None
+        self.data = memoryview(data)
+        self.raw_headers = list(raw_headers)
+        self.pieces = [(0, len(data))]
+    
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        chunks = []
+        for piece in self.pieces:
+            if isinstance(piece, bytes):
+                chunks.append(piece)
+                continue
+            start, end = piece
+            chunks += [self.data[offset:min(offset + CHUNK_SIZE, end)] for offset in range(start, end, CHUNK_SIZE)]
+        if not chunks:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        last = len(chunks) - 1
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < last})
+
+
+class SendfileResponse(Response):
+    """Response that sends a file with ``sendfile()`` when the server allows it.
+    
+    If the server offers the ASGI ``http.response.zerocopysend`` extension,
+    the open file is handed to the server, which copies it to the socket in
+    the kernel. Otherwise the file is read in chunks on a worker thread.
+    With ``ranges`` a 206 response is sent, each range read from its offset.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        raw_headers: RawHeaders,
+        on_send: Optional[Callable[[bool], None]] = None,
+        ranges: Optional[List[ByteRange]] = None,
+    ):
+        """Initialize the response.
+        
+        Args:
+            path: File to send
+            size: File size, as announced in the pre-rendered headers
+            raw_headers: Pre-rendered headers of the full file
+            on_send: Called with True for a zero-copy send, False for chunked reads
+            ranges: Satisfiable ranges from ``parse_range``, or None for the whole file
+        """
+        self.path = path
+        self.size = size
+        self.background = None
+        self.on_send = on_send
+        if ranges:
+            self.status_code = 206
+            self.raw_headers, self.pieces = partial_layout(ranges, size, raw_headers)
+        else:
+            self.status_code = 200
+            self.raw_headers = list(raw_headers)
+            self.pieces = [(0, size)]
+    
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            f = await to_thread.run_sync(open, self.path, "rb")
+        except OSError:
+            # Removed since it was looked up
+            await Response('{"detail":"File not found"}', 404, media_type="application/json")(scope, receive, send)
+            return
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b""})
+                return
+            zero_copy = ZEROCOPY_SEND in scope.get("extensions", {})
+            if self.on_send is not None:
+                self.on_send(zero_copy)
+            last = len(self.pieces) - 1
+            for i, piece in enumerate(self.pieces):
+                more_body = i < last
+                if isinstance(piece, bytes):
+                    await send({"type": "http.response.body", "body": piece, "more_body": more_body})
+                    continue
+                start, end = piece
+                if zero_copy:
+                    await send({
+                        "type": ZEROCOPY_SEND,
+                        "file": f,
+                        "offset": start,
+                        "count": end - start,
+                        "more_body": more_body,
+                    })
+                    continue
+                await to_thread.run_sync(f.seek, start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = await to_thread.run_sync(f.read, min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": more_body or remaining > 0})
+        finally:
+            await to_thread.run_sync(f.close)
+
+
+def _is_digits(value: str) -> bool:
+    return value.isascii() and value.isdigit()
@@ -0,0 +1,441 @@
+"""In-process cache of HLS segment bytes."""
+
+import asyncio
+import os
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from anyio import to_thread
+
+from clock import CoarseClock
+from responses import segment_headers
+
+
+# (st_ino, st_mtime_ns, st_size): changes when a file is rewritten or replaced by rename
+FileVersion = Tuple[int, int, int]
+
+
+class CachedSegment:
+    """Segment bytes plus the file version they were read from and their headers.
+    
+    ``data`` is a memoryview into the cache's store (the shared segment
+    store or the segment log) when ``ticket`` is set, and private bytes
+    otherwise.
+    """
+    
+    __slots__ = ("data", "version", "fresh_until", "headers", "ticket")
+    
+    def __init__(self, data: bytes, version: FileVersion, fresh_until: int, ticket: Optional[int] = None):
+        self.data = data
+        self.version = version
+        self.fresh_until = fresh_until
+        self.headers = segment_headers(len(data), version[1])
+        self.ticket = ticket
+
+
+class OversizedSegment:
+    """A segment too large to cache, to be streamed from its file instead."""
+    
+    __slots__ = ("path", "version", "size", "headers")
+    
+    def __init__(self, path: str, version: FileVersion):
+        self.path = path
+        self.version = version
+        self.size = version[2]
+        self.headers = segment_headers(self.size, version[1])
+
+
+class AppendBuffer:
+    """Bytes of a segment the packager is still writing.
+    
+    Chunks are appended as the watcher reads them and ``stream()`` yields
+    them to any number of readers, each waiting for the next chunk until
+    the segment is finished. A buffer dropped before the segment was
+    finished is abandoned and its readers fail instead of ending early.
+    """
+    
+    __slots__ = ("chunks", "size", "complete", "abandoned", "_waiters")
+    
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.complete = False
+        self.abandoned = False
+        self._waiters: List[asyncio.Future] = []
+    
+    def append(self, data: bytes) -> None:
+        """Add bytes written by the packager and wake waiting readers."""
+        if self.complete or not data:
+            return
+        self.chunks.append(data)
+        self.size += len(data)
+        self._wake()
+    
+    def finish(self) -> None:
+        """Mark the segment complete; readers end after the last chunk."""
+        self.complete = True
+        self._wake()
+    
+    def abandon(self) -> None:
+        """Give up on the segment; readers fail after the chunks they already have."""
+        self.abandoned = True
+        self.finish()
+    
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yield the segment from its first byte, following appends until complete.
+        
+        Raises:
+            OSError: If the buffer is abandoned before the segment is finished
+        """
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.abandoned:
+                raise OSError("segment was dropped before it was finished")
+            if self.complete:
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+    
+    def _wake(self) -> None:
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def file_version(st: os.stat_result) -> FileVersion:
+    """Return the (inode, mtime_ns, size) triple used to detect a changed file."""
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class SegmentCache:
+    """Byte-budgeted LRU cache of immutable segment bytes.
+    
+    Entries follow the segments' ``Cache-Control: public, max-age=10,
+    immutable``: for ``ttl`` seconds after loading they are served straight
+    from memory, afterwards one ``stat()`` confirms the file is unchanged
+    before they are served again. Least recently used entries are evicted
+    once the total size exceeds ``max_bytes``.
+    
+    While a watcher keeps the cache current, ``index`` is the watcher's map
+    of finished files: cached entries are served without revalidation and
+    paths missing from the index are reported absent without a syscall.
+    The watcher also feeds segments that are still being written into
+    ``growing``, from which they can be streamed before they are finished.
+    Their bytes count against ``max_bytes`` as well: a growing segment
+    larger than ``max_item_bytes``, or the oldest one once cached segments
+    cannot be evicted any further, is abandoned, so a write that is never
+    closed cannot hold memory indefinitely.
+    
+    Concurrent misses for the same segment share one read: the first starts
+    it and the others wait for its result.
+    
+    With a ``store`` (a ``SharedSegmentStore`` shared by the worker
+    processes, or a ``SegmentLog``), segment bytes live in the store and
+    entries only hold views of them. A miss first looks for the file
+    version in the store, which another worker may have put there or
+    which may have been evicted from the cache but is still logged, and
+    an entry whose bytes the store has since reused is dropped.
+    """
+    
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: int = 10,
+        max_item_bytes: Optional[int] = None,
+        clock: Optional[CoarseClock] = None,
+        store=None,
+    ):
+        """Initialize an empty cache.
+        
+        Args:
+            max_bytes: Memory ceiling for cached segment bytes (0 disables caching)
+            ttl: Seconds an entry is served without revalidation
+            max_item_bytes: Largest segment that is cached (default max_bytes // 8)
+            clock: Shared coarse clock (a non-ticking one by default)
+            store: SharedSegmentStore or SegmentLog holding the bytes, if any
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_item_bytes = max_bytes // 8 if max_item_bytes is None else max_item_bytes
+        self.clock = clock or CoarseClock()
+        self.store = store
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.streamed = 0
+        self.uncached = 0
+        self.coalesced = 0
+        self.sent_zero_copy = 0
+        self.sent_chunked = 0
+        self.index: Optional[Dict[str, FileVersion]] = None
+        # Segments being written, by path, until the watcher publishes them
+        self.growing: Dict[str, AppendBuffer] = {}
+        self.growing_bytes = 0
+        # Growing segments given up on; ignored until they are finished or removed
+        self._abandoned: Set[str] = set()
+        self._entries: "OrderedDict[str, CachedSegment]" = OrderedDict()
+        # Headers of files too large to cache, rendered once per version
+        self._oversized: Dict[str, OversizedSegment] = {}
+        self._started: Dict[str, List[asyncio.Future]] = {}
+        # Reads in progress, by path, shared by every request that misses meanwhile
+        self._loading: Dict[str, "asyncio.Task[Optional[CachedSegment]]"] = {}
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+    
+    async def fetch(self, path: str) -> Union[CachedSegment, OversizedSegment, None]:
+        """Return a segment, from memory when possible.
+        
+        Segments larger than ``max_item_bytes`` are never read into memory;
+        the caller streams them from disk instead. Either way the result
+        carries response headers rendered once per file version.
+        
+        Args:
+            path: Absolute path of the segment file (also the cache key)
+        
+        Returns:
+            CachedSegment with the bytes, OversizedSegment for a file too
+            large to cache, or None if the file does not exist
+        """
+        entry = self._entries.get(path)
+        if entry is not None and entry.ticket is not None and not self.store.valid(entry.ticket):
+            # The store is about to reuse the bytes: look the segment up again
+            del self._entries[path]
+            self.size_bytes -= len(entry.data)
+            entry = None
+        if self.index is not None:
+            if entry is not None:
+                return self._hit(path, entry)
+            # Finished but evicted (or too large to cache): read it again
+            version = self.index.get(path)
+            if version is None:
+                return None
+        else:
+            now = self.clock.now()
+            if entry is not None and now < entry.fresh_until:
+                return self._hit(path, entry)
+            
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.invalidate(path)
+                return None
+            version = file_version(st)
+            if entry is not None and entry.version == version:
+                entry.fresh_until = now + self.ttl
+                return self._hit(path, entry)
+        
+        if version[2] > self.max_item_bytes:
+            self.misses += 1
+            self.uncached += 1
+            oversized = self._oversized.get(path)
+            if oversized is None or oversized.version != version:
+                self.invalidate(path)
+                oversized = self._oversized[path] = OversizedSegment(path, version)
+            return oversized
+        
+        if self.store is not None:
+            shared = self.store.get(path, version)
+            if shared is not None:
+                self.misses += 1
+                data, ticket = shared
+                return self._insert(path, CachedSegment(data, version, self.clock.now() + self.ttl, ticket))
+        
+        loading = self._loading.get(path)
+        if loading is None:
+            self.misses += 1
+            # A task of its own, so a disconnecting first requester does not cancel the others' read
+            loading = self._loading[path] = asyncio.get_running_loop().create_task(self._load(path, version))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(loading)
+    
+    async def open_stream(self, path: str, timeout: float = 0) -> Optional[AppendBuffer]:
+        """Return the buffer of a segment that is still being written.
+        
+        Args:
+            path: Absolute path of the segment file
+            timeout: Seconds to wait for the packager to start writing the
+                segment (for preload hints); only used while a watcher runs
+        
+        Returns:
+            AppendBuffer, or None if the segment is not being written
+        """
+        buffer = self.growing.get(path)
+        if buffer is None and timeout > 0 and self.index is not None and path not in self.index:
+            waiter = asyncio.get_running_loop().create_future()
+            self._started.setdefault(path, []).append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                waiters = self._started.get(path)
+                if waiters is not None and waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self._started[path]
+            buffer = self.growing.get(path)
+        if buffer is not None:
+            self.streamed += 1
+        return buffer
+    
+    def grow(self, path: str, data: bytes) -> None:
+        """Append bytes the packager wrote to a segment that is not finished yet.
+        
+        Args:
+            path: Absolute path of the segment file
+            data: Newly appended bytes
+        """
+        if path in self._abandoned:
+            return
+        buffer = self.growing.get(path)
+        if buffer is None:
+            buffer = self.growing[path] = AppendBuffer()
+        if buffer.size + len(data) > self.max_item_bytes:
+            self._abandon(path)
+            return
+        buffer.append(data)
+        self.growing_bytes += len(data)
+        self._wake_started(path)
+        self._evict()
+    
+    def put(self, path: str, data: bytes, version: FileVersion) -> CachedSegment:
+        """Store a segment, evicting least recently used entries as needed.
+        
+        Args:
+            path: Absolute path of the segment file
+            data: Segment bytes
+            version: (inode, mtime_ns, size) of the file the bytes came from
+        
+        Returns:
+            The new entry (not kept if larger than ``max_item_bytes``)
+        """
+        self._abandoned.discard(path)
+        buffer = self.growing.pop(path, None)
+        if buffer is not None:
+            self.growing_bytes -= buffer.size
+            # Readers of the growing segment get whatever the watcher had not passed on yet
+            buffer.append(data[buffer.size:])
+            buffer.finish()
+        self._wake_started(path)
+        self.invalidate(path)
+        if len(data) > self.max_item_bytes:
+            return CachedSegment(data, version, self.clock.now() + self.ttl)
+        ticket = None
+        if self.store is not None:
+            shared = self.store.put(path, data, version)
+            if shared is not None:
+                data, ticket = shared
+        return self._insert(path, CachedSegment(data, version, self.clock.now() + self.ttl, ticket))
+    
+    def invalidate(self, path: str) -> None:
+        """Drop a segment from the cache if present."""
+        self._abandoned.discard(path)
+        if path in self.growing:
+            self._abandon(path)
+            self._abandoned.discard(path)
+        self._oversized.pop(path, None)
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size_bytes -= len(entry.data)
+    
+    def record_send(self, zero_copy: bool) -> None:
+        """Count how a segment too large to cache was sent from its file."""
+        if zero_copy:
+            self.sent_zero_copy += 1
+        else:
+            self.sent_chunked += 1
+    
+    def stats(self) -> dict:
+        """Return cache counters.
+        
+        Returns:
+            dict with hits, misses, hit_ratio, bytes_served, size_bytes,
+            max_bytes, entries, growing (segments being written),
+            growing_bytes, streamed (requests answered from a growing
+            segment), uncached (requests for segments too large to cache),
+            coalesced (misses that waited for another request's read), and
+            sent_zero_copy and sent_chunked (how uncached segments were sent)
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "bytes_served": self.bytes_served,
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "entries": len(self._entries),
+            "growing": len(self.growing),
+            "growing_bytes": self.growing_bytes,
+            "streamed": self.streamed,
+            "uncached": self.uncached,
+            "coalesced": self.coalesced,
+            "sent_zero_copy": self.sent_zero_copy,
+            "sent_chunked": self.sent_chunked,
+        }
+    
+    def _evict(self) -> None:
+        """Evict least recently used segments, then growing ones, until within budget."""
+        while self.size_bytes + self.growing_bytes > self.max_bytes:
+            if self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted.data)
+            else:
+                self._abandon(next(iter(self.growing)))
+    
+    def _abandon(self, path: str) -> None:
+        buffer = self.growing.pop(path)
+        self.growing_bytes -= buffer.size
+        self._abandoned.add(path)
+        buffer.abandon()
+    
+    def _wake_started(self, path: str) -> None:
+        for waiter in self._started.pop(path, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+    
+    async def _load(self, path: str, version: FileVersion) -> Optional[CachedSegment]:
+        try:
+            data = await to_thread.run_sync(_read_file, path)
+        except OSError:
+            self.invalidate(path)
+            return None
+        finally:
+            self._loading.pop(path, None)
+        return self.put(path, data, version)
+    
+    def _insert(self, path: str, entry: CachedSegment) -> CachedSegment:
+        replaced = self._entries.pop(path, None)
+        if replaced is not None:
+            # A stale version of the same file (e.g. replaced after its TTL)
+            self.size_bytes -= len(replaced.data)
+        self._entries[path] = entry
+        self.size_bytes += len(entry.data)
+        self._evict()
+        return entry
+    
+    def _hit(self, path: str, entry: CachedSegment) -> CachedSegment:
+        self._entries.move_to_end(path)
+        self.hits += 1
+        self.bytes_served += len(entry.data)
+        return entry
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
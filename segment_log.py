@@ -0,0 +1,204 @@
+"""Segment bytes kept in rotating append-only log files."""
+
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from segment_cache import FileVersion
+
+
+logger = logging.getLogger(__name__)
+
+# sequence, offset (absolute position in the log), length, mtime_ns
+_RECORD = struct.Struct("<QQQq")
+
+
+class SegmentLog:
+    """Rotating append-only log files of segment bytes with a fixed-size index.
+    
+    Segments are appended back to back to the current log file, a file of
+    ``file_bytes`` mapped into memory. A segment that does not fit starts
+    the next file, and once there are more than ``files`` files the oldest
+    one is dropped whole, which is all retention costs. Every segment gets
+    the next sequence number and a (sequence, offset, length, mtime) record
+    in slot ``sequence % slots`` of a fixed-size array, and a dict maps each
+    path to its latest sequence. A lookup is one dict lookup, one record and
+    a ``memoryview`` slice of the mapping, without any syscall.
+    
+    Log files are unlinked as soon as they are created, so they disappear
+    with the process. Each process appends to log files of its own: a
+    worker forked by the pre-fork launcher keeps reading what the launcher
+    logged while warming up, but appends to a new file.
+    
+    Plugs into ``SegmentCache`` as its ``store``, like ``SharedSegmentStore``.
+    """
+    
+    def __init__(self, directory: str, file_bytes: int = 64 * 1024 * 1024, files: int = 4, slots: int = 4096):
+        """Initialize an empty log.
+        
+        Args:
+            directory: Directory the log files are created in
+            file_bytes: Size of each log file
+            files: Number of log files kept before the oldest is dropped
+            slots: Number of index records
+        """
+        self.directory = directory
+        self.file_bytes = file_bytes
+        self.files = files
+        self.slots = slots
+        self.max_item_bytes = file_bytes
+        self._index = bytearray(slots * _RECORD.size)
+        # Path of the record in each slot, and latest sequence of each path
+        self._slot_paths: List[Optional[str]] = [None] * slots
+        self._paths: Dict[str, int] = {}
+        # Mapped log files by number, oldest first
+        self._files: "OrderedDict[int, memoryview]" = OrderedDict()
+        self._sequence = 0
+        self._position = 0
+        # Log position where the oldest log file kept starts
+        self._retained = 0
+        self._reset_counters()
+        os.register_at_fork(after_in_child=self._after_fork)
+    
+    def get(self, path: str, version: FileVersion) -> Optional[Tuple[memoryview, int]]:
+        """Look up the latest logged copy of a file version.
+        
+        Args:
+            path: Absolute path of the segment file
+            version: (inode, mtime_ns, size) the bytes must come from
+        
+        Returns:
+            (bytes as a memoryview of the log, ticket for ``valid``), or None
+        """
+        found = self._lookup(path, version)
+        if found is not None:
+            self.found += 1
+        return found
+    
+    def put(self, path: str, data: bytes, version: FileVersion) -> Optional[Tuple[memoryview, int]]:
+        """Append a segment to the log unless this version is already logged.
+        
+        Args:
+            path: Absolute path of the segment file
+            data: Segment bytes
+            version: (inode, mtime_ns, size) of the file the bytes came from
+        
+        Returns:
+            (logged bytes as a memoryview, ticket for ``valid``), or None if
+            the segment is larger than a log file or no log file could be
+            created (the disk is full); the cache then keeps the bytes itself
+        """
+        size = len(data)
+        if size > self.file_bytes:
+            self.oversized += 1
+            return None
+        found = self._lookup(path, version)
+        if found is not None:
+            return found
+        
+        number, offset = divmod(self._position, self.file_bytes)
+        if offset + size > self.file_bytes:
+            number, offset = number + 1, 0
+        try:
+            view = self._file(number)
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            logger.warning("Cannot create segment log file in %s: %s", self.directory, e)
+            return None
+        view[offset:offset + size] = data
+        position = number * self.file_bytes + offset
+        self._position = position + size
+        
+        sequence = self._sequence
+        self._sequence += 1
+        slot = sequence % self.slots
+        # The record about to be overwritten may be its path's latest
+        replaced = self._slot_paths[slot]
+        if replaced is not None and self._paths.get(replaced) == sequence - self.slots:
+            del self._paths[replaced]
+        _RECORD.pack_into(self._index, slot * _RECORD.size, sequence, position, size, version[1])
+        self._slot_paths[slot] = path
+        self._paths[path] = sequence
+        self.appended += 1
+        return view[offset:offset + size], sequence
+    
+    def valid(self, ticket: int) -> bool:
+        """Check that an entry handed out by ``get`` or ``put`` is still in the log.
+        
+        Args:
+            ticket: Ticket returned with the entry
+        
+        Returns:
+            True until the entry's record is reused or its log file dropped
+        """
+        sequence, position, _, _ = _RECORD.unpack_from(self._index, (ticket % self.slots) * _RECORD.size)
+        return sequence == ticket and position >= self._retained
+    
+    def stats(self) -> dict:
+        """Return log counters.
+        
+        Returns:
+            dict with appended, found (misses answered from the log),
+            files (log files open), bytes (log bytes used up to the
+            append position),
+            dropped_files, oversized and errors
+        """
+        return {
+            "appended": self.appended,
+            "found": self.found,
+            "files": len(self._files),
+            "bytes": self._position - self._retained,
+            "dropped_files": self.dropped_files,
+            "oversized": self.oversized,
+            "errors": self.errors,
+        }
+    
+    def _reset_counters(self) -> None:
+        self.appended = 0
+        self.found = 0
+        self.dropped_files = 0
+        self.oversized = 0
+        self.errors = 0
+    
+    def _after_fork(self) -> None:
+        """Move on to a new log file, since the parent's files are mapped shared with it."""
+        self._reset_counters()
+        number, offset = divmod(self._position, self.file_bytes)
+        if offset:
+            self._position = (number + 1) * self.file_bytes
+    
+    def _lookup(self, path: str, version: FileVersion) -> Optional[Tuple[memoryview, int]]:
+        sequence = self._paths.get(path)
+        if sequence is None:
+            return None
+        found, position, length, mtime_ns = _RECORD.unpack_from(self._index, (sequence % self.slots) * _RECORD.size)
+        if found != sequence or position < self._retained or (mtime_ns, length) != version[1:]:
+            return None
+        number, start = divmod(position, self.file_bytes)
+        return self._files[number][start:start + length], sequence
+    
+    def _file(self, number: int) -> memoryview:
+        """Return log file ``number``, creating it and dropping the oldest as needed."""
+        view = self._files.get(number)
+        if view is not None:
+            return view
+        with tempfile.TemporaryFile(dir=self.directory) as f:
+            if hasattr(os, "posix_fallocate"):
+                # Reserve every block now: a write into a hole of a full disk
+                # would raise SIGBUS in the worker instead of ENOSPC here
+                os.posix_fallocate(f.fileno(), 0, self.file_bytes)
+            else:
+                f.truncate(self.file_bytes)
+            # The mapping keeps the unlinked file alive after it is closed
+            view = memoryview(mmap.mmap(f.fileno(), self.file_bytes))
+        self._files[number] = view
+        while len(self._files) > self.files:
+            # Responses still sending from the dropped file keep its mapping until they finish
+            self._files.popitem(last=False)
+            self.dropped_files += 1
+        self._retained = next(iter(self._files)) * self.file_bytes
+        return view
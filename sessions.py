@@ -0,0 +1,142 @@
+"""Signed viewer session cookies issued at manifest time."""
+
+import base64
+import binascii
+import hmac
+import secrets
+from typing import Optional, Tuple
+
+from auth import TokenValidator, VerifiedTokenCache, decode_signature
+from clock import CoarseClock
+
+
+SESSION_COOKIE = "hg_session"
+
+# Session MACs sign "session:" + scope + sid + "." + exp, which never starts
+# with "/" or "prefix:", so no URL token can be replayed as a session.
+# They are signed with the key that signed the manifest's token.
+SESSION_MARKER = "session:"
+
+
+def session_scope(path: str) -> str:
+    """Return the stream directory a request path belongs to.
+    
+    Args:
+        path: Request path (e.g., "/live/segment001.ts")
+        
+    Returns:
+        Directory prefix with trailing slash (e.g., "/live/")
+    """
+    return path[:path.rfind("/") + 1].lower()
+
+
+class SessionTable:
+    """Issues and checks compact signed session cookies for a stream.
+    
+    The cookie value is ``<sid>.<exp>.<sig>``, followed by ``.<kid>`` (the
+    key id, base64url encoded) when the manifest's token was signed with a
+    rotated key. It is bound to the stream directory it was issued for and
+    signed with the validator's key of that id, so removing or replacing
+    the key in the key file ends its sessions too.
+    
+    Cookies issued or seen by this process are kept in a
+    ``VerifiedTokenCache``, so a segment request costs one dict lookup;
+    cookies from another worker or before a restart are verified by HMAC
+    once and then cached. The cache is dropped whenever the validator's
+    keys change.
+    """
+    
+    def __init__(self, validator: TokenValidator, max_entries: int = 4096, clock: Optional[CoarseClock] = None):
+        """Initialize the session table.
+        
+        Args:
+            validator: Token validator whose keys sign the sessions
+            max_entries: Maximum number of sessions kept in memory
+            clock: Shared coarse clock (the validator's by default)
+        """
+        self.validator = validator
+        self.clock = clock or validator.clock
+        self.sessions = VerifiedTokenCache(max_entries)
+        self._key_generation = validator.key_generation
+    
+    def issue(self, scope: str, exp: int, kid: Optional[str] = None) -> Optional[str]:
+        """Create a session cookie value for a stream directory.
+        
+        Args:
+            scope: Stream directory the session authorizes (e.g., "/live/")
+            exp: Session expiration timestamp (Unix time)
+            kid: Id of the key that signed the manifest's token, if any
+            
+        Returns:
+            Cookie value, or None if the key id is unknown
+        """
+        self._check_keys()
+        sid = secrets.token_hex(8)
+        digest = self._digest(scope, sid, exp, kid)
+        if digest is None:
+            return None
+        sig = base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+        cookie = f"{sid}.{exp}.{sig}"
+        if kid is not None:
+            cookie += "." + base64.urlsafe_b64encode(kid.encode('utf-8')).decode('ascii').rstrip('=')
+        self.sessions.add((cookie, scope), exp, self.clock.now())
+        return cookie
+    
+    def validate(self, cookie: str, path: str) -> bool:
+        """Check whether a session cookie authorizes a request path.
+        
+        Args:
+            cookie: Cookie value from the request
+            path: Request path
+            
+        Returns:
+            True if the cookie is valid, unexpired and bound to the path's stream
+        """
+        parsed = parse_session_cookie(cookie)
+        if parsed is None:
+            return False
+        sid, exp, sig, kid = parsed
+        now = self.clock.now()
+        if now > exp:
+            return False
+        
+        self._check_keys()
+        scope = session_scope(path)
+        key = (cookie, scope)
+        if self.sessions.contains(key, now):
+            return True
+        
+        provided = decode_signature(sig)
+        expected = self._digest(scope, sid, exp, kid)
+        if provided is None or expected is None or not hmac.compare_digest(provided, expected):
+            return False
+        self.sessions.add(key, exp, now)
+        return True
+    
+    def _check_keys(self) -> None:
+        # Sessions verified under the old keys must be verified again
+        if self._key_generation != self.validator.key_generation:
+            self._key_generation = self.validator.key_generation
+            self.sessions.clear()
+    
+    def _digest(self, scope: str, sid: str, exp: int, kid: Optional[str]) -> Optional[bytes]:
+        return self.validator.digest(f"{SESSION_MARKER}{scope}{sid}.", exp, kid)
+
+
+def parse_session_cookie(cookie: str) -> Optional[Tuple[str, int, str, Optional[str]]]:
+    """Split a session cookie value into (sid, exp, sig, kid).
+    
+    Returns:
+        The parts, with kid None for the default secret, or None if the
+        value is malformed
+    """
+    parts = cookie.split(".")
+    if len(parts) not in (3, 4) or not (parts[1].isascii() and parts[1].isdigit()):
+        return None
+    kid = None
+    if len(parts) == 4:
+        try:
+            kid = base64.urlsafe_b64decode(parts[3] + "=" * (-len(parts[3]) % 4)).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+    return parts[0], int(parts[1]), parts[2], kid
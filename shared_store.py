@@ -0,0 +1,207 @@
+"""Segment bytes shared by the worker processes of one server."""
+
+import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+from typing import Optional, Tuple
+
+from segment_cache import FileVersion
+
+
+# magic, cursor (total bytes ever allocated in the arena)
+_HEADER = struct.Struct("<8sQ")
+_HEADER_SIZE = 64
+_MAGIC = b"HGSEG001"
+
+# seq, key, ino, mtime_ns, size, offset (absolute position the bytes were written at), checksum
+_SLOT = struct.Struct("<Q16sQqQQ8s")
+_SLOT_SIZE = 64
+
+
+class SharedSegmentStore:
+    """Ring arena of segment bytes in a shared anonymous mapping.
+    
+    Created before the pre-fork launcher forks, the mapping is inherited by
+    every worker, so each hot segment is held once no matter how many
+    workers serve it. Workers serve entries zero-copy as ``memoryview``
+    slices of the mapping.
+    
+    The index is a fixed table of slots (two candidate slots per path hash)
+    in the same mapping. Writers take ``lock`` without waiting for it: a
+    worker that finds it busy does not publish the segment (it still caches
+    it itself), so the event loop never blocks on another process. A
+    worker that already finds the same file version stored skips the copy,
+    so whichever worker (or watcher) gets there first is the only one that
+    writes. Readers take no lock: each slot carries a sequence counter that
+    a writer makes odd while it updates the slot (a seqlock), and a reader
+    that sees it odd or changed treats the lookup as a miss.
+    
+    Plain stores into the mapping carry no memory barriers, so on a weakly
+    ordered CPU (ARM64) a reader in another process may see a slot's new
+    contents before the segment bytes it points to. Each slot therefore also
+    holds a checksum of the bytes, which a reader verifies after the second
+    sequence read; a torn read is a miss, never wrong bytes.
+    
+    Segment bytes are allocated round-robin from the arena. An entry stays
+    valid while at least ``guard`` bytes of arena lie between it and the
+    next allocation, so bytes already handed to a response are not
+    overwritten while they are being sent.
+    """
+    
+    def __init__(self, size: int, slots: int = 1024):
+        """Create the shared arena.
+        
+        Args:
+            size: Bytes of segment data the arena holds
+            slots: Number of index entries
+        """
+        self.size = size
+        self.slots = slots
+        self.guard = size // 4
+        # Largest entry: a quarter of the arena, so the guard leaves room for several
+        self.max_item_bytes = size // 4
+        self.lock = multiprocessing.Lock()
+        self._data_start = _HEADER_SIZE + slots * _SLOT_SIZE
+        self._map = mmap.mmap(-1, self._data_start + size)
+        self._view = memoryview(self._map)
+        _HEADER.pack_into(self._map, 0, _MAGIC, 0)
+        self._reset_counters()
+        # Workers count only their own work, not what the launcher stored while warming up
+        os.register_at_fork(after_in_child=self._reset_counters)
+    
+    def get(self, path: str, version: FileVersion) -> Optional[Tuple[memoryview, int]]:
+        """Look up a file version stored by any worker.
+        
+        Args:
+            path: Absolute path of the segment file
+            version: (inode, mtime_ns, size) the bytes must come from
+        
+        Returns:
+            (bytes as a memoryview, ticket for ``valid``), or None
+        """
+        found = self._lookup(_key(path), version)
+        if found is not None:
+            self.found += 1
+        return found
+    
+    def put(self, path: str, data: bytes, version: FileVersion) -> Optional[Tuple[memoryview, int]]:
+        """Store a segment unless another worker already stored this version.
+        
+        Args:
+            path: Absolute path of the segment file
+            data: Segment bytes
+            version: (inode, mtime_ns, size) of the file the bytes came from
+        
+        Returns:
+            (shared bytes as a memoryview, ticket for ``valid``), or None if
+            the segment is too large or another worker holds the lock
+        """
+        size = len(data)
+        if size > self.max_item_bytes:
+            return None
+        key = _key(path)
+        checksum = _checksum(data)
+        if not self.lock.acquire(block=False):
+            self.lock_busy += 1
+            return None
+        try:
+            found = self._lookup(key, version)
+            if found is not None:
+                self.deduplicated += 1
+                return found
+            
+            _, cursor = _HEADER.unpack_from(self._map, 0)
+            position = cursor % self.size
+            if position + size > self.size:
+                # Entries never wrap around the end of the arena
+                cursor += self.size - position
+                position = 0
+            # Move the cursor first so readers stop trusting what is about to be overwritten
+            _HEADER.pack_into(self._map, 0, _MAGIC, cursor + size)
+            start = self._data_start + position
+            self._map[start:start + size] = data
+            
+            slot = self._choose_slot(key)
+            offset = _HEADER_SIZE + slot * _SLOT_SIZE
+            seq = _SLOT.unpack_from(self._map, offset)[0]
+            struct.pack_into("<Q", self._map, offset, seq + 1)
+            _SLOT.pack_into(self._map, offset, seq + 1, key, version[0], version[1], version[2], cursor, checksum)
+            struct.pack_into("<Q", self._map, offset, seq + 2)
+            self.stored += 1
+            return self._view[start:start + size], cursor
+        finally:
+            self.lock.release()
+    
+    def valid(self, ticket: int) -> bool:
+        """Check that an entry handed out by ``get`` or ``put`` is still intact.
+        
+        Args:
+            ticket: Ticket returned with the entry
+        
+        Returns:
+            True while the entry is at least ``guard`` bytes away from being
+            overwritten
+        """
+        _, cursor = _HEADER.unpack_from(self._map, 0)
+        return cursor + self.guard <= ticket + self.size
+    
+    def stats(self) -> dict:
+        """Return this worker's store counters.
+        
+        Returns:
+            dict with stored (entries this worker wrote), found (misses
+            answered from entries stored by any worker), deduplicated
+            (writes skipped because the version was already stored) and
+            lock_busy (writes skipped because another worker was writing)
+        """
+        return {
+            "stored": self.stored,
+            "found": self.found,
+            "deduplicated": self.deduplicated,
+            "lock_busy": self.lock_busy,
+        }
+    
+    def _reset_counters(self) -> None:
+        self.stored = 0
+        self.found = 0
+        self.deduplicated = 0
+        self.lock_busy = 0
+    
+    def _lookup(self, key: bytes, version: FileVersion) -> Optional[Tuple[memoryview, int]]:
+        for slot in self._candidates(key):
+            offset = _HEADER_SIZE + slot * _SLOT_SIZE
+            seq, slot_key, ino, mtime_ns, size, ticket, checksum = _SLOT.unpack_from(self._map, offset)
+            if seq & 1 or slot_key != key or (ino, mtime_ns, size) != version:
+                continue
+            if struct.unpack_from("<Q", self._map, offset)[0] != seq or not self.valid(ticket):
+                continue
+            start = self._data_start + ticket % self.size
+            data = self._view[start:start + size]
+            if _checksum(data) != checksum:
+                # Bytes not visible yet, or overwritten meanwhile
+                continue
+            return data, ticket
+        return None
+    
+    def _choose_slot(self, key: bytes) -> int:
+        """Return the candidate slot holding the key, else the one holding the older entry."""
+        first, second = self._candidates(key)
+        entries = [_SLOT.unpack_from(self._map, _HEADER_SIZE + slot * _SLOT_SIZE) for slot in (first, second)]
+        for slot, entry in zip((first, second), entries):
+            if entry[1] == key:
+                return slot
+        return first if entries[0][5] <= entries[1][5] else second
+    
+    def _candidates(self, key: bytes) -> Tuple[int, int]:
+        first = int.from_bytes(key[:8], "little") % self.slots
+        return first, (first + 1) % self.slots
+
+
+def _key(path: str) -> bytes:
+    return hashlib.blake2b(path.encode("utf-8", "surrogateescape"), digest_size=16).digest()
+
+
+def _checksum(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=8).digest()
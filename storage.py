@@ -0,0 +1,497 @@
+"""Storage backends the HLS handlers can serve playlists and segments from."""
+
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import quote
+
+from anyio import to_thread
+
+from archive import MappedMediaFile
+from responses import RawHeaders, segment_headers
+from segment_cache import FileVersion, file_version
+from watcher import HLSWatcher
+
+
+logger = logging.getLogger(__name__)
+
+# Names HLS_STORAGE accepts besides "filesystem", which means no backend:
+# streams then keep the cached HLS_ROOT path (FilesystemBackend is only the
+# uncached reference implementation the conformance tests compare against)
+BACKENDS = ("memory", "mmap", "upstream")
+
+# Called by ``watch`` once it tracks changes
+Ready = Optional[Callable[[], None]]
+
+
+class StoredFile:
+    """Bytes of a stored playlist or segment with their version and segment headers."""
+    
+    __slots__ = ("data", "version", "headers")
+    
+    def __init__(self, data: bytes, version: FileVersion, headers: Optional[RawHeaders] = None):
+        self.data = data
+        self.version = version
+        self.headers = segment_headers(len(data), version[1]) if headers is None else headers
+
+
+class StorageBackend(ABC):
+    """Interface of a storage backend.
+    
+    Files are addressed by base name within one stream. ``get`` returns the
+    current bytes of a file, and ``watch`` yields the name of every file
+    that was added, changed or removed, so callers can keep what they
+    derived from it (a parsed playlist) in memory and refresh it only when
+    it changes.
+    """
+    
+    kind = ""
+    
+    def __init__(self):
+        self.gets = 0
+        self.misses = 0
+    
+    @abstractmethod
+    async def get(self, name: str) -> Optional[StoredFile]:
+        """Return the current contents of a file.
+        
+        Args:
+            name: Base name of the file
+        
+        Returns:
+            StoredFile, or None if there is no such file
+        """
+    
+    @abstractmethod
+    def watch(self, ready: Ready = None) -> AsyncIterator[str]:
+        """Yield the names of files as they are added, changed or removed.
+        
+        Args:
+            ready: Called once changes are tracked, so no change made after
+                it was called is missed
+        """
+    
+    async def close(self) -> None:
+        """Release what the backend holds open."""
+    
+    def stats(self) -> dict:
+        """Return backend counters.
+        
+        Returns:
+            dict with kind, gets and misses (gets of missing files)
+        """
+        return {"kind": self.kind, "gets": self.gets, "misses": self.misses}
+    
+    def _count(self, stored: Optional[StoredFile]) -> Optional[StoredFile]:
+        self.gets += 1
+        if stored is None:
+            self.misses += 1
+        return stored
+
+
+class FilesystemBackend(StorageBackend):
+    """Files in a directory, read on every ``get`` and watched with ``HLSWatcher``."""
+    
+    kind = "filesystem"
+    
+    def __init__(self, root: str, mode: str = "auto", poll_interval: float = 0.5):
+        """Initialize the backend.
+        
+        Args:
+            root: Directory holding the files
+            mode: HLS_WATCH mode used by ``watch`` ("auto", "inotify" or "poll")
+            poll_interval: Seconds between directory scans when polling
+        """
+        super().__init__()
+        self.root = root
+        self.mode = mode
+        self.poll_interval = poll_interval
+    
+    async def get(self, name: str) -> Optional[StoredFile]:
+        path = self._path(name)
+        if path is None:
+            return self._count(None)
+        try:
+            data, version = await to_thread.run_sync(_read_file, path)
+        except OSError:
+            return self._count(None)
+        return self._count(StoredFile(data, version))
+    
+    async def watch(self, ready: Ready = None) -> AsyncIterator[str]:
+        changed: "asyncio.Queue[str]" = asyncio.Queue()
+        watcher = HLSWatcher(
+            self.root,
+            on_update=lambda path, data, version: changed.put_nowait(os.path.basename(path)),
+            on_delete=lambda path: changed.put_nowait(os.path.basename(path)),
+            mode=self.mode,
+            poll_interval=self.poll_interval,
+            preload_suffixes=(),
+            # Only names are reported; whoever cares reads the file with get()
+            skip_read=lambda path: True,
+        )
+        await watcher.start()
+        if ready is not None:
+            ready()
+        try:
+            while True:
+                yield await changed.get()
+        finally:
+            await watcher.stop()
+    
+    def _path(self, name: str) -> Optional[str]:
+        return os.path.join(self.root, name) if is_file_name(name) else None
+
+
+class MappedBackend(FilesystemBackend):
+    """Files in a directory kept open and memory-mapped after their first ``get``.
+    
+    A ``get`` costs one ``fstat()`` on a worker thread to pick up appended
+    bytes and returns a ``memoryview`` of the mapping. Files must only be appended to or
+    replaced by rename; a replaced or removed file is unmapped when
+    ``watch`` reports it, or once ``max_files`` newer files were mapped.
+    Playlists, which the packager replaces on every update, are read like
+    the filesystem backend does.
+    """
+    
+    kind = "mmap"
+    
+    def __init__(self, root: str, mode: str = "auto", poll_interval: float = 0.5, max_files: int = 64):
+        """Initialize the backend.
+        
+        Args:
+            root: Directory holding the files
+            mode: HLS_WATCH mode used by ``watch`` ("auto", "inotify" or "poll")
+            poll_interval: Seconds between directory scans when polling
+            max_files: Number of files kept mapped
+        """
+        super().__init__(root, mode=mode, poll_interval=poll_interval)
+        self.max_files = max_files
+        self.files: "OrderedDict[str, MappedMediaFile]" = OrderedDict()
+        self._stored: Dict[str, StoredFile] = {}
+    
+    async def get(self, name: str) -> Optional[StoredFile]:
+        if name.endswith(".m3u8"):
+            return await super().get(name)
+        mapped = self.files.get(name)
+        if mapped is None:
+            path = self._path(name)
+            if path is None:
+                return self._count(None)
+            try:
+                opened = await to_thread.run_sync(MappedMediaFile, path)
+            except (OSError, ValueError):
+                return self._count(None)
+            mapped = self.files.get(name)
+            if mapped is None:
+                mapped = self.files[name] = opened
+                while len(self.files) > self.max_files:
+                    self._drop(next(iter(self.files)))
+            else:
+                # Another request mapped it meanwhile
+                opened.close()
+        self.files.move_to_end(name)
+        await to_thread.run_sync(mapped.refresh)
+        stored = self._stored.get(name)
+        if stored is None or stored.version != mapped.version:
+            stored = self._stored[name] = StoredFile(mapped.view, mapped.version, mapped.headers)
+        return self._count(stored)
+    
+    async def watch(self, ready: Ready = None) -> AsyncIterator[str]:
+        async for name in super().watch(ready):
+            self._drop(name)
+            yield name
+    
+    async def close(self) -> None:
+        for name in list(self.files):
+            self._drop(name)
+    
+    def stats(self) -> dict:
+        return {**super().stats(), "mapped": len(self.files)}
+    
+    def _drop(self, name: str) -> None:
+        self._stored.pop(name, None)
+        mapped = self.files.pop(name, None)
+        if mapped is not None:
+            mapped.close()
+
+
+class MemoryBackend(StorageBackend):
+    """Files held in memory, written with ``put`` and removed with ``delete``.
+    
+    With ``max_bytes`` the files form a ring: a write that takes the total
+    past ``max_bytes`` evicts the oldest segments (never a playlist) until
+    it fits again. Every write, removal and eviction is reported to the
+    ``watch`` iterators at once.
+    """
+    
+    kind = "memory"
+    
+    def __init__(self, max_bytes: Optional[int] = None):
+        """Initialize an empty backend.
+        
+        Args:
+            max_bytes: Ring size in bytes, or None for no limit
+        """
+        super().__init__()
+        self.max_bytes = max_bytes
+        # Files in the order they were last written, oldest first
+        self.files: Dict[str, StoredFile] = {}
+        self.bytes = 0
+        self.writes = 0
+        self.evicted = 0
+        self._watchers: Set["asyncio.Queue[str]"] = set()
+    
+    async def get(self, name: str) -> Optional[StoredFile]:
+        return self._count(self.files.get(name))
+    
+    def put(self, name: str, data: bytes, mtime_ns: Optional[int] = None) -> StoredFile:
+        """Store a file, replacing any previous version.
+        
+        Args:
+            name: Base name of the file
+            data: File contents
+            mtime_ns: Modification time (now by default)
+        
+        Returns:
+            The stored file
+        
+        Raises:
+            ValueError: If the name is not a plain file name or the file is
+                larger than the ring
+        """
+        if not is_file_name(name):
+            raise ValueError(f"Invalid file name {name!r}")
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            raise ValueError(f"{name} is larger than the {self.max_bytes} byte ring")
+        mtime_ns = time.time_ns() if mtime_ns is None else mtime_ns
+        previous = self.files.pop(name, None)
+        # Versions must differ even for two writes within one clock tick
+        generation = 1
+        if previous is not None:
+            generation = previous.version[0] + 1
+            self.bytes -= len(previous.data)
+        stored = self.files[name] = StoredFile(data, (generation, mtime_ns, len(data)))
+        self.bytes += len(data)
+        self.writes += 1
+        self._notify(name)
+        if self.max_bytes is not None and self.bytes > self.max_bytes:
+            self._evict(keep=name)
+        return stored
+    
+    def delete(self, name: str) -> bool:
+        """Remove a file.
+        
+        Returns:
+            True if the file existed
+        """
+        stored = self.files.pop(name, None)
+        if stored is None:
+            return False
+        self.bytes -= len(stored.data)
+        self._notify(name)
+        return True
+    
+    async def watch(self, ready: Ready = None) -> AsyncIterator[str]:
+        changed: "asyncio.Queue[str]" = asyncio.Queue()
+        self._watchers.add(changed)
+        if ready is not None:
+            ready()
+        try:
+            while True:
+                yield await changed.get()
+        finally:
+            self._watchers.discard(changed)
+    
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "files": len(self.files),
+            "bytes": self.bytes,
+            "writes": self.writes,
+            "evicted": self.evicted,
+        }
+    
+    def _evict(self, keep: str) -> None:
+        for name in list(self.files):
+            if self.bytes <= self.max_bytes:
+                break
+            if name != keep and not name.endswith(".m3u8"):
+                self.delete(name)
+                self.evicted += 1
+    
+    def _notify(self, name: str) -> None:
+        for changed in self._watchers:
+            changed.put_nowait(name)
+
+
+class UpstreamBackend(StorageBackend):
+    """Files fetched over HTTP from an origin server.
+    
+    Playlists are revalidated at most once per ``ttl`` seconds, with a
+    conditional GET if the origin sends ETags. Segments are immutable once
+    published, so they are kept until ``max_entries`` newer files push them
+    out. Concurrent gets of a file share one request, and an origin that
+    fails keeps the last good copy in service. ``watch`` polls the files
+    named in ``watch_names`` every ``ttl`` seconds.
+    """
+    
+    kind = "upstream"
+    
+    def __init__(
+        self,
+        origin: str,
+        ttl: float = 1.0,
+        timeout: float = 5.0,
+        max_entries: int = 256,
+        watch_names: Tuple[str, ...] = (),
+        client=None,
+    ):
+        """Initialize the backend.
+        
+        Args:
+            origin: Base URL the file names are appended to
+            ttl: Seconds a playlist is served before it is revalidated
+            timeout: Seconds an origin request may take
+            max_entries: Number of files kept
+            watch_names: Files ``watch`` polls for changes (the playlist)
+            client: httpx.AsyncClient to use (one is created by default)
+        """
+        super().__init__()
+        self.origin = origin.rstrip("/") + "/"
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.watch_names = watch_names
+        self.errors = 0
+        # Counts origin responses with a body, so every new body gets a new version
+        self._generation = 0
+        if client is None:
+            import httpx
+            client = httpx.AsyncClient(timeout=timeout)
+        self.client = client
+        # name -> (stored file, fresh until, response ETag)
+        self._entries: "OrderedDict[str, Tuple[StoredFile, float, Optional[str]]]" = OrderedDict()
+        self._loading: Dict[str, "asyncio.Task[Optional[StoredFile]]"] = {}
+    
+    async def get(self, name: str) -> Optional[StoredFile]:
+        if not is_file_name(name):
+            return self._count(None)
+        entry = self._entries.get(name)
+        if entry is not None and (entry[1] is None or time.monotonic() < entry[1]):
+            self._entries.move_to_end(name)
+            return self._count(entry[0])
+        loading = self._loading.get(name)
+        if loading is None:
+            loading = self._loading[name] = asyncio.get_running_loop().create_task(self._fetch(name))
+        return self._count(await asyncio.shield(loading))
+    
+    async def watch(self, ready: Ready = None) -> AsyncIterator[str]:
+        seen: Dict[str, Optional[FileVersion]] = {}
+        while True:
+            for name in self.watch_names:
+                stored = await self.get(name)
+                version = stored.version if stored is not None else None
+                if name in seen and seen[name] != version:
+                    yield name
+                seen[name] = version
+            if ready is not None:
+                ready()
+                ready = None
+            await asyncio.sleep(self.ttl)
+    
+    async def close(self) -> None:
+        await self.client.aclose()
+    
+    def stats(self) -> dict:
+        return {**super().stats(), "entries": len(self._entries), "errors": self.errors}
+    
+    async def _fetch(self, name: str) -> Optional[StoredFile]:
+        try:
+            entry = self._entries.get(name)
+            headers = {}
+            # Not If-Modified-Since: it cannot tell two playlists written within a second apart
+            if entry is not None and entry[2] is not None:
+                headers["If-None-Match"] = entry[2]
+            try:
+                response = await self.client.get(self.origin + quote(name), headers=headers)
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Origin request for %s failed: %s", name, e)
+                return entry[0] if entry is not None else None
+            if response.status_code == 304 and entry is not None:
+                stored = entry[0]
+            elif response.status_code == 200:
+                data = response.content
+                self._generation += 1
+                stored = StoredFile(data, (self._generation, _mtime_ns(response.headers.get("last-modified")), len(data)))
+            elif response.status_code in (404, 410):
+                self._entries.pop(name, None)
+                return None
+            else:
+                self.errors += 1
+                logger.warning("Origin answered %d for %s", response.status_code, name)
+                return entry[0] if entry is not None else None
+            fresh_until = time.monotonic() + self.ttl if name.endswith(".m3u8") else None
+            self._entries[name] = (stored, fresh_until, response.headers.get("etag"))
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return stored
+        finally:
+            self._loading.pop(name, None)
+
+
+def is_file_name(name: str) -> bool:
+    """Check that a name is a plain file name, so it cannot address anything outside its stream."""
+    return bool(name) and name not in (".", "..") and "/" not in name and "\\" not in name
+
+
+def create_backend(
+    kind: str,
+    root: str,
+    origin: str = "",
+    manifest_name: str = "",
+    max_bytes: Optional[int] = None,
+) -> StorageBackend:
+    """Create the storage backend HLS_STORAGE names for one stream.
+    
+    Args:
+        kind: "memory", "mmap" or "upstream"
+        root: Stream directory (for "mmap")
+        origin: Base URL of the stream on the origin server (for "upstream")
+        manifest_name: File name of the stream's playlist, polled by "upstream"
+        max_bytes: Ring size of "memory", or None for no limit
+    
+    Returns:
+        The backend
+    
+    Raises:
+        ValueError: If the kind is unknown or "upstream" has no origin
+    """
+    if kind == "memory":
+        return MemoryBackend(max_bytes)
+    if kind == "mmap":
+        return MappedBackend(root)
+    if kind == "upstream":
+        if not origin:
+            raise ValueError("The upstream storage backend needs HLS_ORIGIN")
+        return UpstreamBackend(origin, watch_names=(manifest_name,) if manifest_name else ())
+    raise ValueError(f"Unknown storage backend {kind!r}, expected one of {', '.join(BACKENDS)}")
+
+
+def _mtime_ns(last_modified: Optional[str]) -> int:
+    if last_modified:
+        try:
+            return int(parsedate_to_datetime(last_modified).timestamp()) * 10**9
+        except (TypeError, ValueError):
+            pass
+    return time.time_ns()
+
+
+def _read_file(path: str) -> Tuple[bytes, FileVersion]:
+    with open(path, 'rb') as f:
+        return f.read(), file_version(os.fstat(f.fileno()))
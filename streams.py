@@ -0,0 +1,384 @@
+"""Named live streams served from subdirectories of HLS_ROOT."""
+
+import asyncio
+import functools
+import logging
+import os
+import re
+from typing import Callable, Dict, List, Optional
+
+from archive import MediaArchive
+from clock import CoarseClock
+from manifest import ManifestCache, ManifestVersion, segment_uris
+from prefetch import SegmentPrefetcher
+from segment_cache import SegmentCache, file_version
+from storage import StorageBackend
+from watcher import HLSWatcher
+
+
+logger = logging.getLogger(__name__)
+
+# Stream names map 1:1 to directory names, so nothing that could escape HLS_ROOT
+STREAM_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}\Z")
+
+
+class Stream:
+    """One live stream: its directory, URL prefix and its own caches."""
+    
+    def __init__(
+        self,
+        name: str,
+        root: str,
+        manifest_name: str,
+        segments: SegmentCache,
+        manifests: ManifestCache,
+        prefetch: bool = False,
+        backend: Optional[StorageBackend] = None,
+    ):
+        """Initialize a stream.
+        
+        Args:
+            name: Stream name ("" for the single stream at HLS_ROOT)
+            root: Directory holding the stream's manifest and segments
+            manifest_name: File name of the media playlist
+            segments: Segment cache used only by this stream
+            manifests: Manifest cache used only by this stream
+            prefetch: Advise the page cache of each playlist's segments
+            backend: Storage backend the playlist and segments are served
+                from instead of the caches, if any
+        """
+        self.name = name
+        self.root = root
+        self.manifest_name = manifest_name
+        self.segments = segments
+        self.manifests = manifests
+        self.url_prefix = f"/live/{name}/" if name else "/live/"
+        self.manifest_path = os.path.join(root, manifest_name)
+        self.watcher: Optional[HLSWatcher] = None
+        self.prefetcher: Optional[SegmentPrefetcher] = None
+        if prefetch and backend is None:
+            self.prefetcher = SegmentPrefetcher(root)
+        self.backend = backend
+        self._following: Optional[asyncio.Task] = None
+        if backend is not None:
+            manifests.backends[self.manifest_path] = backend
+        # Media files the playlist lists EXT-X-BYTERANGE segments of
+        self.archive = MediaArchive(root)
+        manifests.on_update = self.on_manifest
+    
+    @property
+    def manifest_url(self) -> str:
+        """Signed request path of the stream's manifest."""
+        return self.url_prefix + self.manifest_name
+    
+    def segment_path(self, segment: str) -> str:
+        """Return the absolute path of a segment (name without .ts)."""
+        return os.path.join(self.root, f"{segment}.ts")
+    
+    def on_update(self, path: str, data: Optional[bytes], version) -> None:
+        """Publish a finished file from the watcher to the matching cache."""
+        if data is None:
+            # A byte-range media file, statted but not read: remap it
+            self.archive.invalidate(path)
+        elif path.endswith(".m3u8"):
+            self.manifests.update(path, data, version)
+        else:
+            self.segments.put(path, data, version)
+    
+    def on_manifest(self, path: str, manifest: ManifestVersion) -> None:
+        """Index the byte ranges and prefetch the segments of a new version of the stream's playlist."""
+        if path != self.manifest_path:
+            return
+        self.archive.update(manifest)
+        if self.prefetcher is not None:
+            self.prefetcher.update(manifest)
+    
+    def is_media_file(self, path: str) -> bool:
+        """Check whether a path is a byte-range media file of the current playlist."""
+        return os.path.dirname(path) == self.root and self.archive.lists(os.path.basename(path))
+    
+    def on_append(self, path: str, data: bytes) -> None:
+        """Pass bytes appended to a segment that is still being written to the segment cache."""
+        self.segments.grow(path, data)
+    
+    def on_delete(self, path: str) -> None:
+        """Drop a removed file from the caches."""
+        self.manifests.invalidate(path)
+        self.segments.invalidate(path)
+        self.archive.invalidate(path)
+    
+    def warm(self) -> int:
+        """Load the stream's playlist and the segments it lists (blocking).
+        
+        Meant for the pre-fork launcher, which warms the caches once in the
+        parent so the workers share them copy-on-write. Byte-range media
+        files are left to the archive, which maps them on first request.
+        
+        Returns:
+            Number of segments loaded
+        """
+        if self.backend is not None:
+            return 0
+        try:
+            data, version = _read_file(self.manifest_path)
+        except OSError:
+            return 0
+        self.manifests.update(self.manifest_path, data, version)
+        loaded = 0
+        for name in sorted(segment_uris(data).difference(self.archive.ranges)):
+            path = os.path.join(self.root, name)
+            try:
+                if os.stat(path).st_size > self.segments.max_item_bytes:
+                    continue
+                segment, version = _read_file(path)
+            except OSError:
+                continue
+            self.segments.put(path, segment, version)
+            loaded += 1
+        return loaded
+    
+    async def start_watcher(self, mode: str) -> None:
+        """Watch the stream directory and let the caches trust the watcher.
+        
+        A stream with a storage backend follows the backend's ``watch``
+        instead, refetching the playlist whenever it changes.
+        
+        Args:
+            mode: HLS_WATCH mode ("auto", "inotify" or "poll")
+        """
+        if self.backend is not None:
+            if self._following is None:
+                self._following = asyncio.get_running_loop().create_task(self._follow_backend())
+            return
+        watcher = HLSWatcher(
+            self.root,
+            self.on_update,
+            self.on_delete,
+            mode=mode,
+            on_append=self.on_append,
+            skip_read=self.is_media_file,
+        )
+        await watcher.start()
+        self.watcher = watcher
+        # The caches now trust the watcher for which files exist
+        self.segments.index = watcher.files
+        self.manifests.index = watcher.files
+    
+    async def stop_watcher(self) -> None:
+        """Stop watching and return the caches to on-demand file checks."""
+        following, self._following = self._following, None
+        if following is not None:
+            following.cancel()
+            try:
+                await following
+            except asyncio.CancelledError:
+                pass
+        watcher, self.watcher = self.watcher, None
+        if watcher is None:
+            return
+        self.segments.index = None
+        self.manifests.index = None
+        await watcher.stop()
+    
+    def stats(self) -> dict:
+        """Return the stream's cache counters."""
+        stats = {
+            "segment_cache": self.segments.stats(),
+            "manifest_cache": self.manifests.stats(),
+            "byterange_files": self.archive.stats(),
+        }
+        if self.prefetcher is not None:
+            stats["prefetch"] = self.prefetcher.stats()
+        if self.backend is not None:
+            stats["storage"] = self.backend.stats()
+        return stats
+    
+    async def _follow_backend(self) -> None:
+        """Keep the playlist in memory, reloading it on every change the backend reports.
+        
+        Reloads wake blocked requests. While the watch is down, fetches ask
+        the backend again.
+        """
+        ready = functools.partial(self.manifests.follow, self.manifest_path)
+        while True:
+            try:
+                async for name in self.backend.watch(ready):
+                    if name == self.manifest_name:
+                        await self.manifests.reload(self.manifest_path)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Storage watch of %s failed: %s", self.root, e)
+            finally:
+                self.manifests.unfollow(self.manifest_path)
+            # A watch that ended or failed is restarted after a pause
+            await asyncio.sleep(1)
+
+
+class StreamIndex:
+    """In-memory map from stream name to ``Stream``, built from HLS_ROOT's subdirectories.
+    
+    ``default`` is the stream at HLS_ROOT itself, served as /live/stream.m3u8.
+    
+    Requests resolve a stream with one dict lookup instead of joining and
+    checking paths. The directory is rescanned at most once per
+    ``check_interval`` seconds when an unknown name is requested, so a
+    camera added at runtime is picked up without a restart while a scanner
+    probing random names costs at most one ``scandir()`` per interval.
+    """
+    
+    def __init__(
+        self,
+        default: Stream,
+        cache_bytes: int = 16 * 1024 * 1024,
+        manifest_name: str = "index.m3u8",
+        check_interval: int = 1,
+        clock: Optional[CoarseClock] = None,
+        prefetch: bool = False,
+        store=None,
+        backends: Optional[Callable[[str, str, str], Optional[StorageBackend]]] = None,
+    ):
+        """Initialize an empty index.
+        
+        Args:
+            default: Stream at HLS_ROOT, whose subdirectories are the other streams
+            cache_bytes: Segment cache budget of each stream
+            manifest_name: File name of each stream's media playlist
+            check_interval: Minimum whole seconds between rescans
+            clock: Shared coarse clock (a non-ticking one by default)
+            prefetch: Advise the page cache of each stream's playlist segments
+            store: SharedSegmentStore or SegmentLog for the streams' segment bytes, if any
+            backends: Called with (name, root, manifest name) of each stream
+                found to create its storage backend, if any
+        """
+        self.default = default
+        self.root = default.root
+        self.cache_bytes = cache_bytes
+        self.manifest_name = manifest_name
+        self.check_interval = check_interval
+        self.clock = clock or CoarseClock()
+        self.prefetch = prefetch
+        self.store = store
+        self.backends = backends
+        self.streams: Dict[str, Stream] = {}
+        self._next_scan = 0
+        # HLS_WATCH mode while watchers run, so streams found later are watched too
+        self._watch: Optional[str] = None
+    
+    def get(self, name: str) -> Optional[Stream]:
+        """Return a known stream without touching the filesystem."""
+        return self.streams.get(name)
+    
+    async def resolve(self, name: str) -> Optional[Stream]:
+        """Return a stream, rescanning HLS_ROOT for new streams if allowed.
+        
+        Args:
+            name: Stream name from the URL
+        
+        Returns:
+            Stream, or None if there is no such stream
+        """
+        stream = self.streams.get(name)
+        if stream is not None or not STREAM_NAME.match(name):
+            return stream
+        now = self.clock.now()
+        if now < self._next_scan:
+            return None
+        self._next_scan = now + self.check_interval
+        for added in self.scan():
+            if self._watch is not None:
+                await added.start_watcher(self._watch)
+        return self.streams.get(name)
+    
+    def scan(self) -> List[Stream]:
+        """Add a stream for every new subdirectory of HLS_ROOT.
+        
+        Returns:
+            The streams that were added
+        """
+        added = []
+        try:
+            entries = os.scandir(self.root)
+        except OSError as e:
+            logger.warning("Cannot scan HLS directory %s: %s", self.root, e)
+            return added
+        with entries:
+            for entry in entries:
+                if entry.name in self.streams or not STREAM_NAME.match(entry.name) or not entry.is_dir():
+                    continue
+                added.append(self._add(entry.name))
+        return added
+    
+    async def add(self, name: str) -> Optional[Stream]:
+        """Return a stream, adding it even if HLS_ROOT has no directory for it yet.
+        
+        Meant for streams the packager pushes over HTTP into a storage
+        backend, which need no directory.
+        
+        Args:
+            name: Stream name from the URL
+        
+        Returns:
+            Stream, or None if the name is not a valid stream name
+        """
+        stream = self.streams.get(name)
+        if stream is not None or not STREAM_NAME.match(name):
+            return stream
+        stream = self._add(name)
+        if self._watch is not None:
+            await stream.start_watcher(self._watch)
+        return stream
+    
+    def _add(self, name: str) -> Stream:
+        root = os.path.join(self.root, name)
+        stream = Stream(
+            name,
+            root,
+            self.manifest_name,
+            SegmentCache(max_bytes=self.cache_bytes, clock=self.clock, store=self.store),
+            ManifestCache(),
+            prefetch=self.prefetch,
+            backend=self.backends(name, root, self.manifest_name) if self.backends else None,
+        )
+        self.streams[name] = stream
+        return stream
+    
+    async def start_watchers(self, mode: str) -> None:
+        """Scan HLS_ROOT and watch every stream, including ones found later.
+        
+        Args:
+            mode: HLS_WATCH mode ("auto", "inotify" or "poll")
+        """
+        self._watch = mode
+        self.scan()
+        await self.default.start_watcher(mode)
+        for stream in list(self.streams.values()):
+            await stream.start_watcher(mode)
+    
+    async def stop_watchers(self) -> None:
+        """Stop every stream's watcher."""
+        self._watch = None
+        await self.default.stop_watcher()
+        for stream in list(self.streams.values()):
+            await stream.stop_watcher()
+    
+    def warm(self) -> int:
+        """Scan HLS_ROOT and load every stream's playlist and listed segments (blocking).
+        
+        Returns:
+            Number of segments loaded
+        """
+        self.scan()
+        loaded = self.default.warm()
+        for stream in self.streams.values():
+            loaded += stream.warm()
+        return loaded
+    
+    def stats(self) -> dict:
+        """Return cache counters of the named streams by name."""
+        return {name: stream.stats() for name, stream in self.streams.items()}
+
+
+def _read_file(path: str):
+    with open(path, 'rb') as f:
+        return f.read(), file_version(os.fstat(f.fileno()))
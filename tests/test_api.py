@@ -2,6 +2,7 @@
 
 import os
 import tempfile
+import threading
 import time
 from pathlib import Path
 from fastapi.testclient import TestClient
@@ -10,8 +11,10 @@ import pytest
 # Set test environment variables before importing main
 os.environ['EDGE_SIGNING_SECRET'] = 'test-secret-key'
 
+import main
 from main import app
-from token import TokenValidator
+from auth import TokenValidator
+from fastpath import LiveFastPath
 
 
 class TestAPI:
@@ -26,6 +29,12 @@ class TestAPI:
         # Reset the global validator to pick up the new HLS_ROOT
         import deps
         deps._validator = None
+        deps._segment_store = None
+        deps._segment_log = None
+        deps._disk_spill = None
+        deps._segment_cache = None
+        deps._manifest_cache = None
+        deps._streams = None
         
         self.client = TestClient(app)
         self.secret = 'test-secret-key'
@@ -103,6 +112,105 @@ segment002.ts
         assert response.headers["content-type"] == "application/vnd.apple.mpegurl"
         assert response.headers["cache-control"] == "no-store"
     
+    def test_m3u8_etag_revalidation(self):
+        """Test that a matching If-None-Match gets 304 and a changed playlist does not."""
+        path = "/live/stream.m3u8"
+        exp, sig = self.generate_valid_token(path)
+        
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        etag = response.headers["etag"]
+        
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert response.headers["cache-control"] == "no-store"
+        
+        (self.hls_root / "stream.m3u8").write_text("#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:1\n")
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        
+        # Token checks still come first
+        response = self.client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 400
+    
+    def test_m3u8_blocking_reload(self):
+        """Test that an LL-HLS blocking reload waits for the requested segment."""
+        path = "/live/stream.m3u8"
+        exp, sig = self.generate_valid_token(path)
+        playlist = "#EXTM3U\n#EXT-X-TARGETDURATION:1\n#EXT-X-MEDIA-SEQUENCE:0\n#EXTINF:1.0,\nsegment001.ts\n"
+        (self.hls_root / "stream.m3u8").write_text(playlist)
+        
+        # Already listed: answered immediately, extra parameters keep the signature valid
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}&_HLS_msn=0")
+        assert response.status_code == 200
+        
+        def publish():
+            time.sleep(0.2)
+            (self.hls_root / "stream.m3u8").write_text(playlist + "#EXTINF:1.0,\nsegment002.ts\n")
+        
+        writer = threading.Thread(target=publish)
+        writer.start()
+        try:
+            response = self.client.get(f"{path}?exp={exp}&sig={sig}&_HLS_msn=1&_HLS_part=0")
+        finally:
+            writer.join()
+        assert response.status_code == 200
+        assert response.text.endswith("segment002.ts\n")
+    
+    def test_m3u8_blocking_reload_errors(self):
+        """Test rejection of invalid LL-HLS parameters, after the token check."""
+        path = "/live/stream.m3u8"
+        exp, sig = self.generate_valid_token(path)
+        
+        for query in ("_HLS_msn=4", "_HLS_part=0", "_HLS_msn=-1", "_HLS_msn=x"):
+            response = self.client.get(f"{path}?exp={exp}&sig={sig}&{query}")
+            assert response.status_code == 400
+            assert response.json() == {"error": "invalid_blocking_request"}
+        
+        response = self.client.get(f"{path}?exp={exp}&sig=invalid&_HLS_msn=4")
+        assert response.status_code == 403
+    
+    def test_named_streams_served_from_subdirectories(self):
+        """Test that each subdirectory of HLS_ROOT is a stream with its own cache."""
+        for name in ("cam1", "cam2"):
+            (self.hls_root / name).mkdir()
+            (self.hls_root / name / "index.m3u8").write_text(f"#EXTM3U\n#EXTINF:1.0,\n{name}-0.ts\n")
+            (self.hls_root / name / "seg0.ts").write_bytes(name.encode())
+        
+        path = "/live/cam1/index.m3u8"
+        exp, sig = self.generate_valid_token(path)
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        assert response.status_code == 200
+        assert response.text == "#EXTM3U\n#EXTINF:1.0,\ncam1-0.ts\n"
+        
+        for name in ("cam1", "cam2"):
+            path = f"/live/{name}/seg0.ts"
+            exp, sig = self.generate_valid_token(path)
+            response = self.client.get(f"{path}?exp={exp}&sig={sig}")
+            assert response.status_code == 200
+            assert response.content == name.encode()
+            assert response.headers["cache-control"] == "public, max-age=10, immutable"
+        
+        # A token for one stream does not open another
+        exp, sig = self.generate_valid_token("/live/cam1/seg0.ts")
+        assert self.client.get(f"/live/cam2/seg0.ts?exp={exp}&sig={sig}").status_code == 403
+        
+        # Unknown streams are 404 after the token check
+        path = "/live/cam9/index.m3u8"
+        exp, sig = self.generate_valid_token(path)
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        assert response.status_code == 404
+        assert response.json() == {"detail": "File not found"}
+        assert self.client.get("/live/cam9/index.m3u8?exp=1&sig=x").status_code == 410
+        
+        metrics = self.client.get("/metrics").json()
+        assert set(metrics["streams"]) == {"cam1", "cam2"}
+        assert metrics["streams"]["cam1"]["segment_cache"]["misses"] == 1
+        assert metrics["streams"]["cam1"]["manifest_cache"]["misses"] == 1
+        assert metrics["segment_cache"]["misses"] == 0
+    
     def test_m3u8_expired_token_rejection(self):
         """Test m3u8 serving with expired token."""
         path = "/live/stream.m3u8"
@@ -178,6 +286,103 @@ segment002.ts
         assert response.headers["content-type"] == "video/mp2t"
         assert response.headers["cache-control"] == "public, max-age=10, immutable"
     
+    def test_ts_headers_rendered_from_file_version(self):
+        """Test that segment headers carry the size and mtime of the cached file."""
+        from email.utils import formatdate
+        os.utime(self.hls_root / "segment001.ts", ns=(0, 1_700_000_000 * 10**9))
+        path = "/live/segment001.ts"
+        exp, sig = self.generate_valid_token(path)
+        
+        first = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        second = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        
+        for response in (first, second):
+            assert response.status_code == 200
+            assert response.headers["content-length"] == str(len(b"fake ts content 1"))
+            assert response.headers["last-modified"] == formatdate(1_700_000_000, usegmt=True)
+            assert response.headers["cache-control"] == "public, max-age=10, immutable"
+    
+    def test_ts_range_requests(self):
+        """Test single, suffix and multiple ranges, 416 and If-Range."""
+        path = "/live/segment001.ts"
+        exp, sig = self.generate_valid_token(path)
+        url = f"{path}?exp={exp}&sig={sig}"
+        
+        response = self.client.get(url, headers={"Range": "bytes=0-3"})
+        assert response.status_code == 206
+        assert response.content == b"fake"
+        assert response.headers["content-range"] == "bytes 0-3/17"
+        assert response.headers["content-type"] == "video/mp2t"
+        
+        response = self.client.get(url, headers={"Range": "bytes=-9"})
+        assert (response.status_code, response.content) == (206, b"content 1")
+        
+        response = self.client.get(url, headers={"Range": "bytes=0-3,8-14"})
+        assert response.status_code == 206
+        boundary = response.headers["content-type"].split("boundary=")[1]
+        parts = response.content.split(f"--{boundary}".encode())
+        assert parts[1].endswith(b"content-range: bytes 0-3/17\r\n\r\nfake\r\n")
+        assert parts[2].endswith(b"\r\n\r\ncontent\r\n")
+        assert parts[3] == b"--\r\n"
+        
+        response = self.client.get(url, headers={"Range": "bytes=17-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */17"
+        
+        response = self.client.get(url, headers={"Range": "bytes=0-3", "If-Range": '"etag"'})
+        assert (response.status_code, response.content) == (200, b"fake ts content 1")
+        assert response.headers["accept-ranges"] == "bytes"
+    
+    def test_ts_range_of_uncached_segment(self):
+        """Test that ranges of segments too large to cache are read at their offsets."""
+        import deps
+        from segment_cache import SegmentCache
+        deps._segment_cache = SegmentCache(max_bytes=64, max_item_bytes=8)
+        path = "/live/segment001.ts"
+        exp, sig = self.generate_valid_token(path)
+        
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}", headers={"Range": "bytes=5-6,-1"})
+        
+        assert response.status_code == 206
+        assert b"\r\n\r\nts\r\n" in response.content
+        assert b"content-range: bytes 16-16/17\r\n\r\n1\r\n" in response.content
+        assert response.headers["content-length"] == str(len(response.content))
+    
+    def test_byterange_segments_served_from_mapped_file(self):
+        """Test that byte-range segments of one media file are served from its mapping."""
+        media = self.hls_root / "media.ts"
+        media.write_bytes(b"0123456789abcdefghij")
+        (self.hls_root / "stream.m3u8").write_text(
+            "#EXTM3U\n#EXT-X-VERSION:4\n#EXT-X-TARGETDURATION:2\n"
+            "#EXTINF:2.0,\n#EXT-X-BYTERANGE:10@0\nmedia.ts\n"
+            "#EXTINF:2.0,\n#EXT-X-BYTERANGE:10\nmedia.ts\n"
+        )
+        exp, sig = self.generate_valid_token("/live/stream.m3u8")
+        assert self.client.get(f"/live/stream.m3u8?exp={exp}&sig={sig}").status_code == 200
+        path = "/live/media.ts"
+        exp, sig = self.generate_valid_token(path)
+        url = f"{path}?exp={exp}&sig={sig}"
+        
+        response = self.client.get(url, headers={"Range": "bytes=10-19"})
+        assert (response.status_code, response.content) == (206, b"abcdefghij")
+        assert response.headers["content-range"] == "bytes 10-19/20"
+        
+        # Appended after the playlist was read
+        with open(media, "ab") as f:
+            f.write(b"KLMNO")
+        response = self.client.get(url, headers={"Range": "bytes=20-24"})
+        assert (response.status_code, response.content) == (206, b"KLMNO")
+        assert response.headers["content-range"] == "bytes 20-24/25"
+        
+        response = self.client.get(url)
+        assert (response.status_code, response.content) == (200, b"0123456789abcdefghijKLMNO")
+        assert response.headers["content-length"] == "25"
+        
+        metrics = self.client.get("/metrics").json()
+        assert metrics["byterange_files"]["hits"] == 3
+        assert metrics["byterange_files"]["opened"] == 1
+        assert metrics["segment_cache"]["misses"] == 0
+    
     def test_ts_different_segments(self):
         """Test serving different .ts segments."""
         # Test segment001
@@ -196,6 +401,258 @@ segment002.ts
         assert response2.status_code == 200
         assert response2.content == b"fake ts content 2"
     
+    def test_ts_served_from_segment_cache(self):
+        """Test that a repeated segment request is served from memory."""
+        path = "/live/segment001.ts"
+        exp, sig = self.generate_valid_token(path)
+        
+        self.client.get(f"{path}?exp={exp}&sig={sig}")
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        
+        assert response.status_code == 200
+        assert response.content == b"fake ts content 1"
+        assert response.headers["cache-control"] == "public, max-age=10, immutable"
+        
+        stats = self.client.get("/metrics").json()["segment_cache"]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["bytes_served"] == len(b"fake ts content 1")
+    
+    def test_oversized_segment_streamed_from_disk(self):
+        """Test that a segment too large to cache is streamed from its file."""
+        import deps
+        from segment_cache import SegmentCache
+        deps._segment_cache = SegmentCache(max_bytes=64, max_item_bytes=8)
+        path = "/live/segment001.ts"
+        exp, sig = self.generate_valid_token(path)
+        
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        
+        assert response.status_code == 200
+        assert response.content == b"fake ts content 1"
+        assert response.headers["content-type"] == "video/mp2t"
+        assert response.headers["cache-control"] == "public, max-age=10, immutable"
+        stats = self.client.get("/metrics").json()["segment_cache"]
+        assert stats["uncached"] == 1
+        assert stats["entries"] == 0
+        assert (stats["sent_zero_copy"], stats["sent_chunked"]) == (0, 1)
+    
+    def test_segments_served_from_shared_store(self):
+        """Test that segments are served from the store shared by the workers when enabled."""
+        os.environ['SHARED_SEGMENT_BYTES'] = '4096'
+        try:
+            path = "/live/segment001.ts"
+            exp, sig = self.generate_valid_token(path)
+            
+            first = self.client.get(f"{path}?exp={exp}&sig={sig}")
+            second = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        finally:
+            del os.environ['SHARED_SEGMENT_BYTES']
+        
+        assert first.content == second.content == b"fake ts content 1"
+        assert second.headers["content-length"] == str(len(b"fake ts content 1"))
+        metrics = self.client.get("/metrics").json()
+        assert metrics["shared_segments"]["stored"] == 1
+        assert metrics["segment_cache"]["hits"] == 1
+    
+    def test_segments_kept_in_segment_log(self):
+        """Test that segment bytes live in the segment log when it is enabled."""
+        os.environ['SEGMENT_LOG_DIR'] = self.temp_dir
+        os.environ['SHARED_SEGMENT_BYTES'] = '4096'
+        try:
+            path = "/live/segment001.ts"
+            exp, sig = self.generate_valid_token(path)
+            
+            first = self.client.get(f"{path}?exp={exp}&sig={sig}")
+            second = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        finally:
+            del os.environ['SEGMENT_LOG_DIR']
+            del os.environ['SHARED_SEGMENT_BYTES']
+        
+        assert first.content == second.content == b"fake ts content 1"
+        metrics = self.client.get("/metrics").json()
+        assert metrics["segment_log"]["appended"] == 1
+        assert "shared_segments" not in metrics
+        assert metrics["segment_cache"]["hits"] == 1
+    
+    def test_storage_backend_serves_stream(self):
+        """Test that HLS_STORAGE=mmap serves the playlist and segments, ranges included, from the backend."""
+        os.environ['HLS_STORAGE'] = 'mmap'
+        try:
+            manifest_path = "/live/stream.m3u8"
+            exp, sig = self.generate_valid_token(manifest_path)
+            manifest = self.client.get(f"{manifest_path}?exp={exp}&sig={sig}")
+            
+            path = "/live/segment001.ts"
+            exp, sig = self.generate_valid_token(path)
+            whole = self.client.get(f"{path}?exp={exp}&sig={sig}")
+            part = self.client.get(f"{path}?exp={exp}&sig={sig}", headers={"Range": "bytes=5-6"})
+            missing_path = "/live/segment009.ts"
+            exp, sig = self.generate_valid_token(missing_path)
+            missing = self.client.get(f"{missing_path}?exp={exp}&sig={sig}")
+        finally:
+            del os.environ['HLS_STORAGE']
+        
+        assert manifest.status_code == 200
+        assert b"segment001.ts" in manifest.content
+        assert whole.content == b"fake ts content 1"
+        assert whole.headers["content-type"] == "video/mp2t"
+        assert (part.status_code, part.content) == (206, b"ts")
+        assert missing.status_code == 404
+        storage = self.client.get("/metrics").json()["storage"]
+        assert (storage["kind"], storage["mapped"], storage["misses"]) == ("mmap", 1, 1)
+        assert self.client.get("/metrics").json()["segment_cache"]["misses"] == 0
+    
+    def test_ingest_pushes_into_memory(self):
+        """Test that files pushed to /ingest are served from memory, and only with the ingest secret."""
+        os.environ['HLS_STORAGE'] = 'memory'
+        os.environ['INGEST_SECRET'] = 'push-secret'
+        auth = {"Authorization": "Bearer push-secret"}
+        try:
+            assert self.client.put("/ingest/live001.ts", content=b"x").status_code == 403
+            wrong = self.client.put("/ingest/live001.ts", content=b"x", headers={"Authorization": "Bearer nope"})
+            assert wrong.json() == {"error": "forbidden"}
+            assert self.client.put("/ingest/notes.txt", content=b"x", headers=auth).status_code == 400
+            
+            assert self.client.put("/ingest/live001.ts", content=b"pushed segment", headers=auth).status_code == 201
+            playlist = b"#EXTM3U\n#EXT-X-TARGETDURATION:1\n#EXTINF:1.0,\nlive001.ts\n"
+            assert self.client.put("/ingest/stream.m3u8", content=playlist, headers=auth).status_code == 201
+            assert self.client.post("/ingest/stream.m3u8", content=playlist, headers=auth).status_code == 204
+            
+            manifest_path = "/live/stream.m3u8"
+            exp, sig = self.generate_valid_token(manifest_path)
+            manifest = self.client.get(f"{manifest_path}?exp={exp}&sig={sig}")
+            path = "/live/live001.ts"
+            exp, sig = self.generate_valid_token(path)
+            segment = self.client.get(f"{path}?exp={exp}&sig={sig}")
+            # Files in HLS_ROOT are not served: the stream lives in memory
+            disk_path = "/live/segment001.ts"
+            disk_exp, disk_sig = self.generate_valid_token(disk_path)
+            on_disk = self.client.get(f"{disk_path}?exp={disk_exp}&sig={disk_sig}")
+            
+            assert self.client.delete("/ingest/live001.ts", headers=auth).status_code == 204
+            deleted = self.client.get(f"{path}?exp={exp}&sig={sig}")
+            assert self.client.delete("/ingest/live001.ts", headers=auth).status_code == 404
+        finally:
+            del os.environ['HLS_STORAGE']
+            del os.environ['INGEST_SECRET']
+        
+        assert manifest.content == playlist
+        assert segment.content == b"pushed segment"
+        assert on_disk.status_code == 404
+        assert deleted.status_code == 404
+        assert not (self.hls_root / "live001.ts").exists()
+        storage = self.client.get("/metrics").json()["storage"]
+        assert (storage["kind"], storage["writes"], storage["files"]) == ("memory", 3, 1)
+    
+    def test_ingest_wakes_blocked_reload_and_spills(self):
+        """Test that a push to a new named stream answers a blocked reload and is written to disk behind it."""
+        os.environ['HLS_STORAGE'] = 'memory'
+        os.environ['INGEST_SECRET'] = 'push-secret'
+        os.environ['INGEST_SPILL'] = '1'
+        auth = {"Authorization": "Bearer push-secret"}
+        playlist = "#EXTM3U\n#EXT-X-TARGETDURATION:1\n#EXT-X-MEDIA-SEQUENCE:0\n#EXTINF:1.0,\nlive001.ts\n"
+        try:
+            with self.client as client:
+                assert client.put("/ingest/cam9/index.m3u8", content=playlist, headers=auth).status_code == 201
+                
+                def publish():
+                    time.sleep(0.2)
+                    client.put("/ingest/cam9/live002.ts", content=b"second", headers=auth)
+                    client.put("/ingest/cam9/index.m3u8", content=playlist + "#EXTINF:1.0,\nlive002.ts\n", headers=auth)
+                
+                path = "/live/cam9/index.m3u8"
+                exp, sig = self.generate_valid_token(path)
+                writer = threading.Thread(target=publish)
+                writer.start()
+                try:
+                    response = client.get(f"{path}?exp={exp}&sig={sig}&_HLS_msn=1")
+                finally:
+                    writer.join()
+                too_large = client.put(
+                    "/ingest/cam9/huge.ts",
+                    headers={**auth, "Content-Length": str(64 * 1024 * 1024 + 1)},
+                )
+            # Leaving the client stopped the spill after it wrote everything queued
+            spilled = (self.hls_root / "cam9" / "live002.ts").read_bytes()
+            on_disk = (self.hls_root / "cam9" / "index.m3u8").read_text()
+        finally:
+            del os.environ['HLS_STORAGE']
+            del os.environ['INGEST_SECRET']
+            del os.environ['INGEST_SPILL']
+        
+        assert response.status_code == 200
+        assert response.text.endswith("live002.ts\n")
+        assert too_large.status_code == 413
+        assert spilled == b"second"
+        assert on_disk.endswith("live002.ts\n")
+    
+    def test_watcher_serves_finished_segments_only(self):
+        """Test that with the watcher running, segments come from memory once closed."""
+        os.environ['HLS_WATCH'] = 'inotify'
+        try:
+            with self.client as client:
+                path = "/live/segment003.ts"
+                exp, sig = self.generate_valid_token(path)
+                
+                with open(self.hls_root / "segment003.ts", "wb") as f:
+                    f.write(b"partial")
+                    f.flush()
+                    response = client.get(f"{path}?exp={exp}&sig={sig}")
+                    assert response.status_code == 404
+                
+                deadline = time.time() + 2
+                while response.status_code != 200 and time.time() < deadline:
+                    time.sleep(0.01)
+                    response = client.get(f"{path}?exp={exp}&sig={sig}")
+                assert response.content == b"partial"
+                
+                (self.hls_root / "segment003.ts").unlink()
+                deadline = time.time() + 2
+                while response.status_code != 404 and time.time() < deadline:
+                    time.sleep(0.01)
+                    response = client.get(f"{path}?exp={exp}&sig={sig}")
+                assert response.status_code == 404
+        finally:
+            del os.environ['HLS_WATCH']
+    
+    def test_preload_hint_streamed_while_written(self):
+        """Test that an announced preload hint is streamed as the packager writes it."""
+        os.environ['HLS_WATCH'] = 'inotify'
+        try:
+            with self.client as client:
+                (self.hls_root / "stream.m3u8").write_text(
+                    "#EXTM3U\n#EXT-X-TARGETDURATION:1\n#EXTINF:1.0,\nsegment001.ts\n"
+                    '#EXT-X-PRELOAD-HINT:TYPE=PART,URI="segment003.ts"\n'
+                )
+                manifest_path = str(self.hls_root / "stream.m3u8")
+                deadline = time.time() + 2
+                while not main.get_stream_index().default.manifests.peek(manifest_path).preload_hints and time.time() < deadline:
+                    time.sleep(0.01)
+                
+                path = "/live/segment003.ts"
+                exp, sig = self.generate_valid_token(path)
+                responses = []
+                reader = threading.Thread(
+                    target=lambda: responses.append(client.get(f"{path}?exp={exp}&sig={sig}"))
+                )
+                reader.start()
+                try:
+                    time.sleep(0.1)
+                    with open(self.hls_root / "segment003.ts", "wb") as f:
+                        f.write(b"part one")
+                        f.flush()
+                        time.sleep(0.1)
+                        f.write(b", part two")
+                finally:
+                    reader.join(5)
+                
+                assert responses[0].status_code == 200
+                assert responses[0].content == b"part one, part two"
+                assert client.get("/metrics").json()["segment_cache"]["streamed"] == 1
+        finally:
+            del os.environ['HLS_WATCH']
+    
     def test_ts_expired_token_rejection(self):
         """Test .ts serving with expired token."""
         path = "/live/segment001.ts"
@@ -250,6 +707,51 @@ segment002.ts
         # But the signature validation should pass (we'd get 404, not 403)
         assert response.status_code == 404  # File not found, not forbidden
     
+    def test_prefix_scoped_token_serves_segments(self):
+        """Test that one prefix-scoped token serves the manifest and every segment."""
+        import deps
+        deps._validator = TokenValidator(self.secret, allow_prefix_tokens=True)
+        exp = int(time.time()) + 3600
+        sig = self.validator._compute_prefix_signature("/live/", exp)
+        
+        for path in ("/live/stream.m3u8", "/live/segment001.ts", "/live/segment002.ts"):
+            response = self.client.get(path, params={"exp": exp, "sig": sig, "scope": "/live/"})
+            assert response.status_code == 200
+        
+        assert deps._validator.cache.stats()["misses"] == 1
+    
+    def test_session_cookie_authorizes_segments(self):
+        """Test that the manifest's session cookie replaces segment tokens."""
+        import deps
+        from sessions import SESSION_COOKIE, SessionTable
+        deps._sessions = SessionTable(deps.get_token_validator())
+        
+        path = "/live/stream.m3u8"
+        exp, sig = self.generate_valid_token(path)
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        
+        assert response.status_code == 200
+        cookie = response.headers["set-cookie"]
+        assert "HttpOnly" in cookie and "Secure" in cookie and "SameSite=lax" in cookie
+        
+        # TestClient speaks plain HTTP, which only gets the cookie back without Secure
+        os.environ['SESSION_COOKIE_SECURE'] = '0'
+        try:
+            self.client.cookies.clear()
+            response = self.client.get(f"{path}?exp={exp}&sig={sig}")
+        finally:
+            del os.environ['SESSION_COOKIE_SECURE']
+        assert SESSION_COOKIE in response.cookies
+        
+        response = self.client.get("/live/segment001.ts")
+        assert response.status_code == 200
+        assert response.content == b"fake ts content 1"
+        
+        # Without the cookie the segment still needs a token
+        self.client.cookies.clear()
+        response = self.client.get("/live/segment001.ts")
+        assert response.status_code == 400
+    
     def test_invalid_expiration_format(self):
         """Test handling of invalid expiration format."""
         path = "/live/stream.m3u8"
@@ -260,7 +762,39 @@ segment002.ts
         assert response.status_code == 400
         assert response.json() == {"error": "invalid_expiration"}
     
+    def test_integer_parameter_parsing(self):
+        """Test that exp and _HLS_msn accept and reject the same strings on every path."""
+        path = "/live/stream.m3u8"
+        exp, sig = self.generate_valid_token(path)
+        grouped = "_".join(str(exp)[i:i + 3] for i in range(0, len(str(exp)), 3))
+        
+        for value in (f"{exp}.0", f"%2B{exp}", grouped):
+            response = self.client.get(f"{path}?exp={value}&sig={sig}")
+            assert response.status_code == 200, value
+        
+        for value in (f"+{exp}", f"%20{exp}", f"{exp}.5", f"{exp}e0"):
+            response = self.client.get(f"{path}?exp={value}&sig={sig}")
+            assert response.status_code == 400, value
+            assert response.json() == {"error": "invalid_expiration"}
+        
+        assert self.client.get(f"{path}?exp={exp}&sig={sig}&_HLS_msn=0.0").status_code == 200
+        response = self.client.get(f"{path}?exp={exp}&sig={sig}&_HLS_msn=+0")
+        assert response.json() == {"error": "invalid_blocking_request"}
+    
     def teardown_method(self):
         """Clean up test files."""
         import shutil
-        shutil.rmtree(self.temp_dir, ignore_errors=True)
\ No newline at end of file
+        import deps
+        deps._sessions = None
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+class TestAPIFastPath(TestAPI):
+    """Run every API test against the raw-ASGI /live fast path."""
+    
+    def setup_method(self):
+        """Set up test fixtures with the fast path in front of the app."""
+        super().setup_method()
+        self.client = TestClient(
+            LiveFastPath(app, manifest=main.manifest_response, segment=main.segment_response)
+        )
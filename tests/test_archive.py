@@ -0,0 +1,111 @@
+"""Unit tests for the memory-mapped byte-range media archive."""
+
+import asyncio
+from archive import MappedMediaFile, MediaArchive
+from manifest import ManifestCache, ManifestVersion
+from segment_cache import SegmentCache
+from streams import Stream
+
+
+def playlist(*entries) -> bytes:
+    lines = [b"#EXTM3U", b"#EXT-X-VERSION:4", b"#EXT-X-TARGETDURATION:2"]
+    for name, length, offset in entries:
+        lines += [b"#EXTINF:2.0,", f"#EXT-X-BYTERANGE:{length}@{offset}".encode(), name.encode()]
+    return b"\n".join(lines) + b"\n"
+
+
+class TestMappedMediaFile:
+    """Test cases for MappedMediaFile."""
+    
+    def test_refresh_maps_appended_bytes(self, tmp_path):
+        """Test that appended bytes are mapped by the next refresh, older views kept intact."""
+        path = tmp_path / "media.ts"
+        path.write_bytes(b"0123456789")
+        mapped = MappedMediaFile(str(path))
+        try:
+            first = mapped.view
+            assert bytes(first) == b"0123456789"
+            assert dict(mapped.headers)[b"content-length"] == b"10"
+            
+            with open(path, "ab") as f:
+                f.write(b"abcde")
+            assert mapped.size == 10
+            assert mapped.refresh() == 15
+            
+            assert bytes(mapped.view[10:]) == b"abcde"
+            assert bytes(first) == b"0123456789"
+            assert dict(mapped.headers)[b"content-length"] == b"15"
+            assert mapped.remaps == 1
+            mapped.advise([(3, 12)])
+        finally:
+            mapped.close()
+    
+    def test_empty_file(self, tmp_path):
+        """Test that a file the packager has not written to yet maps as empty."""
+        path = tmp_path / "media.ts"
+        path.write_bytes(b"")
+        mapped = MappedMediaFile(str(path))
+        try:
+            assert (mapped.size, bytes(mapped.view)) == (0, b"")
+            path.write_bytes(b"data")
+            assert mapped.refresh() == 4
+            assert mapped.remaps == 0
+        finally:
+            mapped.close()
+
+
+class TestMediaArchive:
+    """Test cases for MediaArchive."""
+    
+    def test_listed_files_mapped_once(self, tmp_path):
+        """Test that only listed files are mapped, once, and remapped as the playlist grows."""
+        (tmp_path / "media.ts").write_bytes(b"x" * 100)
+        archive = MediaArchive(str(tmp_path))
+        archive.update(ManifestVersion(playlist(("media.ts", 50, 0)), (1, 1, 1)))
+        
+        assert asyncio.run(archive.get("other.ts")) is None
+        first = asyncio.run(archive.get("media.ts"))
+        assert asyncio.run(archive.get("media.ts")) is first
+        assert first.size == 100
+        
+        with open(tmp_path / "media.ts", "ab") as f:
+            f.write(b"y" * 50)
+        archive.update(ManifestVersion(playlist(("media.ts", 50, 0), ("media.ts", 100, 50)), (1, 2, 1)))
+        
+        assert first.size == 150
+        assert archive.stats() == {
+            "files": 1,
+            "mapped": 1,
+            "mapped_bytes": 150,
+            "hits": 2,
+            "opened": 1,
+            "remaps": 1,
+            "errors": 0,
+        }
+    
+    def test_rolled_off_files_closed(self, tmp_path):
+        """Test that a media file the playlist no longer lists is closed."""
+        for name in ("media-1.ts", "media-2.ts"):
+            (tmp_path / name).write_bytes(b"x" * 10)
+        archive = MediaArchive(str(tmp_path))
+        archive.update(ManifestVersion(playlist(("media-1.ts", 10, 0)), (1, 1, 1)))
+        asyncio.run(archive.get("media-1.ts"))
+        
+        archive.update(ManifestVersion(playlist(("media-2.ts", 10, 0)), (1, 2, 1)))
+        
+        assert archive.files == {}
+        assert asyncio.run(archive.get("media-1.ts")) is None
+        assert asyncio.run(archive.get("missing.ts")) is None
+    
+    def test_stream_indexes_its_playlist(self, tmp_path):
+        """Test that a stream hands its playlist's byte ranges to its archive and skips them when warming."""
+        (tmp_path / "media.ts").write_bytes(b"x" * 20)
+        (tmp_path / "stream.m3u8").write_bytes(playlist(("media.ts", 10, 0), ("media.ts", 10, 10)))
+        segments = SegmentCache()
+        stream = Stream("", str(tmp_path), "stream.m3u8", segments, ManifestCache())
+        
+        assert stream.warm() == 0
+        assert stream.archive.lists("media.ts")
+        assert stream.is_media_file(str(tmp_path / "media.ts"))
+        assert str(tmp_path / "media.ts") not in segments
+        assert stream.stats()["byterange_files"]["files"] == 1
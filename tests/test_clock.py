@@ -0,0 +1,49 @@
+"""Unit tests for the coarse clock."""
+
+import asyncio
+import time
+from auth import TokenValidator
+from clock import CoarseClock, FrozenClock
+
+
+class TestCoarseClock:
+    """Test cases for CoarseClock and FrozenClock."""
+    
+    def test_not_ticking_reads_source(self):
+        """Test that a stopped clock reads its source on every call."""
+        now = [100.7]
+        clock = CoarseClock(source=lambda: now[0])
+        
+        assert clock.now() == 100
+        now[0] = 205.2
+        assert clock.now() == 205
+    
+    def test_ticking_caches_between_refreshes(self):
+        """Test that a running clock serves the cached second and refreshes it on the loop."""
+        now = [100.0]
+        clock = CoarseClock(interval=0.01, source=lambda: now[0])
+        
+        async def scenario():
+            clock.start()
+            now[0] = 101.0
+            cached = clock.now()
+            await asyncio.sleep(0.05)
+            refreshed = clock.now()
+            await clock.stop()
+            return cached, refreshed
+        
+        assert asyncio.run(scenario()) == (100, 101)
+    
+    def test_frozen_clock_drives_validator_expiry(self):
+        """Test that tests can freeze and advance time without patching time.time."""
+        clock = FrozenClock(int(time.time()))
+        validator = TokenValidator("test-secret-key", clock=clock)
+        path = "/live/stream.m3u8"
+        exp = clock.now() + 10
+        sig = validator._compute_signature(path, exp)
+        
+        assert validator.validate_request(path, exp, sig).is_valid is True
+        clock.advance(10)
+        assert validator.validate_request(path, exp, sig).is_valid is True
+        clock.advance(1)
+        assert validator.validate_request(path, exp, sig).status_code == 410
@@ -0,0 +1,54 @@
+"""Unit tests for the HTTP ingest helpers."""
+
+import asyncio
+from ingest import DiskSpill, ingest_authorized, is_ingest_name
+
+
+def test_ingest_authorized():
+    """Test that only a bearer token equal to the secret is accepted."""
+    assert ingest_authorized("Bearer push-secret", "push-secret")
+    assert ingest_authorized("bearer  push-secret ", "push-secret")
+    assert not ingest_authorized("Bearer push-secreT", "push-secret")
+    assert not ingest_authorized("Basic push-secret", "push-secret")
+    assert not ingest_authorized(None, "push-secret")
+
+
+def test_is_ingest_name():
+    """Test that only playlists and segments with plain names can be pushed."""
+    assert is_ingest_name("stream.m3u8")
+    assert is_ingest_name("segment001.ts")
+    assert not is_ingest_name("segment001.mp4")
+    assert not is_ingest_name(".stream.m3u8")
+    assert not is_ingest_name("..\\segment001.ts")
+
+
+class TestDiskSpill:
+    """Test cases for DiskSpill."""
+    
+    def test_writes_in_push_order(self, tmp_path):
+        """Test that the last push of a file wins on disk and removals follow writes."""
+        async def scenario():
+            spill = DiskSpill()
+            spill.start()
+            spill.write(str(tmp_path / "cam" / "index.m3u8"), b"first")
+            spill.write(str(tmp_path / "cam" / "index.m3u8"), b"second")
+            spill.write(str(tmp_path / "cam" / "seg1.ts"), b"segment")
+            spill.remove(str(tmp_path / "cam" / "seg1.ts"))
+            spill.remove(str(tmp_path / "cam" / "missing.ts"))
+            await spill.stop()
+            return spill.stats()
+        
+        stats = asyncio.run(scenario())
+        
+        assert (tmp_path / "cam" / "index.m3u8").read_bytes() == b"second"
+        assert sorted(path.name for path in (tmp_path / "cam").iterdir()) == ["index.m3u8"]
+        assert stats == {"written": 3, "removed": 2, "pending": 0, "dropped": 0, "errors": 0}
+    
+    def test_full_queue_drops_files(self, tmp_path):
+        """Test that pushes never wait on a disk that falls behind."""
+        spill = DiskSpill(max_pending=1)
+        spill.write(str(tmp_path / "seg1.ts"), b"one")
+        spill.write(str(tmp_path / "seg2.ts"), b"two")
+        
+        assert spill.stats()["dropped"] == 1
+        assert spill.stats()["pending"] == 1
@@ -0,0 +1,115 @@
+"""Unit tests for the versioned manifest cache."""
+
+import asyncio
+import os
+from manifest import ManifestCache, ManifestVersion, byterange_uris, etag_matches, playlist_position
+
+
+class TestManifestCache:
+    """Test cases for ManifestCache and ETag handling."""
+    
+    def test_unchanged_file_not_reread(self, tmp_path):
+        """Test that an unchanged manifest is served from memory after one stat."""
+        path = tmp_path / "stream.m3u8"
+        path.write_bytes(b"#EXTM3U\n")
+        cache = ManifestCache()
+        
+        first = asyncio.run(cache.fetch(str(path)))
+        second = asyncio.run(cache.fetch(str(path)))
+        
+        assert second is first
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+    
+    def test_replaced_file_gets_new_etag(self, tmp_path):
+        """Test that a manifest replaced by rename is picked up with a new ETag."""
+        path = tmp_path / "stream.m3u8"
+        path.write_bytes(b"#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:0\n")
+        cache = ManifestCache()
+        first = asyncio.run(cache.fetch(str(path)))
+        
+        (tmp_path / "stream.m3u8.tmp").write_bytes(b"#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:1\n")
+        os.rename(tmp_path / "stream.m3u8.tmp", path)
+        second = asyncio.run(cache.fetch(str(path)))
+        
+        assert second.data.endswith(b"SEQUENCE:1\n")
+        assert second.etag != first.etag
+        
+        os.unlink(path)
+        assert asyncio.run(cache.fetch(str(path))) is None
+    
+    def test_etag_matching(self):
+        """Test If-None-Match evaluation."""
+        etag = '"abc"'
+        
+        assert etag_matches('"abc"', etag) is True
+        assert etag_matches('"def", W/"abc"', etag) is True
+        assert etag_matches('*', etag) is True
+        assert etag_matches('"def"', etag) is False
+        assert etag_matches('abc', etag) is False
+        assert etag_matches(None, etag) is False
+    
+    def test_playlist_position(self):
+        """Test that the last segment and pending parts are found in a playlist."""
+        data = (
+            b"#EXTM3U\n#EXT-X-TARGETDURATION:4\n#EXT-X-MEDIA-SEQUENCE:10\n"
+            b"#EXT-X-PART:DURATION=1,URI=\"s10.0.ts\"\n#EXTINF:4.0,\ns10.ts\n"
+            b"#EXTINF:4.0,\ns11.ts\n"
+            b"#EXT-X-PART:DURATION=1,URI=\"s12.0.ts\"\n#EXT-X-PART:DURATION=1,URI=\"s12.1.ts\"\n"
+        )
+        
+        assert playlist_position(data) == (11, 2, 4)
+        assert playlist_position(b"#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:5\n") == (4, 0, None)
+        
+        manifest = ManifestVersion(data, (0, 0, 0))
+        assert manifest.contains(11) is True
+        assert manifest.contains(12) is False
+        assert manifest.contains(12, 1) is True
+        assert manifest.contains(12, 2) is False
+        assert manifest.contains(13, 0) is False
+    
+    def test_byterange_uris(self):
+        """Test that byte-range segments are indexed per media file, offsets carried over."""
+        data = (
+            b"#EXTM3U\n#EXT-X-VERSION:4\n"
+            b"#EXTINF:2.0,\n#EXT-X-BYTERANGE:100@0\nmedia.ts\n"
+            b"#EXTINF:2.0,\n#EXT-X-BYTERANGE:50\nmedia.ts?v=1\n"
+            b"#EXTINF:2.0,\n#EXT-X-BYTERANGE:10@5\nother.ts\n"
+            b"#EXTINF:2.0,\nwhole.ts\n"
+        )
+        
+        assert byterange_uris(data) == {"media.ts": [(0, 100), (100, 150)], "other.ts": [(5, 15)]}
+        assert ManifestVersion(data, (0, 0, 0)).byteranges["media.ts"][-1] == (100, 150)
+        assert ManifestVersion(b"#EXTM3U\n#EXTINF:2.0,\nwhole.ts\n", (0, 0, 0)).byteranges == {}
+    
+    def test_wait_for_woken_by_update(self, tmp_path):
+        """Test that a blocked request returns as soon as the segment is published."""
+        path = str(tmp_path / "stream.m3u8")
+        cache = ManifestCache()
+        cache.index = {}
+        cache.update(path, b"#EXTM3U\n#EXTINF:4.0,\ns0.ts\n", (1, 1, 1))
+        
+        async def scenario():
+            waiting = asyncio.ensure_future(cache.wait_for(path, 1, None, 5))
+            await asyncio.sleep(0.01)
+            assert cache.stats()["waiting"] == 1
+            cache.update(path, b"#EXTM3U\n#EXTINF:4.0,\ns0.ts\n#EXTINF:4.0,\ns1.ts\n", (1, 2, 2))
+            return await asyncio.wait_for(waiting, 1)
+        
+        manifest = asyncio.run(scenario())
+        
+        assert manifest.msn == 1
+        assert cache.stats()["blocked"] == 1
+        assert cache.stats()["waiting"] == 0
+    
+    def test_wait_for_timeout(self, tmp_path):
+        """Test that a blocked request gives up with the unchanged version."""
+        path = tmp_path / "stream.m3u8"
+        path.write_bytes(b"#EXTM3U\n#EXTINF:4.0,\ns0.ts\n")
+        cache = ManifestCache(poll_interval=0.01)
+        
+        manifest = asyncio.run(cache.wait_for(str(path), 1, None, 0.05))
+        
+        assert manifest.contains(1) is False
+        assert cache.stats()["blocking_timeouts"] == 1
+        assert cache.stats()["waiting"] == 0
@@ -0,0 +1,71 @@
+"""Unit tests for the playlist-driven segment prefetcher."""
+
+import os
+from manifest import ManifestCache, ManifestVersion, segment_uris
+from prefetch import SegmentPrefetcher
+from segment_cache import SegmentCache
+from streams import Stream
+
+
+def playlist(*names: str) -> bytes:
+    lines = [b"#EXTM3U", b"#EXT-X-TARGETDURATION:2"]
+    for name in names:
+        lines += [b"#EXTINF:2.0,", name.encode()]
+    return b"\n".join(lines) + b"\n"
+
+
+class TestSegmentPrefetcher:
+    """Test cases for SegmentPrefetcher."""
+    
+    def make(self, tmp_path):
+        prefetcher = SegmentPrefetcher(str(tmp_path))
+        advice = []
+        prefetcher._advise = lambda fd, offset, length, how: advice.append(
+            (os.path.basename(os.readlink(f"/proc/self/fd/{fd}")), how)
+        )
+        return prefetcher, advice
+    
+    def test_segment_uris(self):
+        """Test that segment URIs are reduced to base names without query strings."""
+        data = playlist("seg1.ts", "sub/seg2.ts?x=1") + b'#EXT-X-PART:DURATION=1,URI="p.ts"\n'
+        assert segment_uris(data) == {"seg1.ts", "seg2.ts"}
+    
+    def test_new_segments_prefetched_and_old_dropped(self, tmp_path):
+        """Test that only the difference between versions gets advice."""
+        for name in ("seg1.ts", "seg2.ts", "seg3.ts"):
+            (tmp_path / name).write_bytes(b"ts")
+        prefetcher, advice = self.make(tmp_path)
+        
+        prefetcher.update(ManifestVersion(playlist("seg1.ts", "seg2.ts"), (1, 1, 1)))
+        assert sorted(advice) == [
+            ("seg1.ts", os.POSIX_FADV_WILLNEED),
+            ("seg2.ts", os.POSIX_FADV_WILLNEED),
+        ]
+        
+        advice.clear()
+        prefetcher.update(ManifestVersion(playlist("seg2.ts", "seg3.ts"), (1, 2, 1)))
+        assert advice == [
+            ("seg3.ts", os.POSIX_FADV_WILLNEED),
+            ("seg1.ts", os.POSIX_FADV_DONTNEED),
+        ]
+        assert prefetcher.stats() == {"listed": 2, "prefetched": 3, "dropped": 1, "errors": 0}
+    
+    def test_missing_segments_skipped(self, tmp_path):
+        """Test that segments not on disk are ignored without counting errors."""
+        prefetcher, advice = self.make(tmp_path)
+        
+        prefetcher.update(ManifestVersion(playlist("gone.ts"), (1, 1, 1)))
+        
+        assert advice == []
+        assert prefetcher.stats()["errors"] == 0
+    
+    def test_stream_prefetches_its_playlist_only(self, tmp_path):
+        """Test that a stream hands new versions of its own playlist to the prefetcher."""
+        manifests = ManifestCache()
+        stream = Stream("", str(tmp_path), "stream.m3u8", SegmentCache(), manifests, prefetch=True)
+        
+        manifests.update(str(tmp_path / "other.m3u8"), playlist("a.ts"), (1, 1, 1))
+        assert stream.prefetcher.listed == frozenset()
+        manifests.update(stream.manifest_path, playlist("a.ts"), (1, 1, 1))
+        assert stream.prefetcher.listed == {"a.ts"}
+        assert "prefetch" in stream.stats()
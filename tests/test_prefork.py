@@ -0,0 +1,86 @@
+"""Unit tests for the pre-fork launcher."""
+
+import os
+import signal
+import threading
+import time
+from prefork import Supervisor, WorkerStats, bind_socket, merge_stats
+
+
+def wait_until(condition, timeout: float = 5) -> bool:
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestMergeStats:
+    """Test cases for adding up worker counters."""
+    
+    def test_counters_summed_and_ratio_recomputed(self):
+        """Test that nested counters are summed and hit_ratio is not."""
+        merged = merge_stats([
+            {"segment_cache": {"hits": 3, "misses": 1, "hit_ratio": 0.75}, "streams": {}},
+            {"segment_cache": {"hits": 0, "misses": 4, "hit_ratio": 0.0}, "streams": {"cam1": {"hits": 2}}},
+        ])
+        
+        assert merged["segment_cache"] == {"hits": 3, "misses": 5, "hit_ratio": 0.375}
+        assert merged["streams"] == {"cam1": {"hits": 2}}
+
+
+class TestWorkerStats:
+    """Test cases for sharing counters between workers."""
+    
+    def test_collect_adds_published_workers(self, tmp_path):
+        """Test that a worker reports its own live counters plus the others' published ones."""
+        other = WorkerStats(str(tmp_path))
+        other.pid = 1
+        other.publish({"token_cache": {"hits": 5}})
+        (tmp_path / "2.json").write_text("{truncated")
+        own = WorkerStats(str(tmp_path))
+        own.publish({"token_cache": {"hits": 100}})
+        
+        merged = own.collect({"token_cache": {"hits": 1}})
+        
+        assert merged == {"token_cache": {"hits": 6}, "workers": 2}
+
+
+class TestPrefork:
+    """Test cases for binding and supervising workers."""
+    
+    def test_workers_can_bind_the_same_port(self):
+        """Test that SO_REUSEPORT sockets share a port."""
+        first = bind_socket("127.0.0.1", 0)
+        try:
+            second = bind_socket("127.0.0.1", first.getsockname()[1])
+            second.close()
+        finally:
+            first.close()
+    
+    def test_crashed_worker_restarted(self, tmp_path):
+        """Test that a killed worker is replaced and stop() ends supervision."""
+        started = tmp_path / "started"
+        
+        def worker() -> int:
+            with open(started, "a") as f:
+                f.write(f"{os.getpid()}\n")
+            time.sleep(30)
+            return 0
+        
+        exited = []
+        supervisor = Supervisor(worker, workers=2, min_uptime=0, on_exit=exited.append)
+        thread = threading.Thread(target=supervisor.run, kwargs={"install_signals": False})
+        thread.start()
+        try:
+            assert wait_until(lambda: started.exists() and len(started.read_text().split()) == 2)
+            victim = int(started.read_text().split()[0])
+            os.kill(victim, signal.SIGKILL)
+            assert wait_until(lambda: len(started.read_text().split()) == 3)
+        finally:
+            supervisor.stop()
+            thread.join(10)
+        
+        assert not thread.is_alive()
+        assert supervisor.restarts == 1
+        assert exited[0] == victim
+        assert len(exited) == 3
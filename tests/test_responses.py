@@ -0,0 +1,54 @@
+"""Unit tests for segment response helpers."""
+
+from responses import if_range_matches, parse_range, partial_layout, segment_headers
+
+
+class TestParseRange:
+    """Test cases for Range header parsing."""
+    
+    def test_single_ranges(self):
+        """Test closed, open-ended and suffix ranges, clamped to the size."""
+        assert parse_range("bytes=0-4", 10) == [(0, 5)]
+        assert parse_range("bytes=5-", 10) == [(5, 10)]
+        assert parse_range("bytes=-3", 10) == [(7, 10)]
+        assert parse_range("bytes=-30", 10) == [(0, 10)]
+        assert parse_range("bytes=8-100", 10) == [(8, 10)]
+        assert parse_range("Bytes = 1-1", 10) == [(1, 2)]
+    
+    def test_multiple_ranges_keep_request_order(self):
+        """Test that several ranges are returned as requested, unsatisfiable ones dropped."""
+        assert parse_range("bytes=6-7, 0-1, 50-60", 10) == [(6, 8), (0, 2)]
+    
+    def test_unsatisfiable(self):
+        """Test that ranges past the end give an empty list (416)."""
+        assert parse_range("bytes=10-", 10) == []
+        assert parse_range("bytes=-0", 10) == []
+        assert parse_range("bytes=0-5", 0) == []
+    
+    def test_ignored(self):
+        """Test that invalid or unsupported headers are ignored."""
+        for value in ("items=0-1", "bytes=", "bytes=5-2", "bytes=a-b", "bytes=1", "bytes=-", "bytes=１-2"):
+            assert parse_range(value, 10) is None, value
+        assert parse_range("bytes=" + ",".join(["0-0"] * 17), 10) is None
+
+
+class TestPartialLayout:
+    """Test cases for 206 headers and bodies."""
+    
+    def test_multipart_length_matches_body(self):
+        """Test that content-length counts the framing and the ranges."""
+        headers, pieces = partial_layout([(0, 2), (5, 10)], 10, segment_headers(10, 0))
+        
+        length = sum(len(piece) if isinstance(piece, bytes) else piece[1] - piece[0] for piece in pieces)
+        assert dict(headers)[b"content-length"] == str(length).encode()
+        assert dict(headers)[b"content-type"].startswith(b"multipart/byteranges; boundary=")
+        assert b"content-range: bytes 5-9/10" in pieces[2]
+    
+    def test_if_range_needs_exact_last_modified(self):
+        """Test that only the segment's own Last-Modified date lets ranges through."""
+        headers = segment_headers(10, 1_700_000_000 * 10**9)
+        last_modified = dict(headers)[b"last-modified"].decode()
+        
+        assert if_range_matches(None, headers)
+        assert if_range_matches(last_modified, headers)
+        assert not if_range_matches('"some-etag"', headers)
@@ -0,0 +1,219 @@
+"""Unit tests for SegmentCache."""
+
+import asyncio
+import os
+import pytest
+from clock import FrozenClock
+from segment_cache import OversizedSegment, SegmentCache
+
+
+class TestSegmentCache:
+    """Test cases for the in-memory segment cache."""
+    
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.clock = FrozenClock(1_000_000)
+    
+    def write(self, tmp_path, name: str, data: bytes) -> str:
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    
+    def test_second_fetch_served_from_memory(self, tmp_path):
+        """Test that a repeated fetch is a hit and does not touch the file."""
+        cache = SegmentCache(max_bytes=1024, clock=self.clock)
+        path = self.write(tmp_path, "segment001.ts", b"fake ts content 1")
+        
+        assert asyncio.run(cache.fetch(path)).data == b"fake ts content 1"
+        os.unlink(path)
+        assert asyncio.run(cache.fetch(path)).data == b"fake ts content 1"
+        
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+        assert stats["hit_ratio"] == 0.5
+        assert stats["bytes_served"] == len(b"fake ts content 1")
+    
+    def test_revalidates_after_max_age(self, tmp_path):
+        """Test that entries older than max-age are re-checked against the file."""
+        cache = SegmentCache(max_bytes=1024, ttl=10, clock=self.clock)
+        path = self.write(tmp_path, "segment001.ts", b"old")
+        asyncio.run(cache.fetch(path))
+        
+        with open(path, 'wb') as f:
+            f.write(b"rewritten")
+        os.utime(path, ns=(0, 42))
+        assert asyncio.run(cache.fetch(path)).data == b"old"
+        
+        self.clock.advance(10)
+        assert asyncio.run(cache.fetch(path)).data == b"rewritten"
+        
+        os.unlink(path)
+        self.clock.advance(10)
+        assert asyncio.run(cache.fetch(path)) is None
+        assert len(cache) == 0
+    
+    def test_byte_budget_evicts_least_recently_used(self, tmp_path):
+        """Test that the memory ceiling is enforced in LRU order."""
+        cache = SegmentCache(max_bytes=20, max_item_bytes=10, clock=self.clock)
+        paths = [self.write(tmp_path, f"segment{i}.ts", bytes(8)) for i in range(3)]
+        
+        asyncio.run(cache.fetch(paths[0]))
+        asyncio.run(cache.fetch(paths[1]))
+        asyncio.run(cache.fetch(paths[0]))
+        asyncio.run(cache.fetch(paths[2]))
+        
+        assert paths[0] in cache and paths[2] in cache
+        assert paths[1] not in cache
+        assert cache.size_bytes == 16
+    
+    def test_oversized_segment_not_cached(self, tmp_path):
+        """Test that segments above max_item_bytes are never read into memory."""
+        cache = SegmentCache(max_bytes=100, max_item_bytes=4, clock=self.clock)
+        path = self.write(tmp_path, "big.ts", b"0123456789")
+        
+        oversized = asyncio.run(cache.fetch(path))
+        assert isinstance(oversized, OversizedSegment)
+        assert (oversized.path, oversized.size) == (path, 10)
+        assert len(cache) == 0
+        assert cache.stats()["uncached"] == 1
+    
+    def test_indexed_lookups_skip_the_filesystem(self, tmp_path, monkeypatch):
+        """Test that with an index, misses and hits never stat the file."""
+        cache = SegmentCache(max_bytes=1024, clock=self.clock)
+        path = self.write(tmp_path, "segment001.ts", b"indexed")
+        st = os.stat(path)
+        cache.index = {path: (st.st_ino, st.st_mtime_ns, st.st_size)}
+        
+        def no_stat(*args, **kwargs):
+            raise AssertionError("stat called")
+        monkeypatch.setattr(os, "stat", no_stat)
+        
+        assert asyncio.run(cache.fetch(str(tmp_path / "missing.ts"))) is None
+        first = asyncio.run(cache.fetch(path))
+        second = asyncio.run(cache.fetch(path))
+        assert second is first
+        assert first.data == b"indexed"
+        assert (b"content-length", b"7") in first.headers
+    
+    def test_oversized_headers_rendered_once_per_version(self, tmp_path):
+        """Test that an oversized file keeps its entry until the file changes."""
+        cache = SegmentCache(max_bytes=100, max_item_bytes=4, clock=self.clock)
+        path = self.write(tmp_path, "big.ts", b"0123456789")
+        
+        first = asyncio.run(cache.fetch(path))
+        assert asyncio.run(cache.fetch(path)) is first
+        
+        self.write(tmp_path, "big.ts", b"01234567890123")
+        os.utime(path, ns=(0, 42))
+        changed = asyncio.run(cache.fetch(path))
+        assert changed is not first
+        assert (b"content-length", b"14") in changed.headers
+    
+    def test_concurrent_misses_share_one_read(self, tmp_path, monkeypatch):
+        """Test that simultaneous requests for a new segment read it once."""
+        import segment_cache
+        cache = SegmentCache(max_bytes=1024, clock=self.clock)
+        path = self.write(tmp_path, "segment001.ts", b"popular")
+        reads = []
+        read_file = segment_cache._read_file
+        monkeypatch.setattr(segment_cache, "_read_file", lambda p: reads.append(p) or read_file(p))
+        
+        async def fetch_many():
+            return await asyncio.gather(*(cache.fetch(path) for _ in range(5)))
+        
+        results = asyncio.run(fetch_many())
+        
+        assert reads == [path]
+        assert all(result is results[0] for result in results)
+        assert results[0].data == b"popular"
+        stats = cache.stats()
+        assert (stats["misses"], stats["coalesced"]) == (1, 4)
+    
+    def test_cancelled_first_request_does_not_fail_others(self, tmp_path):
+        """Test that a waiter still gets the segment when the request that started the read goes away."""
+        cache = SegmentCache(max_bytes=1024, clock=self.clock)
+        path = self.write(tmp_path, "segment001.ts", b"popular")
+        
+        async def fetch_after_cancel():
+            first = asyncio.ensure_future(cache.fetch(path))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(cache.fetch(path))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+        
+        assert asyncio.run(fetch_after_cancel()).data == b"popular"
+        assert cache.coalesced == 1
+    
+    def test_growing_segment_streamed_until_finished(self):
+        """Test that a reader follows appends and gets the tail written before close."""
+        cache = SegmentCache(max_bytes=100, clock=self.clock)
+        cache.index = {}
+        
+        async def scenario():
+            cache.grow("/hls/part.ts", b"abc")
+            buffer = await cache.open_stream("/hls/part.ts")
+            chunks = []
+            
+            async def read():
+                async for chunk in buffer.stream():
+                    chunks.append(chunk)
+            
+            reader = asyncio.ensure_future(read())
+            await asyncio.sleep(0)
+            cache.grow("/hls/part.ts", b"def")
+            await asyncio.sleep(0)
+            cache.put("/hls/part.ts", b"abcdefgh", (1, 1, 8))
+            await asyncio.wait_for(reader, 1)
+            return chunks
+        
+        assert b"".join(asyncio.run(scenario())) == b"abcdefgh"
+        assert cache.growing == {}
+        assert cache.stats()["growing_bytes"] == 0
+        assert cache.stats()["streamed"] == 1
+    
+    def test_open_stream_waits_for_preload_hint(self):
+        """Test waiting for a hinted segment to start, and giving up after the timeout."""
+        cache = SegmentCache(max_bytes=100, clock=self.clock)
+        cache.index = {}
+        
+        async def scenario():
+            waiting = asyncio.ensure_future(cache.open_stream("/hls/next.ts", timeout=5))
+            await asyncio.sleep(0.01)
+            cache.grow("/hls/next.ts", b"x")
+            started = await asyncio.wait_for(waiting, 1)
+            missing = await cache.open_stream("/hls/never.ts", timeout=0.02)
+            return started, missing
+        
+        started, missing = asyncio.run(scenario())
+        assert started is cache.growing["/hls/next.ts"]
+        assert missing is None
+    
+    def test_growing_segments_count_against_budget(self):
+        """Test that growing bytes evict cached segments and abandoned writes are capped."""
+        cache = SegmentCache(max_bytes=20, max_item_bytes=10, clock=self.clock)
+        cache.put("/hls/old.ts", bytes(8), (1, 1, 8))
+        
+        cache.grow("/hls/a.ts", bytes(8))
+        cache.grow("/hls/b.ts", bytes(8))
+        assert "/hls/old.ts" not in cache
+        assert cache.stats()["growing_bytes"] == 16
+        
+        # A third write overflows the budget: the oldest growing segment is abandoned
+        abandoned = cache.growing["/hls/a.ts"]
+        cache.grow("/hls/c.ts", bytes(8))
+        assert abandoned.abandoned is True
+        assert "/hls/a.ts" not in cache.growing
+        assert cache.stats()["growing_bytes"] == 16
+        
+        # Later appends to an abandoned segment are ignored, as are oversized segments
+        cache.grow("/hls/a.ts", b"more")
+        cache.grow("/hls/b.ts", bytes(4))
+        assert "/hls/a.ts" not in cache.growing
+        assert "/hls/b.ts" not in cache.growing
+        
+        async def read():
+            return [chunk async for chunk in abandoned.stream()]
+        
+        with pytest.raises(OSError):
+            asyncio.run(read())
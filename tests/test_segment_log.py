@@ -0,0 +1,119 @@
+"""Unit tests for the append-only segment log."""
+
+import asyncio
+import errno
+import os
+import pytest
+from clock import FrozenClock
+from segment_cache import SegmentCache
+from segment_log import SegmentLog
+
+
+class TestSegmentLog:
+    """Test cases for SegmentLog."""
+    
+    def test_put_then_get_returns_logged_view(self, tmp_path):
+        """Test that appended bytes come back as a view of the log, once per version."""
+        log = SegmentLog(str(tmp_path), file_bytes=1024, files=2, slots=8)
+        
+        view, ticket = log.put("/hls/seg1.ts", b"segment one", (1, 2, 11))
+        found, found_ticket = log.get("/hls/seg1.ts", (1, 2, 11))
+        
+        assert bytes(found) == b"segment one"
+        assert isinstance(found, memoryview)
+        assert found_ticket == ticket
+        assert log.get("/hls/seg1.ts", (1, 3, 11)) is None
+        assert log.get("/hls/seg2.ts", (1, 2, 11)) is None
+        assert log.put("/hls/seg1.ts", b"segment one", (1, 2, 11))[1] == ticket
+        assert log.stats()["appended"] == 1
+        # Log files are unlinked as soon as they are created
+        assert os.listdir(tmp_path) == []
+    
+    def test_oldest_file_dropped_whole(self, tmp_path):
+        """Test that retention drops the oldest log file and everything in it."""
+        log = SegmentLog(str(tmp_path), file_bytes=1024, files=2, slots=64)
+        tickets = [log.put(f"/hls/seg{i}.ts", bytes([i]) * 400, (1, 1, 400))[1] for i in range(6)]
+        
+        # Two segments per file: seg0 and seg1 went with the first file
+        assert [log.valid(ticket) for ticket in tickets] == [False, False, True, True, True, True]
+        assert log.get("/hls/seg1.ts", (1, 1, 400)) is None
+        assert bytes(log.get("/hls/seg2.ts", (1, 1, 400))[0]) == bytes([2]) * 400
+        assert log.put("/hls/big.ts", bytes(2048), (1, 1, 2048)) is None
+        assert log.stats() == {
+            "appended": 6,
+            "found": 1,
+            "files": 2,
+            "bytes": 1824,
+            "dropped_files": 1,
+            "oversized": 1,
+            "errors": 0,
+        }
+    
+    def test_index_records_reused(self, tmp_path):
+        """Test that a segment whose index record was reused is no longer found."""
+        log = SegmentLog(str(tmp_path), file_bytes=1024, files=2, slots=2)
+        _, first = log.put("/hls/seg0.ts", b"a", (1, 1, 1))
+        log.put("/hls/seg1.ts", b"b", (1, 1, 1))
+        log.put("/hls/seg2.ts", b"c", (1, 1, 1))
+        
+        assert not log.valid(first)
+        assert log.get("/hls/seg0.ts", (1, 1, 1)) is None
+        assert bytes(log.get("/hls/seg2.ts", (1, 1, 1))[0]) == b"c"
+    
+    def test_evicted_segments_found_in_log(self, tmp_path, monkeypatch):
+        """Test that a segment evicted from the cache is served from the log without a read."""
+        log = SegmentLog(str(tmp_path), file_bytes=1024, slots=8)
+        cache = SegmentCache(max_bytes=16, max_item_bytes=16, clock=FrozenClock(1000), store=log)
+        first = tmp_path / "seg1.ts"
+        second = tmp_path / "seg2.ts"
+        first.write_bytes(b"first segment")
+        second.write_bytes(b"second segment")
+        
+        asyncio.run(cache.fetch(str(first)))
+        asyncio.run(cache.fetch(str(second)))
+        assert str(first) not in cache
+        monkeypatch.setattr("segment_cache._read_file", lambda path: pytest.fail("segment read again"))
+        entry = asyncio.run(cache.fetch(str(first)))
+        
+        assert isinstance(entry.data, memoryview)
+        assert entry.data == b"first segment"
+        assert log.stats()["found"] == 1
+    
+    def test_full_disk_falls_back_to_cache(self, tmp_path, monkeypatch):
+        """Test that a log file that cannot be reserved leaves the segment in the cache's own memory."""
+        def no_space(fd, offset, length):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        
+        monkeypatch.setattr(os, "posix_fallocate", no_space, raising=False)
+        log = SegmentLog(str(tmp_path), file_bytes=1024, slots=8)
+        cache = SegmentCache(max_bytes=1024, clock=FrozenClock(1000), store=log)
+        
+        entry = cache.put("/hls/seg1.ts", b"segment one", (1, 2, 11))
+        
+        assert entry.data == b"segment one"
+        assert entry.ticket is None
+        assert log.stats()["errors"] == 1
+        assert os.listdir(tmp_path) == []
+    
+    def test_forked_worker_appends_to_its_own_file(self, tmp_path):
+        """Test that a forked worker keeps the parent's entries but never writes the parent's files."""
+        log = SegmentLog(str(tmp_path), file_bytes=1024, files=4, slots=8)
+        view, _ = log.put("/hls/seg0.ts", b"from parent", (1, 1, 11))
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                found = log.get("/hls/seg0.ts", (1, 1, 11))
+                child_view, _ = log.put("/hls/seg1.ts", b"from child!", (1, 1, 11))
+                if bytes(found[0]) == b"from parent" and log.stats()["files"] == 2:
+                    code = 0
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        
+        assert os.waitstatus_to_exitcode(status) == 0
+        # The child's bytes did not land after the parent's in the shared file
+        assert bytes(log._files[0][11:22]) == bytes(11)
+        view, _ = log.put("/hls/seg2.ts", b"parent next", (1, 1, 11))
+        assert bytes(log.get("/hls/seg0.ts", (1, 1, 11))[0]) == b"from parent"
+        assert bytes(view) == b"parent next"
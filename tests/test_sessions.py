@@ -0,0 +1,86 @@
+"""Unit tests for SessionTable."""
+
+import time
+from auth import TokenValidator
+from sessions import SessionTable, parse_session_cookie, session_scope
+
+
+class TestSessionTable:
+    """Test cases for signed session cookies."""
+    
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.secret = "test-secret-key"
+        self.validator = TokenValidator(self.secret, keys={"k1": "rotated-secret"})
+        self.sessions = SessionTable(self.validator)
+    
+    def test_issued_cookie_authorizes_stream_segments(self):
+        """Test that a cookie issued for a stream authorizes its segments."""
+        cookie = self.sessions.issue("/live/", int(time.time()) + 60)
+        
+        assert self.sessions.validate(cookie, "/live/segment001.ts") is True
+        assert self.sessions.validate(cookie, "/live/segment002.ts") is True
+        assert self.sessions.sessions.stats()["hits"] == 2
+    
+    def test_cookie_bound_to_stream(self):
+        """Test that a cookie does not authorize another stream directory."""
+        cookie = self.sessions.issue("/live/cam1/", int(time.time()) + 60)
+        
+        assert self.sessions.validate(cookie, "/live/cam2/segment001.ts") is False
+        assert self.sessions.validate(cookie, "/live/segment001.ts") is False
+    
+    def test_cookie_from_other_process_verified_once(self):
+        """Test that a cookie unknown to this table is verified by HMAC and cached."""
+        cookie = SessionTable(TokenValidator(self.secret)).issue("/live/", int(time.time()) + 60)
+        
+        assert self.sessions.validate(cookie, "/live/segment001.ts") is True
+        assert self.sessions.sessions.stats()["misses"] == 1
+        assert self.sessions.validate(cookie, "/live/segment002.ts") is True
+        assert self.sessions.sessions.stats()["hits"] == 1
+    
+    def test_expired_forged_and_malformed_cookies(self):
+        """Test rejection of expired, tampered and malformed cookies."""
+        expired = self.sessions.issue("/live/", int(time.time()) - 1)
+        assert self.sessions.validate(expired, "/live/segment001.ts") is False
+        
+        sid, exp, sig, kid = parse_session_cookie(self.sessions.issue("/live/", int(time.time()) + 60))
+        assert kid is None
+        assert self.sessions.validate(f"{sid}.{exp + 3600}.{sig}", "/live/segment001.ts") is False
+        other = SessionTable(TokenValidator("other-secret"))
+        assert other.validate(f"{sid}.{exp}.{sig}", "/live/segment001.ts") is False
+        
+        for value in ("", "garbage", "a.b.c", "a.1.c.d", "a.1.c.!", "a.1.c.d.e"):
+            assert self.sessions.validate(value, "/live/segment001.ts") is False
+    
+    def test_session_scope(self):
+        """Test that the scope is the lowercased directory of the path."""
+        assert session_scope("/live/stream.m3u8") == "/live/"
+        assert session_scope("/LIVE/Cam1/index.m3u8") == "/live/cam1/"
+    
+    def test_cookie_bound_to_signing_key(self):
+        """Test that a session issued under a key id is signed with that key and checked against it."""
+        cookie = self.sessions.issue("/live/", int(time.time()) + 60, kid="k1")
+        assert parse_session_cookie(cookie)[3] == "k1"
+        
+        # Another worker with the same keys accepts it, one without the key does not
+        assert SessionTable(TokenValidator(self.secret, keys={"k1": "rotated-secret"})).validate(cookie, "/live/a.ts")
+        assert not SessionTable(TokenValidator(self.secret)).validate(cookie, "/live/a.ts")
+        # A different key id in the cookie no longer matches the signature
+        sid, exp, sig, _ = parse_session_cookie(cookie)
+        assert not self.sessions.validate(f"{sid}.{exp}.{sig}", "/live/a.ts")
+        assert self.sessions.issue("/live/", int(time.time()) + 60, kid="unknown") is None
+    
+    def test_revoked_key_ends_its_sessions(self):
+        """Test that removing or replacing a key invalidates sessions already cached under it."""
+        revoked = self.sessions.issue("/live/", int(time.time()) + 60, kid="k1")
+        default = self.sessions.issue("/live/", int(time.time()) + 60)
+        assert self.sessions.validate(revoked, "/live/segment001.ts") is True
+        
+        self.validator.set_keys({"k2": "next-secret"})
+        
+        assert self.sessions.validate(revoked, "/live/segment001.ts") is False
+        assert self.sessions.validate(default, "/live/segment001.ts") is True
+        
+        replaced = self.sessions.issue("/live/", int(time.time()) + 60, kid="k2")
+        self.validator.set_keys({"k2": "replaced-secret"})
+        assert self.sessions.validate(replaced, "/live/segment001.ts") is False
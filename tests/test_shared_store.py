@@ -0,0 +1,119 @@
+"""Unit tests for the segment store shared between workers."""
+
+import asyncio
+import os
+from clock import FrozenClock
+from segment_cache import SegmentCache
+from shared_store import SharedSegmentStore
+
+
+class TestSharedSegmentStore:
+    """Test cases for SharedSegmentStore."""
+    
+    def test_put_then_get_returns_shared_view(self):
+        """Test that stored bytes come back as a view of the same memory."""
+        store = SharedSegmentStore(1024, slots=8)
+        
+        view, ticket = store.put("/hls/seg1.ts", b"segment one", (1, 2, 11))
+        found, found_ticket = store.get("/hls/seg1.ts", (1, 2, 11))
+        
+        assert bytes(found) == b"segment one"
+        assert isinstance(found, memoryview)
+        assert found_ticket == ticket
+        assert store.get("/hls/seg1.ts", (1, 3, 11)) is None
+        assert store.get("/hls/seg2.ts", (1, 2, 11)) is None
+    
+    def test_same_version_stored_once(self):
+        """Test that a second writer of the same version does not copy again."""
+        store = SharedSegmentStore(1024, slots=8)
+        
+        store.put("/hls/seg1.ts", b"abc", (1, 2, 3))
+        store.put("/hls/seg1.ts", b"abc", (1, 2, 3))
+        
+        assert store.stats() == {"stored": 1, "found": 0, "deduplicated": 1, "lock_busy": 0}
+    
+    def test_busy_lock_skips_publishing(self):
+        """Test that a writer finding the lock taken gives up at once instead of blocking."""
+        store = SharedSegmentStore(1024, slots=8)
+        
+        with store.lock:
+            assert store.put("/hls/seg1.ts", b"abc", (1, 2, 3)) is None
+        
+        assert store.stats()["lock_busy"] == 1
+        assert store.put("/hls/seg1.ts", b"abc", (1, 2, 3)) is not None
+    
+    def test_torn_bytes_are_a_miss(self):
+        """Test that a slot whose bytes do not match its checksum is not served."""
+        store = SharedSegmentStore(1024, slots=8)
+        view, _ = store.put("/hls/seg1.ts", b"segment one", (1, 2, 11))
+        
+        # What a reader on another CPU may see before the writer's bytes arrive
+        view[0:1] = b"X"
+        
+        assert store.get("/hls/seg1.ts", (1, 2, 11)) is None
+    
+    def test_entries_expire_before_being_overwritten(self):
+        """Test that an entry is invalid once the arena is about to reuse its bytes."""
+        store = SharedSegmentStore(1024, slots=64)
+        _, first = store.put("/hls/seg0.ts", bytes(200), (1, 1, 200))
+        
+        for i in range(1, 4):
+            store.put(f"/hls/seg{i}.ts", bytes(200), (1, 1, 200))
+        
+        assert not store.valid(first)
+        assert store.get("/hls/seg0.ts", (1, 1, 200)) is None
+        assert store.get("/hls/seg3.ts", (1, 1, 200)) is not None
+        assert store.put("/hls/big.ts", bytes(300), (1, 1, 300)) is None
+    
+    def test_forked_worker_sees_parent_entries(self):
+        """Test that a worker forked after creation reads what another process stores."""
+        store = SharedSegmentStore(1024, slots=8)
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                store.put("/hls/seg1.ts", b"from child", (1, 2, 10))
+                code = 0
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        
+        assert os.waitstatus_to_exitcode(status) == 0
+        assert bytes(store.get("/hls/seg1.ts", (1, 2, 10))[0]) == b"from child"
+    
+    def test_segment_caches_share_bytes(self, tmp_path):
+        """Test that a second cache serves another cache's segment without reading the file."""
+        store = SharedSegmentStore(1024, slots=8)
+        clock = FrozenClock(1000)
+        path = tmp_path / "seg1.ts"
+        path.write_bytes(b"shared bytes")
+        first = SegmentCache(max_bytes=1024, clock=clock, store=store)
+        second = SegmentCache(max_bytes=1024, clock=clock, store=store)
+        
+        assert asyncio.run(first.fetch(str(path))).data == b"shared bytes"
+        entry = asyncio.run(second.fetch(str(path)))
+        
+        assert isinstance(entry.data, memoryview)
+        assert entry.data == b"shared bytes"
+        assert store.stats()["found"] == 1
+    
+    def test_replaced_file_found_in_store_accounted_once(self, tmp_path):
+        """Test that a new version found in the store replaces the cached one without counting it twice."""
+        store = SharedSegmentStore(4096, slots=8)
+        clock = FrozenClock(1000)
+        path = tmp_path / "seg1.ts"
+        first = SegmentCache(max_bytes=16384, clock=clock, store=store)
+        second = SegmentCache(max_bytes=16384, clock=clock, store=store)
+        
+        for i in range(3):
+            replacement = tmp_path / "seg1.ts.new"
+            replacement.write_bytes(bytes([i]) * 1000)
+            os.replace(replacement, path)
+            clock.advance(first.ttl)
+            # Another worker publishes the new version before this one revalidates
+            asyncio.run(second.fetch(str(path)))
+            entry = asyncio.run(first.fetch(str(path)))
+            
+            assert entry.data == bytes([i]) * 1000
+            assert first.size_bytes == 1000
+        assert store.stats()["found"] == 3
@@ -0,0 +1,253 @@
+"""Conformance tests run against every storage backend."""
+
+import asyncio
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from manifest import ManifestCache
+from segment_cache import SegmentCache
+from storage import FilesystemBackend, MappedBackend, MemoryBackend, StorageBackend, UpstreamBackend, create_backend
+from streams import Stream
+
+
+PLAYLIST = b"#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXT-X-MEDIA-SEQUENCE:0\n#EXTINF:2.0,\nseg0.ts\n"
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Static file handler that does not log every request."""
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class Origin:
+    """Creates one kind of backend and publishes files to it the way its source would."""
+    
+    def __init__(self, kind: str, root: str):
+        self.kind = kind
+        self.root = root
+        self.memory = MemoryBackend()
+        self.server = None
+        if kind == "upstream":
+            handler = functools.partial(QuietHandler, directory=root)
+            self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def backend(self):
+        """Create the backend; called on the event loop the test runs."""
+        if self.kind == "filesystem":
+            return FilesystemBackend(self.root, poll_interval=0.05)
+        if self.kind == "mmap":
+            return MappedBackend(self.root, poll_interval=0.05)
+        if self.kind == "memory":
+            return self.memory
+        return UpstreamBackend(
+            f"http://127.0.0.1:{self.server.server_port}/",
+            ttl=0.05,
+            watch_names=("index.m3u8",),
+        )
+    
+    def publish(self, name: str, data: bytes) -> None:
+        """Write a file completely, replacing any previous version atomically."""
+        if self.kind == "memory":
+            self.memory.put(name, data)
+            return
+        temporary = os.path.join(self.root, f".{name}.tmp")
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, os.path.join(self.root, name))
+    
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+@pytest.fixture(params=["filesystem", "mmap", "memory", "upstream"])
+def origin(request, tmp_path):
+    origin = Origin(request.param, str(tmp_path))
+    yield origin
+    origin.close()
+
+
+class TestStorageBackends:
+    """Behavior every storage backend must share."""
+    
+    def test_get_returns_bytes_version_and_headers(self, origin):
+        """Test that a stored file comes back whole, with segment headers, and a missing one as None."""
+        origin.publish("seg0.ts", b"segment zero")
+        
+        async def scenario():
+            backend = origin.backend()
+            try:
+                stored = await backend.get("seg0.ts")
+                again = await backend.get("seg0.ts")
+                missing = await backend.get("seg1.ts")
+                return stored, again, missing, backend.stats()
+            finally:
+                await backend.close()
+        
+        stored, again, missing, stats = asyncio.run(scenario())
+        
+        assert bytes(stored.data) == b"segment zero"
+        assert again.version == stored.version
+        assert dict(stored.headers)[b"content-length"] == b"12"
+        assert dict(stored.headers)[b"content-type"] == b"video/mp2t"
+        assert missing is None
+        assert (stats["kind"], stats["gets"], stats["misses"]) == (origin.kind, 3, 1)
+    
+    def test_replaced_playlist_gets_new_version(self, origin):
+        """Test that a playlist rewritten by the packager is returned in its new version."""
+        origin.publish("index.m3u8", PLAYLIST)
+        
+        async def scenario():
+            backend = origin.backend()
+            try:
+                first = await backend.get("index.m3u8")
+                origin.publish("index.m3u8", PLAYLIST + b"#EXTINF:2.0,\nseg1.ts\n")
+                # The upstream backend revalidates once its TTL expired
+                await asyncio.sleep(0.1)
+                return first, await backend.get("index.m3u8")
+            finally:
+                await backend.close()
+        
+        first, second = asyncio.run(scenario())
+        
+        assert bytes(first.data) == PLAYLIST
+        assert bytes(second.data).endswith(b"seg1.ts\n")
+        assert second.version != first.version
+    
+    def test_watch_reports_changed_playlist(self, origin):
+        """Test that watch yields the playlist's name when it changes."""
+        origin.publish("index.m3u8", PLAYLIST)
+        
+        async def scenario():
+            backend = origin.backend()
+            changes = backend.watch()
+            try:
+                name = asyncio.ensure_future(changes.__anext__())
+                await asyncio.sleep(0.2)
+                origin.publish("index.m3u8", PLAYLIST + b"#EXTINF:2.0,\nseg1.ts\n")
+                names = [await asyncio.wait_for(name, 5)]
+                while names[-1] != "index.m3u8":
+                    names.append(await asyncio.wait_for(changes.__anext__(), 5))
+                return names[-1]
+            finally:
+                await changes.aclose()
+                await backend.close()
+        
+        assert asyncio.run(scenario()) == "index.m3u8"
+    
+    def test_names_outside_the_stream_rejected(self, origin):
+        """Test that only plain file names are looked up."""
+        origin.publish("seg0.ts", b"segment zero")
+        
+        async def scenario():
+            backend = origin.backend()
+            try:
+                return [await backend.get(name) for name in ("../seg0.ts", "", "..", "sub/seg0.ts")]
+            finally:
+                await backend.close()
+        
+        assert asyncio.run(scenario()) == [None, None, None, None]
+
+
+class TestMemoryBackend:
+    """Test cases for MemoryBackend."""
+    
+    def test_versions_differ_within_one_clock_tick(self):
+        """Test that two writes with the same time and size still get different versions."""
+        backend = MemoryBackend()
+        first = backend.put("index.m3u8", b"one", mtime_ns=1)
+        second = backend.put("index.m3u8", b"two", mtime_ns=1)
+        
+        assert first.version != second.version
+        assert backend.delete("index.m3u8")
+        assert not backend.delete("index.m3u8")
+        assert backend.stats()["files"] == 0
+    
+    def test_ring_evicts_oldest_segments(self):
+        """Test that a full ring drops its oldest segments but keeps the playlist."""
+        backend = MemoryBackend(max_bytes=10)
+        backend.put("index.m3u8", b"list")
+        backend.put("seg1.ts", b"111")
+        backend.put("seg2.ts", b"222")
+        backend.put("seg3.ts", b"333")
+        
+        assert list(backend.files) == ["index.m3u8", "seg2.ts", "seg3.ts"]
+        assert backend.stats()["bytes"] == 10
+        assert backend.stats()["evicted"] == 1
+        with pytest.raises(ValueError):
+            backend.put("seg4.ts", bytes(11))
+    
+    def test_stream_wakes_blocked_reload_on_put(self, tmp_path):
+        """Test that a stream following its backend wakes a blocked playlist reload as soon as a write lands."""
+        backend = MemoryBackend()
+        backend.put("index.m3u8", PLAYLIST)
+        stream = Stream("", str(tmp_path), "index.m3u8", SegmentCache(), ManifestCache(poll_interval=10), backend=backend)
+        
+        async def scenario():
+            await stream.start_watcher("auto")
+            try:
+                waiting = asyncio.ensure_future(stream.manifests.wait_for(stream.manifest_path, 1, None, 5))
+                await asyncio.sleep(0.05)
+                backend.put("index.m3u8", PLAYLIST + b"#EXTINF:2.0,\nseg1.ts\n")
+                return await asyncio.wait_for(waiting, 1)
+            finally:
+                await stream.stop_watcher()
+        
+        manifest = asyncio.run(scenario())
+        
+        assert manifest.contains(1, None)
+        assert stream.warm() == 0
+        assert stream.stats()["storage"]["kind"] == "memory"
+    
+    def test_followed_playlist_served_from_memory(self, tmp_path):
+        """Test that a followed playlist is not fetched from the backend per request, only after a change."""
+        backend = MemoryBackend()
+        backend.put("index.m3u8", PLAYLIST)
+        stream = Stream("", str(tmp_path), "index.m3u8", SegmentCache(), ManifestCache(), backend=backend)
+        
+        async def scenario():
+            await stream.start_watcher("auto")
+            try:
+                await asyncio.sleep(0.05)
+                first = await stream.manifests.fetch(stream.manifest_path)
+                gets = backend.gets
+                for _ in range(10):
+                    await stream.manifests.fetch(stream.manifest_path)
+                unchanged = backend.gets - gets
+                backend.put("index.m3u8", PLAYLIST + b"#EXTINF:2.0,\nseg1.ts\n")
+                await asyncio.sleep(0.05)
+                return first, unchanged, await stream.manifests.fetch(stream.manifest_path)
+            finally:
+                await stream.stop_watcher()
+        
+        first, unchanged, second = asyncio.run(scenario())
+        
+        assert unchanged == 0
+        assert bytes(first.data) == PLAYLIST
+        assert second.contains(1, None)
+        assert stream.manifests.followed == set()
+
+
+def test_incomplete_backend_refused():
+    """Test that a backend missing part of the interface cannot be created."""
+    class GetOnly(StorageBackend):
+        async def get(self, name):
+            return None
+    
+    with pytest.raises(TypeError, match="watch"):
+        GetOnly()
+
+
+def test_create_backend_rejects_unknown_kind(tmp_path):
+    """Test that the factory names the kinds it knows and requires an origin for upstream."""
+    assert isinstance(create_backend("mmap", str(tmp_path)), MappedBackend)
+    with pytest.raises(ValueError, match="memory, mmap, upstream"):
+        create_backend("s3", str(tmp_path))
+    with pytest.raises(ValueError, match="HLS_ORIGIN"):
+        create_backend("upstream", str(tmp_path))
@@ -0,0 +1,82 @@
+"""Unit tests for the stream index."""
+
+import asyncio
+from clock import FrozenClock
+from manifest import ManifestCache
+from segment_cache import SegmentCache
+from streams import Stream, StreamIndex
+
+
+def make_index(root, clock):
+    default = Stream("", str(root), "stream.m3u8", SegmentCache(), ManifestCache())
+    return StreamIndex(default, cache_bytes=1024, clock=clock)
+
+
+class TestStreamIndex:
+    """Test cases for StreamIndex."""
+    
+    def test_scan_finds_stream_directories(self, tmp_path):
+        """Test that only subdirectories with valid names become streams."""
+        (tmp_path / "cam1").mkdir()
+        (tmp_path / "bad name").mkdir()
+        (tmp_path / "segment0.ts").write_bytes(b"x")
+        index = make_index(tmp_path, FrozenClock(1000))
+        
+        added = index.scan()
+        
+        assert [stream.name for stream in added] == ["cam1"]
+        stream = index.get("cam1")
+        assert stream.manifest_url == "/live/cam1/index.m3u8"
+        assert stream.segment_path("seg0") == str(tmp_path / "cam1" / "seg0.ts")
+        assert stream.segments is not index.default.segments
+        assert stream.segments.max_bytes == 1024
+    
+    def test_resolve_rescans_at_most_once_per_interval(self, tmp_path):
+        """Test that unknown names trigger a throttled rescan."""
+        clock = FrozenClock(1000)
+        index = make_index(tmp_path, clock)
+        
+        assert asyncio.run(index.resolve("cam1")) is None
+        (tmp_path / "cam1").mkdir()
+        assert asyncio.run(index.resolve("cam1")) is None
+        
+        clock.advance(1)
+        assert asyncio.run(index.resolve("cam1")).name == "cam1"
+        assert asyncio.run(index.resolve("../etc")) is None
+    
+    def test_streams_found_later_are_watched(self, tmp_path):
+        """Test that a stream added while watchers run gets its own watcher."""
+        clock = FrozenClock(1000)
+        index = make_index(tmp_path, clock)
+        
+        async def scenario():
+            await index.start_watchers("poll")
+            try:
+                (tmp_path / "cam2").mkdir()
+                (tmp_path / "cam2" / "index.m3u8").write_bytes(b"#EXTM3U\n")
+                stream = await index.resolve("cam2")
+                assert stream.watcher is not None
+                assert stream.manifests.peek(stream.manifest_path).data == b"#EXTM3U\n"
+            finally:
+                await index.stop_watchers()
+            assert stream.watcher is None
+            assert stream.segments.index is None
+        
+        asyncio.run(scenario())
+    
+    def test_warm_loads_listed_segments(self, tmp_path):
+        """Test that warming loads each playlist and the segments it lists."""
+        (tmp_path / "stream.m3u8").write_bytes(b"#EXTM3U\n#EXTINF:2.0,\nseg1.ts\n#EXTINF:2.0,\nmissing.ts\n")
+        (tmp_path / "seg1.ts").write_bytes(b"one")
+        (tmp_path / "old.ts").write_bytes(b"old")
+        (tmp_path / "cam1").mkdir()
+        (tmp_path / "cam1" / "index.m3u8").write_bytes(b"#EXTM3U\n#EXTINF:2.0,\nseg9.ts\n")
+        (tmp_path / "cam1" / "seg9.ts").write_bytes(b"nine")
+        index = make_index(tmp_path, FrozenClock(1000))
+        
+        assert index.warm() == 2
+        
+        assert str(tmp_path / "seg1.ts") in index.default.segments
+        assert str(tmp_path / "old.ts") not in index.default.segments
+        assert index.default.manifests.peek(index.default.manifest_path) is not None
+        assert str(tmp_path / "cam1" / "seg9.ts") in index.get("cam1").segments
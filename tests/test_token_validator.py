@@ -1,8 +1,13 @@
 """Unit tests for TokenValidator."""
 
+import base64
+import hashlib
+import hmac
+import json
+import os
 import time
 import pytest
-from token import TokenValidator
+from auth import SigningKeyFile, TokenValidator, VerifiedTokenCache
 
 
 class TestTokenValidator:
@@ -164,4 +169,206 @@ class TestTokenValidator:
         
         result = self.validator.validate_request(path, exp, sig)
         
-        assert result.is_valid is True
\ No newline at end of file
+        assert result.is_valid is True    
+    
+    def test_precomputed_state_matches_hmac(self):
+        """Test that the precomputed keyed state matches a fresh hmac.new."""
+        path = "/live/stream.m3u8"
+        exp = int(time.time()) + 3600
+        expected = hmac.new(self.secret.encode(), f"{path}{exp}".encode(), hashlib.sha256).digest()
+        
+        assert self.validator._compute_digest(path, exp) == expected
+        
+        long_key = TokenValidator("k" * 100)
+        expected = hmac.new(b"k" * 100, f"{path}{exp}".encode(), hashlib.sha256).digest()
+        assert long_key._compute_digest(path, exp) == expected
+    
+    def test_non_canonical_signature_rejection(self):
+        """Test that alternate encodings of the same digest are rejected."""
+        path = "/live/stream.m3u8"
+        exp = int(time.time()) + 3600
+        sig = self.validator._compute_signature(path, exp)
+        
+        # Setting the unused low bits of the last character decodes to the same bytes
+        alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+        variant = sig[:-1] + alphabet[alphabet.index(sig[-1]) | 1]
+        assert base64.urlsafe_b64decode(variant + "=") == base64.urlsafe_b64decode(sig + "=")
+        
+        result = self.validator.validate_request(path, exp, variant)
+        assert result.status_code == 403
+        assert self.validator.validate_request(path, exp, sig + "=").status_code == 403
+    
+    def test_validate_many_statuses(self):
+        """Test batch validation returns one status code per token in order."""
+        now = int(time.time())
+        valid = ("/live/segment001.ts", now + 3600)
+        expired = ("/live/segment002.ts", now - 3600)
+        tokens = [
+            (*valid, self.validator._compute_signature(*valid)),
+            (*expired, self.validator._compute_signature(*expired)),
+            ("/live/stream.m3u8", now + 3600, "invalid-signature"),
+        ]
+        
+        statuses = self.validator.validate_many(tokens)
+        
+        assert list(statuses) == [200, 410, 403]
+        # Valid tokens pre-warm the cache
+        assert self.validator.cache.stats()["size"] == 1
+    
+    def test_validate_many_parallel_arrays_with_pool(self):
+        """Test batch validation from parallel arrays fanned out to worker processes."""
+        exp = int(time.time()) + 3600
+        paths = [f"/live/segment{i:03d}.ts" for i in range(8)]
+        sigs = [self.validator._compute_signature(path, exp) for path in paths]
+        sigs[3] = sigs[4]
+        
+        statuses = self.validator.validate_many(
+            paths=paths, exps=[exp] * len(paths), sigs=sigs, processes=2, chunk_size=2
+        )
+        
+        assert list(statuses) == [200, 200, 200, 403, 200, 200, 200, 200]
+    
+    def test_validate_many_length_mismatch(self):
+        """Test that parallel arrays of different lengths are rejected."""
+        with pytest.raises(ValueError):
+            self.validator.validate_many(paths=["/live/stream.m3u8"], exps=[], sigs=[])
+    
+    def test_prefix_token_covers_paths_under_scope(self):
+        """Test that one prefix-scoped token authorizes every path under its prefix."""
+        validator = TokenValidator(self.secret, allow_prefix_tokens=True)
+        exp = int(time.time()) + 3600
+        sig = validator._compute_prefix_signature("/live/", exp)
+        
+        for path in ("/live/stream.m3u8", "/live/segment001.ts", "/LIVE/Segment002.ts"):
+            assert validator.validate_request(path, exp, sig, scope="/live/").is_valid is True
+        
+        # Verified once, then a single shared cache entry
+        assert validator.cache.stats() == {"hits": 2, "misses": 1, "size": 1, "max_entries": 4096}
+    
+    def test_prefix_token_rejections(self):
+        """Test prefix-scoped tokens outside their scope or when disabled."""
+        validator = TokenValidator(self.secret, allow_prefix_tokens=True)
+        exp = int(time.time()) + 3600
+        sig = validator._compute_prefix_signature("/live/", exp)
+        
+        assert validator.validate_request("/other/segment001.ts", exp, sig, scope="/live/").status_code == 403
+        assert validator.validate_request("/live/segment001.ts", exp, sig, scope="/live").status_code == 403
+        # A prefix signature is not an exact-path signature and vice versa
+        assert validator.validate_request("/live/", exp, sig).status_code == 403
+        path_sig = validator._compute_signature("/live/", exp)
+        assert validator.validate_request("/live/x.ts", exp, path_sig, scope="/live/").status_code == 403
+        
+        disabled = TokenValidator(self.secret)
+        assert disabled.validate_request("/live/segment001.ts", exp, sig, scope="/live/").status_code == 403
+    
+    def test_key_id_selects_signing_key(self):
+        """Test that kid picks the rotated key and unknown ids are rejected."""
+        validator = TokenValidator(self.secret, keys={"k1": "first", "k2": "second"})
+        path = "/live/stream.m3u8"
+        exp = int(time.time()) + 3600
+        sig = TokenValidator("second")._compute_signature(path, exp)
+        
+        assert validator.validate_request(path, exp, sig, kid="k2").is_valid is True
+        assert validator.validate_request(path, exp, sig, kid="k1").status_code == 403
+        assert validator.validate_request(path, exp, sig, kid="unknown").status_code == 403
+        assert validator.validate_request(path, exp, sig).status_code == 403
+    
+    def test_removed_key_stops_validating(self):
+        """Test that replacing the key table revokes cached tokens of removed keys."""
+        validator = TokenValidator(self.secret, keys={"k1": "first"})
+        path = "/live/stream.m3u8"
+        exp = int(time.time()) + 3600
+        sig = validator._compute_signature(path, exp, kid="k1")
+        assert validator.validate_request(path, exp, sig, kid="k1").is_valid is True
+        
+        validator.set_keys({"k2": "second"})
+        
+        assert validator.validate_request(path, exp, sig, kid="k1").status_code == 403
+    
+    def test_signing_key_file_hot_reload(self, tmp_path):
+        """Test that the key file is reloaded when it changes."""
+        key_file = tmp_path / "keys.json"
+        key_file.write_text(json.dumps({"k1": "first"}))
+        validator = TokenValidator(self.secret)
+        watcher = SigningKeyFile(str(key_file), check_interval=0)
+        
+        assert watcher.refresh(validator) is True
+        assert watcher.refresh(validator) is False
+        
+        key_file.write_text(json.dumps({"k1": "first", "k2": "second"}))
+        os.utime(key_file, ns=(0, time.time_ns() + 1_000_000_000))
+        assert watcher.refresh(validator) is True
+        
+        exp = int(time.time()) + 3600
+        sig = TokenValidator("second")._compute_signature("/live/stream.m3u8", exp)
+        assert validator.validate_request("/live/stream.m3u8", exp, sig, kid="k2").is_valid is True
+        
+        # A broken file keeps the previous keys
+        key_file.write_text("not json")
+        os.utime(key_file, ns=(0, time.time_ns() + 2_000_000_000))
+        assert watcher.refresh(validator) is False
+        assert validator.validate_request("/live/stream.m3u8", exp, sig, kid="k2").is_valid is True
+    
+    def test_missing_key_file_warns_once(self, tmp_path, caplog):
+        """Test that a missing key file is reported once and loaded when it appears."""
+        key_file = tmp_path / "keys.json"
+        validator = TokenValidator(self.secret)
+        watcher = SigningKeyFile(str(key_file), check_interval=0)
+        
+        with caplog.at_level("WARNING", logger="auth"):
+            assert watcher.refresh(validator) is False
+            assert watcher.refresh(validator) is False
+        assert len(caplog.records) == 1
+        
+        key_file.write_text(json.dumps({"k1": "first"}))
+        assert watcher.refresh(validator) is True
+
+
+class TestVerifiedTokenCache:
+    """Test cases for the verified-token cache."""
+    
+    def test_repeat_validation_hits_cache(self):
+        """Test that a repeated valid token is served from the cache."""
+        validator = TokenValidator("test-secret-key")
+        path = "/live/stream.m3u8"
+        exp = int(time.time()) + 3600
+        sig = validator._compute_signature(path, exp)
+        
+        assert validator.validate_request(path, exp, sig).is_valid is True
+        assert validator.validate_request(path, exp, sig).is_valid is True
+        
+        stats = validator.cache.stats()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+        assert stats["size"] == 1
+    
+    def test_invalid_signature_not_cached(self):
+        """Test that forged tokens never enter the cache."""
+        validator = TokenValidator("test-secret-key")
+        exp = int(time.time()) + 3600
+        
+        validator.validate_request("/live/stream.m3u8", exp, "invalid-signature")
+        
+        assert len(validator.cache) == 0
+    
+    def test_entries_expire_at_exp(self):
+        """Test that the timing wheel drops entries once their second passes."""
+        cache = VerifiedTokenCache(max_entries=10, wheel_slots=8)
+        cache.add(("a", 105, "s"), 105, now=100)
+        cache.add(("b", 200, "s"), 200, now=100)
+        
+        assert cache.contains(("a", 105, "s"), now=105) is True
+        assert cache.contains(("a", 105, "s"), now=106) is False
+        # Same wheel slot as 105 but a later revolution
+        assert cache.contains(("b", 200, "s"), now=106) is True
+        assert len(cache) == 1
+    
+    def test_size_cap_evicts_oldest(self):
+        """Test that the cache never grows past max_entries."""
+        cache = VerifiedTokenCache(max_entries=2)
+        for i in range(3):
+            cache.add((f"/live/{i}.ts", 1000, "s"), 1000, now=100)
+        
+        assert len(cache) == 2
+        assert cache.contains(("/live/0.ts", 1000, "s"), now=100) is False
+        assert cache.contains(("/live/2.ts", 1000, "s"), now=100) is True
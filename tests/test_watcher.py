@@ -0,0 +1,167 @@
+"""Unit tests for HLSWatcher."""
+
+import asyncio
+import os
+import pytest
+from watcher import HLSWatcher
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    """Poll a condition on the event loop until it holds or the timeout passes."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.parametrize("mode", ["inotify", "poll"])
+class TestHLSWatcher:
+    """Test cases for the directory watcher in both modes."""
+    
+    def test_loads_finished_files_and_drops_deleted(self, tmp_path, mode):
+        """Test startup indexing, load-on-close and removal of watched files."""
+        (tmp_path / "segment0.ts").write_bytes(b"existing")
+        (tmp_path / "stream.m3u8").write_bytes(b"#EXTM3U\n")
+        published = {}
+        deleted = []
+        
+        async def scenario():
+            watcher = HLSWatcher(
+                str(tmp_path),
+                on_update=lambda path, data, version: published.__setitem__(path, data),
+                on_delete=deleted.append,
+                mode=mode,
+                poll_interval=0.02,
+            )
+            await watcher.start()
+            try:
+                # Existing manifests are read, existing segments only recorded
+                assert published == {str(tmp_path / "stream.m3u8"): b"#EXTM3U\n"}
+                assert str(tmp_path / "segment0.ts") in watcher.files
+                
+                (tmp_path / "segment1.ts").write_bytes(b"new segment")
+                await wait_for(lambda: str(tmp_path / "segment1.ts") in published)
+                assert published[str(tmp_path / "segment1.ts")] == b"new segment"
+                
+                os.unlink(tmp_path / "segment0.ts")
+                await wait_for(lambda: deleted)
+                assert deleted == [str(tmp_path / "segment0.ts")]
+                assert str(tmp_path / "segment0.ts") not in watcher.files
+            finally:
+                await watcher.stop()
+        
+        asyncio.run(scenario())
+    
+    def test_manifest_replaced_by_rename(self, tmp_path, mode):
+        """Test that a manifest swapped in by rename is published whole."""
+        published = {}
+        
+        async def scenario():
+            watcher = HLSWatcher(
+                str(tmp_path),
+                on_update=lambda path, data, version: published.__setitem__(path, data),
+                on_delete=published.pop,
+                mode=mode,
+                poll_interval=0.02,
+            )
+            await watcher.start()
+            try:
+                (tmp_path / "stream.m3u8.tmp").write_bytes(b"#EXTM3U\n")
+                os.rename(tmp_path / "stream.m3u8.tmp", tmp_path / "stream.m3u8")
+                await wait_for(lambda: str(tmp_path / "stream.m3u8") in published)
+                assert published == {str(tmp_path / "stream.m3u8"): b"#EXTM3U\n"}
+            finally:
+                await watcher.stop()
+        
+        asyncio.run(scenario())
+
+
+def test_half_written_file_not_published(tmp_path):
+    """Test that with inotify a file still open for writing is not loaded until closed."""
+    published = {}
+    
+    async def scenario():
+        watcher = HLSWatcher(
+            str(tmp_path),
+            on_update=lambda path, data, version: published.__setitem__(path, data),
+            on_delete=published.pop,
+            mode="inotify",
+        )
+        await watcher.start()
+        try:
+            with open(tmp_path / "segment2.ts", "wb") as f:
+                f.write(b"first half")
+                f.flush()
+                await asyncio.sleep(0.1)
+                assert str(tmp_path / "segment2.ts") not in published
+                f.write(b", second half")
+            await wait_for(lambda: str(tmp_path / "segment2.ts") in published)
+            assert published[str(tmp_path / "segment2.ts")] == b"first half, second half"
+        finally:
+            await watcher.stop()
+    
+    asyncio.run(scenario())
+
+
+def test_growing_segment_appends_published(tmp_path):
+    """Test that with on_append, bytes of an open segment are passed on as they are written."""
+    appended = []
+    published = {}
+    
+    async def scenario():
+        watcher = HLSWatcher(
+            str(tmp_path),
+            on_update=lambda path, data, version: published.__setitem__(path, data),
+            on_delete=published.pop,
+            mode="inotify",
+            on_append=lambda path, data: appended.append((path, data)),
+        )
+        await watcher.start()
+        try:
+            with open(tmp_path / "segment3.ts", "wb") as f:
+                f.write(b"first half")
+                f.flush()
+                await wait_for(lambda: appended)
+                f.write(b", second half")
+                f.flush()
+                await wait_for(lambda: sum(len(data) for _, data in appended) == 23)
+                assert str(tmp_path / "segment3.ts") not in published
+            await wait_for(lambda: str(tmp_path / "segment3.ts") in published)
+        finally:
+            await watcher.stop()
+    
+    asyncio.run(scenario())
+    assert {path for path, _ in appended} == {str(tmp_path / "segment3.ts")}
+    assert b"".join(data for _, data in appended) == b"first half, second half"
+
+
+def test_skipped_files_statted_not_read(tmp_path):
+    """Test that files skip_read matches are neither followed nor read."""
+    appended = []
+    published = {}
+    media = str(tmp_path / "media.ts")
+    
+    async def scenario():
+        watcher = HLSWatcher(
+            str(tmp_path),
+            on_update=lambda path, data, version: published.__setitem__(path, (data, version)),
+            on_delete=published.pop,
+            mode="inotify",
+            on_append=lambda path, data: appended.append(path),
+            skip_read=lambda path: path == media,
+        )
+        await watcher.start()
+        try:
+            with open(media, "wb") as f:
+                f.write(b"appended bytes")
+            (tmp_path / "segment4.ts").write_bytes(b"segment")
+            await wait_for(lambda: media in published and str(tmp_path / "segment4.ts") in published)
+        finally:
+            await watcher.stop()
+    
+    asyncio.run(scenario())
+    assert appended == []
+    data, version = published[media]
+    assert data is None
+    assert version[2] == len(b"appended bytes")
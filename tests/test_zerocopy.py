@@ -0,0 +1,84 @@
+"""Tests for sending files with the zero-copy send extension."""
+
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+import pytest
+import uvicorn
+
+from prefork import bind_socket
+from responses import SendfileResponse, segment_headers
+from zerocopy import ZeroCopyHttpToolsProtocol, check_uvicorn_version
+
+
+@contextmanager
+def serve(app):
+    """Run an ASGI app with the zero-copy protocol and yield its base URL."""
+    sock = bind_socket("127.0.0.1", 0)
+    config = uvicorn.Config(app, http=ZeroCopyHttpToolsProtocol, loop="asyncio", ws="none", lifespan="off", log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]})
+    thread.start()
+    try:
+        deadline = time.time() + 5
+        while not server.started and time.time() < deadline:
+            time.sleep(0.01)
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    finally:
+        server.should_exit = True
+        thread.join(5)
+        sock.close()
+
+
+class TestZeroCopy:
+    """Test cases for SendfileResponse served by ZeroCopyHttpToolsProtocol."""
+    
+    def test_file_sent_with_sendfile(self, tmp_path):
+        """Test that a file is handed to the server and arrives intact."""
+        path = tmp_path / "big.ts"
+        data = bytes(range(256)) * 4096
+        path.write_bytes(data)
+        sends = []
+        
+        async def app(scope, receive, send):
+            if scope["type"] != "http":
+                return
+            response = SendfileResponse(str(path), len(data), segment_headers(len(data), 0), on_send=sends.append)
+            await response(scope, receive, send)
+        
+        with serve(app) as url:
+            for _ in range(2):
+                with urllib.request.urlopen(f"{url}/big.ts") as response:
+                    assert response.headers["content-length"] == str(len(data))
+                    assert response.read() == data
+        
+        assert sends == [True, True]
+    
+    def test_ranges_sent_with_sendfile(self, tmp_path):
+        """Test that each range of a multipart response is sent from its offset."""
+        path = tmp_path / "big.ts"
+        data = bytes(range(256)) * 16
+        path.write_bytes(data)
+        
+        async def app(scope, receive, send):
+            if scope["type"] != "http":
+                return
+            response = SendfileResponse(str(path), len(data), segment_headers(len(data), 0), ranges=[(1, 3), (300, 302)])
+            await response(scope, receive, send)
+        
+        with serve(app) as url:
+            with urllib.request.urlopen(f"{url}/big.ts") as response:
+                body = response.read()
+                assert response.status == 206
+                assert response.headers["content-length"] == str(len(body))
+        
+        assert b"bytes 1-2/4096\r\n\r\n\x01\x02\r\n" in body
+        assert b"bytes 300-301/4096\r\n\r\n\x2c\x2d\r\n" in body
+    
+    def test_other_uvicorn_versions_refused(self):
+        """Test that the protocol will not load on a uvicorn release whose internals it was not written for."""
+        check_uvicorn_version(uvicorn.__version__)
+        with pytest.raises(ImportError, match="0.24.0"):
+            check_uvicorn_version("0.30.0")
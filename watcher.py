@@ -0,0 +1,331 @@
+"""Background watcher that keeps HLS_ROOT's finished files in memory."""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from anyio import to_thread
+
+from segment_cache import FileVersion, file_version
+
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Only finished media files are tracked; packager temp files are ignored
+WATCHED_SUFFIXES = (".ts", ".m3u8")
+_WATCHED_SUFFIXES_BYTES = tuple(suffix.encode() for suffix in WATCHED_SUFFIXES)
+
+# Files read at startup; other files already present are only recorded
+PRELOAD_SUFFIXES = (".m3u8",)
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    """Return libc if it provides inotify, else None."""
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+def _read_file(path: str) -> Tuple[bytes, FileVersion]:
+    with open(path, 'rb') as f:
+        version = file_version(os.fstat(f.fileno()))
+        return f.read(), version
+
+
+def _read_tail(path: str, offset: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read()
+
+
+class HLSWatcher:
+    """Watches an HLS directory and loads files once the packager finishes them.
+    
+    With Linux inotify a file is loaded on ``IN_CLOSE_WRITE`` or
+    ``IN_MOVED_TO`` and dropped on ``IN_DELETE`` or ``IN_MOVED_FROM``. Without
+    inotify the directory is polled and a file is loaded once its (inode,
+    mtime_ns, size) is the same on two consecutive scans. ``files`` lists only
+    finished files; with inotify that guarantees a half-written segment is
+    never served, while polling relies on the packager not stalling
+    mid-write for longer than ``poll_interval``.
+    
+    Files already in the directory at startup are recorded in ``files``
+    without being read, except for those ending in ``preload_suffixes``
+    (the manifests), so startup does not read a backlog of old segments.
+    
+    With inotify and an ``on_append`` callback, segments still being written
+    are also followed: each ``IN_MODIFY`` reads the bytes appended since the
+    last one and hands them to ``on_append`` until the file is closed.
+    
+    Files ``skip_read`` matches (large media files served memory-mapped) are
+    neither read nor followed: they are only statted, and ``on_update`` gets
+    None instead of their bytes.
+    """
+    
+    def __init__(
+        self,
+        root: str,
+        on_update: Callable[[str, Optional[bytes], FileVersion], None],
+        on_delete: Callable[[str], None],
+        mode: str = "auto",
+        poll_interval: float = 0.5,
+        on_append: Optional[Callable[[str, bytes], None]] = None,
+        preload_suffixes: Tuple[str, ...] = PRELOAD_SUFFIXES,
+        skip_read: Optional[Callable[[str], bool]] = None,
+    ):
+        """Initialize the watcher.
+        
+        Args:
+            root: Directory to watch
+            on_update: Called on the event loop with (path, data, version) for
+                each finished file (data is None for files skip_read matches)
+            on_delete: Called on the event loop with the path of a removed file
+            mode: "inotify", "poll" or "auto" (inotify when available)
+            poll_interval: Seconds between directory scans in polling mode
+            on_append: Called on the event loop with (path, data) for bytes
+                appended to a segment that is still open for writing
+            preload_suffixes: Suffixes of the files that are read and passed
+                to on_update at startup
+            skip_read: Called with a path; files it returns True for are
+                statted instead of read
+        """
+        self.root = root
+        self.on_update = on_update
+        self.on_delete = on_delete
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.on_append = on_append
+        self.preload_suffixes = preload_suffixes
+        self.skip_read = skip_read
+        # Finished files currently in the directory, by absolute path
+        self.files: Dict[str, FileVersion] = {}
+        # Token of the newest load per path; older loads and loads of
+        # since-deleted files find a different token and are dropped
+        self._latest: Dict[str, object] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._fd: Optional[int] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._pending: Dict[str, FileVersion] = {}
+        # Bytes already passed to on_append for each segment being written
+        self._offsets: Dict[str, int] = {}
+        self._tailing: Set[str] = set()
+        # Segments with IN_MODIFY events newer than their reader's last read
+        self._modified: Set[str] = set()
+    
+    @property
+    def running(self) -> bool:
+        return self._fd is not None or self._poller is not None
+    
+    async def start(self) -> None:
+        """Load the directory's current files and start watching for changes."""
+        loop = asyncio.get_running_loop()
+        libc = _load_libc() if self.mode in ("auto", "inotify") else None
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            mask = WATCH_MASK | (IN_MODIFY if self.on_append is not None else 0)
+            if fd < 0 or libc.inotify_add_watch(fd, os.fsencode(self.root), mask) < 0:
+                err = ctypes.get_errno()
+                if fd >= 0:
+                    os.close(fd)
+                logger.warning("inotify unavailable for %s (%s), polling instead", self.root, os.strerror(err))
+            else:
+                self._fd = fd
+                loop.add_reader(fd, self._read_events)
+        elif self.mode == "inotify":
+            logger.warning("inotify not supported on this platform, polling %s instead", self.root)
+        
+        # Files present before the watch was set up are treated as finished;
+        # only manifests are read now, segments on their first request
+        preload = []
+        for path, version in self._scan().items():
+            if path.endswith(self.preload_suffixes):
+                preload.append(path)
+            else:
+                self.files[path] = version
+        await asyncio.gather(*(self._load(path) for path in preload))
+        
+        if self._fd is None:
+            self._poller = loop.create_task(self._poll())
+    
+    async def stop(self) -> None:
+        """Stop watching and cancel outstanding loads."""
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        tasks = list(self._tasks)
+        if self._poller is not None:
+            tasks.append(self._poller)
+            self._poller = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _scan(self) -> Dict[str, FileVersion]:
+        """Return the versions of all watched files in the directory."""
+        found = {}
+        try:
+            entries = os.scandir(self.root)
+        except OSError as e:
+            logger.warning("Cannot scan HLS directory %s: %s", self.root, e)
+            return found
+        with entries:
+            for entry in entries:
+                if entry.name.endswith(WATCHED_SUFFIXES) and entry.is_file():
+                    try:
+                        found[entry.path] = file_version(entry.stat())
+                    except OSError:
+                        continue
+        return found
+    
+    def _read_events(self) -> None:
+        """Drain the inotify fd and dispatch each event."""
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buf):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b"\0")
+            offset += length
+            
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflow on %s, rescanning", self.root)
+                self._spawn(self._resync())
+                continue
+            if mask & IN_DELETE_SELF:
+                logger.warning("HLS directory %s was removed", self.root)
+                continue
+            if mask & IN_ISDIR or not name.endswith(_WATCHED_SUFFIXES_BYTES):
+                continue
+            
+            path = os.path.join(self.root, os.fsdecode(name))
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._remove(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._offsets.pop(path, None)
+                self._spawn(self._load(path))
+            elif mask & IN_MODIFY and name.endswith(b".ts") and not self._skips(path):
+                self._grow(path)
+    
+    async def _poll(self) -> None:
+        """Polling fallback: load files whose version is stable across two scans."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = self._scan()
+            for path in list(self.files):
+                if path not in current:
+                    self._remove(path)
+            pending = {}
+            for path, version in current.items():
+                if self.files.get(path) == version:
+                    continue
+                if self._pending.get(path) == version:
+                    self._spawn(self._load(path))
+                else:
+                    pending[path] = version
+            self._pending = pending
+    
+    async def _resync(self) -> None:
+        """Reconcile with the directory after missed inotify events."""
+        current = self._scan()
+        for path in list(self.files):
+            if path not in current:
+                self._remove(path)
+        await asyncio.gather(*(
+            self._load(path) for path, version in current.items() if self.files.get(path) != version
+        ))
+    
+    async def _load(self, path: str) -> None:
+        """Read a finished file and publish it, unless a newer event superseded it."""
+        token = self._latest[path] = object()
+        data = version = None
+        try:
+            if self._skips(path):
+                version = file_version(await to_thread.run_sync(os.stat, path))
+            else:
+                data, version = await to_thread.run_sync(_read_file, path)
+        except OSError:
+            pass
+        if self._latest.get(path) is not token:
+            return
+        del self._latest[path]
+        if version is None:
+            return
+        self.files[path] = version
+        self.on_update(path, data, version)
+    
+    def _grow(self, path: str) -> None:
+        """Follow a segment that is being written, one reader per file."""
+        self._offsets.setdefault(path, 0)
+        self._modified.add(path)
+        if path not in self._tailing:
+            self._tailing.add(path)
+            self._spawn(self._tail(path))
+    
+    async def _tail(self, path: str) -> None:
+        """Pass newly appended bytes to on_append until nothing new is left."""
+        try:
+            while True:
+                offset = self._offsets.get(path)
+                if offset is None:
+                    return
+                self._modified.discard(path)
+                try:
+                    data = await to_thread.run_sync(_read_tail, path, offset)
+                except OSError:
+                    return
+                # Closed, renamed or removed while reading: the full load takes over
+                if self._offsets.get(path) != offset:
+                    return
+                if data:
+                    self._offsets[path] = offset + len(data)
+                    self.on_append(path, data)
+                elif path not in self._modified:
+                    return
+        finally:
+            self._tailing.discard(path)
+            self._modified.discard(path)
+    
+    def _skips(self, path: str) -> bool:
+        return self.skip_read is not None and self.skip_read(path)
+    
+    def _remove(self, path: str) -> None:
+        self._offsets.pop(path, None)
+        self._latest.pop(path, None)
+        if self.files.pop(path, None) is not None:
+            self.on_delete(path)
+    
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
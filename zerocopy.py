@@ -0,0 +1,80 @@
+"""uvicorn HTTP protocol that adds the ASGI zero-copy send extension."""
+
+import asyncio
+
+import uvicorn
+from uvicorn.protocols.http.httptools_impl import HttpToolsProtocol
+
+from responses import ZEROCOPY_SEND
+
+
+# The protocol wraps RequestResponseCycle internals (send, flow, transport,
+# expected_content_length) that are private to this uvicorn release
+UVICORN_VERSION = "0.24.0"
+
+
+def check_uvicorn_version(version: str) -> None:
+    """Refuse to run the protocol on a uvicorn release it was not written for.
+    
+    Args:
+        version: Installed uvicorn version
+    
+    Raises:
+        ImportError: If the version is not UVICORN_VERSION
+    """
+    if version != UVICORN_VERSION:
+        raise ImportError(f"zero-copy protocol needs uvicorn {UVICORN_VERSION}, found {version}")
+
+
+check_uvicorn_version(uvicorn.__version__)
+
+
+class ZeroCopyHttpToolsProtocol(HttpToolsProtocol):
+    """httptools protocol whose requests may send files with ``sendfile()``.
+    
+    uvicorn does not implement ``http.response.zerocopysend`` itself. This
+    protocol offers it in every request scope and answers the message with
+    ``loop.sendfile()``, which uses ``os.sendfile()`` on plain TCP
+    transports and falls back to reading the file on others (TLS). The
+    extension is only offered on asyncio's own event loop, since uvloop
+    does not implement ``loop.sendfile()``.
+    """
+    
+    def on_message_begin(self) -> None:
+        super().on_message_begin()
+        if isinstance(self.loop, asyncio.BaseEventLoop):
+            self.scope["extensions"] = {ZEROCOPY_SEND: {}}
+    
+    def on_headers_complete(self) -> None:
+        previous = self.cycle
+        super().on_headers_complete()
+        cycle = self.cycle
+        if cycle is previous or ZEROCOPY_SEND not in self.scope.get("extensions", {}):
+            return
+        send = cycle.send
+        loop = self.loop
+        
+        async def send_with_zerocopy(message) -> None:
+            if message["type"] != ZEROCOPY_SEND:
+                await send(message)
+                return
+            if cycle.disconnected:
+                return
+            if not cycle.response_started or cycle.response_complete or cycle.chunked_encoding:
+                raise RuntimeError("zerocopysend needs a started response with a content-length")
+            if cycle.flow.write_paused:
+                await cycle.flow.drain()
+            count = message.get("count")
+            if cycle.scope["method"] != "HEAD" and count != 0:
+                if count is None or count > cycle.expected_content_length:
+                    raise RuntimeError("Response content longer than Content-Length")
+                try:
+                    sent = await loop.sendfile(cycle.transport, message["file"], message.get("offset") or 0, count)
+                except ConnectionError:
+                    # Client went away; connection_lost marks the cycle disconnected
+                    return
+                cycle.expected_content_length -= sent
+            # Lets uvicorn check the length and finish the response as for a body message
+            await send({"type": "http.response.body", "body": b"", "more_body": message.get("more_body", False)})
+        
+        cycle.send = send_with_zerocopy